@@ -1,5 +1,6 @@
 import os
 from io import BytesIO
+from typing import Callable, Dict, Optional
 
 from PyPDF2 import PdfReader, PdfWriter
 from reportlab.pdfgen import canvas
@@ -8,6 +9,9 @@ from reportlab.lib.utils import ImageReader
 from PIL import Image
 import json
 
+# Merge implementation: "pypdf2" (default) or "pikepdf" (native, pip install pikepdf)
+PDF_MERGE_BACKEND = os.environ.get("PDF_MERGE_BACKEND", "pypdf2").strip().lower()
+
 # ---------- helpers ----------
 
 def image_to_png_bytes_with_transparency(path: str, bg_threshold: int = 245) -> BytesIO:
@@ -40,6 +44,45 @@ def load_layout(path: str) -> dict:
         return json.load(f)
 
 
+# ---------- merge backends: template bytes + overlay bytes -> PDF bytes ----------
+
+def merge_overlay_pypdf2(template_pdf_bytes: bytes, overlay_pdf_bytes: bytes) -> bytes:
+    base_page = PdfReader(BytesIO(template_pdf_bytes)).pages[0]
+    base_page.merge_page(PdfReader(BytesIO(overlay_pdf_bytes)).pages[0])
+
+    writer = PdfWriter()
+    writer.add_page(base_page)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def merge_overlay_pikepdf(template_pdf_bytes: bytes, overlay_pdf_bytes: bytes) -> bytes:
+    # El overlay se coloca sobre su propio mediabox: sin escalar ni centrar (igual que merge_page)
+    import pikepdf
+
+    with pikepdf.open(BytesIO(template_pdf_bytes)) as base, pikepdf.open(BytesIO(overlay_pdf_bytes)) as overlay:
+        del base.pages[1:]
+        overlay_page = overlay.pages[0]
+        base.pages[0].add_overlay(overlay_page, pikepdf.Rectangle(*overlay_page.mediabox))
+        out = BytesIO()
+        base.save(out)
+        return out.getvalue()
+
+
+MERGE_BACKENDS: Dict[str, Callable[[bytes, bytes], bytes]] = {
+    "pypdf2": merge_overlay_pypdf2,
+    "pikepdf": merge_overlay_pikepdf,
+}
+
+
+def get_merge_backend(name: Optional[str] = None) -> Callable[[bytes, bytes], bytes]:
+    key = (name or PDF_MERGE_BACKEND).strip().lower()
+    if key not in MERGE_BACKENDS:
+        raise ValueError(f"Backend de merge desconocido {key!r} (opciones: {sorted(MERGE_BACKENDS)})")
+    return MERGE_BACKENDS[key]
+
+
 # ---------- main logic: put Firma.png on the template ----------
 
 def poner_firma_en_template(template_pdf: str,
@@ -51,8 +94,9 @@ def poner_firma_en_template(template_pdf: str,
     layout = load_layout(layout_path)
 
     # 2. Leer el PDF base
-    pdf_reader = PdfReader(template_pdf)
-    base_page = pdf_reader.pages[0]
+    with open(template_pdf, "rb") as f:
+        template_bytes = f.read()
+    base_page = PdfReader(BytesIO(template_bytes)).pages[0]
     page_width = float(base_page.mediabox.width)
     page_height = float(base_page.mediabox.height)
 
@@ -120,19 +164,13 @@ def poner_firma_en_template(template_pdf: str,
 
     # cerramos el PDF temporal
     c.save()
-    buffer.seek(0)
 
     # 4. Mezclar la página de firmas con la página base
-    overlay_reader = PdfReader(buffer)
-    overlay_page = overlay_reader.pages[0]
-    base_page.merge_page(overlay_page)
+    merged = get_merge_backend()(template_bytes, buffer.getvalue())
 
     # 5. Guardar resultado
-    writer = PdfWriter()
-    writer.add_page(base_page)
-
     with open(output_pdf, "wb") as f:
-        writer.write(f)
+        f.write(merged)
 
     print(f"PDF generado: {output_pdf}")
 
@@ -19,6 +19,7 @@ type DbDiplomaBatch = {
   status: DbBatchStatus;
   totalRecords: number;
   zipUrl?: string | null;
+  errorMessage?: string | null;
   createdBy?: string | null;
   createdAt?: string | Date | null;
   updatedAt?: string | Date | null;
@@ -238,9 +239,15 @@ export default function GeneratePage() {
                               : "secondary"
                         }
                         className={batch.status === "completed" ? "bg-emerald-600 hover:bg-emerald-700" : ""}
+                        title={batch.status !== "completed" ? batch.errorMessage ?? undefined : undefined}
                       >
                         {batch.status}
                       </Badge>
+                      {batch.errorMessage && batch.status !== "completed" && (
+                        <div className="text-xs text-destructive mt-1 max-w-xs truncate" title={batch.errorMessage}>
+                          {batch.errorMessage}
+                        </div>
+                      )}
                     </TableCell>
 
                     <TableCell className="text-right pr-6">
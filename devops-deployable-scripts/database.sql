@@ -184,9 +184,13 @@ CREATE TABLE schema_pohualizcalli.diploma_batches (
 	created_at timestamp DEFAULT now() NULL,
 	updated_at timestamp DEFAULT now() NULL,
 	csv_url varchar NULL,
+	error_message text NULL,
 	CONSTRAINT diploma_batches_pkey PRIMARY KEY (id)
 );
 
+-- migration for databases created before error_message (pre-flight rejections, set by the diploma Lambda)
+ALTER TABLE schema_pohualizcalli.diploma_batches ADD COLUMN IF NOT EXISTS error_message text NULL;
+
 
 -- schema_pohualizcalli.diploma_batches foreign keys
 
@@ -0,0 +1,148 @@
+"""
+Shared fixtures for the offline benchmarks.
+
+Everything comes from the repo (resources-diplomas/): the empty template,
+layout.json and the signatures in firmas/. Nothing talks to AWS or the admin API.
+"""
+import csv
+import json
+import os
+import random
+import sys
+from io import StringIO
+from typing import Dict, List, Sequence
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.abspath(os.path.join(HERE, ".."))
+REPO_ROOT = os.path.abspath(os.path.join(LAMBDA_DIR, "..", ".."))
+RESOURCES_DIR = os.path.join(REPO_ROOT, "resources-diplomas")
+
+TEMPLATE_PATH = os.path.join(RESOURCES_DIR, "empty-template", "constancia_vacio.pdf")
+LAYOUT_PATH = os.path.join(RESOURCES_DIR, "layout.json")
+FIRMAS_DIR = os.path.join(RESOURCES_DIR, "firmas")
+
+# handler.py validates these at import time; the benchmarks never talk to AWS
+os.environ.setdefault("MY-API-KEY", "benchmark")
+os.environ.setdefault("RESOURCES_BUCKET", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("EMIT_EMF_METRICS", "false")
+sys.path.insert(0, LAMBDA_DIR)
+
+import handler  # noqa: E402
+
+NOMBRES = ["Juan", "Ana", "Carlos", "María José", "Ángel", "Sofía", "Luis", "Fernanda", "Iñaki", "Renée"]
+APELLIDOS = ["Pérez", "Gómez", "López", "Hernández", "Núñez", "García", "Martínez", "Ruiz", "Aguillón", "Obregón"]
+CURSOS = [
+    "Curso de Python",
+    "Taller de Matemáticas",
+    "Taller de Machine Learning",
+    "Dibujo Artístico I",
+    "Danza Folklórica",
+]
+PROFESORES = ["Oscar Pimentel", "Mauricio Sanchez", "oscar_pimentel.gif", "mauricio_sanchez.gif"]
+
+
+def load_template() -> bytes:
+    with open(TEMPLATE_PATH, "rb") as f:
+        return f.read()
+
+
+def load_layout() -> dict:
+    with open(LAYOUT_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def firma_paths() -> List[str]:
+    return sorted(
+        os.path.join(FIRMAS_DIR, name)
+        for name in os.listdir(FIRMAS_DIR)
+        if handler.looks_like_image_filename(name)
+    )
+
+
+def install_signatures() -> Dict[str, str]:
+    """
+    Seeds handler's signature maps and byte cache from firmas/ so
+    resolve_signature_url / get_signature_bytes work offline.
+    Returns {file name: url}.
+    """
+    by_name: Dict[str, str] = {}
+    by_file: Dict[str, str] = {}
+    urls: Dict[str, str] = {}
+    for path in firma_paths():
+        filename = os.path.basename(path)
+        url = "file://" + path
+        with open(path, "rb") as f:
+            handler._SIGNATURE_BYTES_CACHE[url] = f.read()
+        professor = os.path.splitext(filename)[0].replace("_", " ")
+        by_name[handler.normalize_key(professor)] = url
+        by_file[handler.normalize_filename(filename)] = url
+        urls[filename] = url
+    handler._SIGNATURES_BY_NAME = by_name
+    handler._SIGNATURES_BY_FILE = by_file
+    return urls
+
+
+def _fecha(rng: random.Random) -> str:
+    year = rng.randint(2023, 2026)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    style = rng.randrange(5)
+    if style == 0:
+        return f"{year}-{month}-{day}"
+    if style == 1:
+        return f"{year}/{month:02d}/{day:02d}"
+    if style == 2:
+        return f"{day:02d}-{month:02d}-{year}"
+    if style == 3:
+        return f"{day}/{month}/{year}"
+    return f"{handler._MESES[month - 1].capitalize()} de {year}"
+
+
+def synthetic_rows(n: int, seed: int = 1234) -> List[Dict[str, str]]:
+    """
+    Deterministic rows shaped like real uploads: few distinct cursos / profesores /
+    fechas, mostly distinct names, accents included.
+    """
+    rng = random.Random(seed)
+    fechas = [_fecha(rng) for _ in range(24)]
+    rows = []
+    for _ in range(n):
+        nombre = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}"
+        rows.append({
+            "nombre": nombre,
+            "curso": rng.choice(CURSOS),
+            "fecha": rng.choice(fechas),
+            "profesor": rng.choice(PROFESORES),
+        })
+    return rows
+
+
+def synthetic_csv(n: int, seed: int = 1234) -> bytes:
+    out = StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(handler.REQUIRED_CSV_COLUMNS))
+    writer.writeheader()
+    writer.writerows(synthetic_rows(n, seed))
+    return out.getvalue().encode("utf-8")
+
+
+def percentiles(samples_ns: Sequence[int]) -> Dict[str, float]:
+    """
+    Latency summary in microseconds (nearest-rank percentiles).
+    """
+    if not samples_ns:
+        return {}
+    ordered = sorted(samples_ns)
+
+    def pct(p: float) -> float:
+        idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))
+        return round(ordered[idx] / 1000.0, 2)
+
+    return {
+        "n": len(ordered),
+        "p50Us": pct(50),
+        "p90Us": pct(90),
+        "p99Us": pct(99),
+        "maxUs": round(ordered[-1] / 1000.0, 2),
+        "meanUs": round(sum(ordered) / len(ordered) / 1000.0, 2),
+    }
@@ -0,0 +1,161 @@
+"""
+Cold-start benchmark for handler.py. Fully offline.
+
+Every sample is a fresh interpreter (a new "container"):
+  import_ms        wall time of `import handler`
+  first_render_ms  first generate_one_pdf_bytes after import (pays for any deferred imports)
+  cold_total_ms    import_ms + first_render_ms
+
+plus a `python -X importtime` breakdown of the modules that dominate the import.
+
+    cd lambda/diploma_generator
+    python benchmarks/bench_cold_start.py --runs 7 --json before.json
+    python benchmarks/bench_cold_start.py --runs 7 --json after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.abspath(os.path.join(HERE, ".."))
+
+CHILD_ENV = {
+    "MY-API-KEY": "benchmark",
+    "RESOURCES_BUCKET": "benchmark",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "EMIT_EMF_METRICS": "false",
+}
+
+# Runs in the fresh interpreter; prints one JSON line.
+CHILD_CODE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import handler
+t1 = time.perf_counter()
+sys.path.insert(0, {here!r})
+from _common import install_signatures, load_layout, load_template, PROFESORES
+template, layout = load_template(), load_layout()
+install_signatures()
+sig_url = handler.resolve_signature_url(PROFESORES[0])
+t2 = time.perf_counter()
+handler.generate_one_pdf_bytes(template, layout, "Ana Pérez", "Curso de Python", "2025-12-10", PROFESORES[0], sig_url)
+t3 = time.perf_counter()
+print(json.dumps({{"import_ms": (t1 - t0) * 1000, "first_render_ms": (t3 - t2) * 1000,
+                  "modules": len(sys.modules)}}))
+"""
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    for k, v in CHILD_ENV.items():
+        env.setdefault(k, v)
+    return env
+
+
+def sample_once() -> Dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE.format(here=HERE)],
+        cwd=LAMBDA_DIR, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    data = json.loads(out.stdout.strip().splitlines()[-1])
+    data["cold_total_ms"] = data["import_ms"] + data["first_render_ms"]
+    return data
+
+
+def import_breakdown(top: int) -> Dict[str, object]:
+    """
+    `python -X importtime -c "import handler"`: cumulative microseconds for the
+    top-level imports made by handler.py, largest first.
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import handler"],
+        cwd=LAMBDA_DIR, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    lines = []
+    for line in out.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            lines.append((m.group(4), int(m.group(2)), len(m.group(3))))
+    # importtime prints children before their parent, indented two more spaces
+    entries = []
+    handler_us = None
+    for idx, (name, cumulative, indent) in enumerate(lines):
+        if name != "handler":
+            continue
+        handler_us = cumulative
+        for child, child_us, child_indent in reversed(lines[:idx]):
+            if child_indent <= indent:
+                break
+            if child_indent == indent + 2:
+                entries.append((child, child_us))
+        break
+    entries.sort(key=lambda e: e[1], reverse=True)
+    return {
+        "handlerCumulativeMs": round((handler_us or 0) / 1000.0, 1),
+        "topImports": [{"module": n, "cumulativeMs": round(us / 1000.0, 1)} for n, us in entries[:top]],
+    }
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    out = {}
+    for key in ("import_ms", "first_render_ms", "cold_total_ms"):
+        values = sorted(s[key] for s in samples)
+        out[key] = {
+            "median": round(statistics.median(values), 1),
+            "min": round(values[0], 1),
+            "max": round(values[-1], 1),
+        }
+    out["modules"] = {"median": statistics.median(s["modules"] for s in samples)}
+    return out
+
+
+def compare(new: Dict, old: Dict) -> None:
+    print("\n== compare (median ms: old -> new) ==")
+    for key in ("import_ms", "first_render_ms", "cold_total_ms"):
+        a = old["summary"][key]["median"]
+        b = new["summary"][key]["median"]
+        delta = b - a
+        print(f"{key:16s} {a:9.1f} -> {b:9.1f}  ({delta:+.1f} ms, x{(b / a if a else 0):.2f})")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="fresh interpreters to sample")
+    ap.add_argument("--top", type=int, default=10, help="imports to list in the breakdown")
+    ap.add_argument("--json", help="write the report to this file")
+    ap.add_argument("--compare", help="previous --json report to compare against")
+    args = ap.parse_args()
+
+    # one discarded run so the OS page cache is warm for every measured sample
+    sample_once()
+    samples = [sample_once() for _ in range(args.runs)]
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": args.runs,
+        "summary": summarize(samples),
+        "importtime": import_breakdown(args.top),
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
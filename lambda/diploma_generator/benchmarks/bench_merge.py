@@ -0,0 +1,147 @@
+"""
+Throughput benchmark + cross-backend equivalence check for the PDF merge step.
+
+Runs fully offline with the checked-in template, layout and signatures:
+
+    cd lambda/diploma_generator
+    python benchmarks/bench_merge.py --rows 200
+    python benchmarks/bench_merge.py --rows 200 --backends pypdf2,pikepdf --json out.json
+
+Before timing anything, every backend renders the same rows and the merged
+pages are compared (page count, mediabox, extracted text, image count).
+Exit code is 1 if any backend disagrees with the first one.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from io import BytesIO
+
+from _common import TEMPLATE_PATH, handler, install_signatures, load_layout, load_template
+from PyPDF2 import PdfReader
+
+SAMPLE_ROWS = [
+    ("Juan Pérez", "Curso de Python", "2024-1-29", "Oscar Pimentel"),
+    ("Ana Gómez", "Taller de Matemáticas", "01/03/2024", "Oscar Pimentel"),
+    ("Carlos López", "Taller de Machine Learning", "Marzo de 2025", "mauricio_sanchez.gif"),
+]
+
+
+def page_fingerprint(pdf_bytes: bytes) -> dict:
+    reader = PdfReader(BytesIO(pdf_bytes))
+    page = reader.pages[0]
+    images = 0
+    stack = [page.get("/Resources")]
+    while stack:
+        res = stack.pop()
+        if res is None:
+            continue
+        res = res.get_object()
+        xobjects = res.get("/XObject")
+        if xobjects is None:
+            continue
+        for _, ref in xobjects.get_object().items():
+            xobj = ref.get_object()
+            if xobj.get("/Subtype") == "/Image":
+                images += 1
+            elif xobj.get("/Subtype") == "/Form":
+                stack.append(xobj.get("/Resources"))
+    return {
+        "pages": len(reader.pages),
+        "mediabox": [round(float(v), 2) for v in page.mediabox],
+        "text": " ".join(page.extract_text().split()),
+        "images": images,
+    }
+
+
+def render(template_bytes: bytes, layout: dict, row: tuple, backend: str) -> bytes:
+    nombre, curso, fecha, profesor = row
+    return handler.generate_one_pdf_bytes(
+        template_pdf_bytes=template_bytes,
+        layout=layout,
+        nombre=nombre,
+        curso=curso,
+        fecha=fecha,
+        profesor_value=profesor,
+        signature_url=handler.resolve_signature_url(profesor),
+        merge_backend=backend,
+    )
+
+
+def check_equivalence(template_bytes: bytes, layout: dict, backends: list) -> bool:
+    ok = True
+    for row in SAMPLE_ROWS:
+        reference = None
+        for backend in backends:
+            fp = page_fingerprint(render(template_bytes, layout, row, backend))
+            if reference is None:
+                reference = (backend, fp)
+            elif fp != reference[1]:
+                ok = False
+                print(f"[MISMATCH] {row[0]!r}: {backend} != {reference[0]}", file=sys.stderr)
+                print(f"  {reference[0]}: {reference[1]}", file=sys.stderr)
+                print(f"  {backend}: {fp}", file=sys.stderr)
+    return ok
+
+
+def bench_backend(template_bytes: bytes, layout: dict, backend: str, rows: int) -> dict:
+    merge = handler.get_merge_backend(backend)
+
+    # Overlays are rendered up front so only the merge step is timed
+    overlays = []
+    for i in range(rows):
+        captured = {}
+
+        def capture(_template: bytes, overlay: bytes) -> bytes:
+            captured["overlay"] = overlay
+            return b""
+
+        handler.MERGE_BACKENDS["_capture"] = capture
+        try:
+            render(template_bytes, layout, SAMPLE_ROWS[i % len(SAMPLE_ROWS)], "_capture")
+        finally:
+            del handler.MERGE_BACKENDS["_capture"]
+        overlays.append(captured["overlay"])
+
+    out_bytes = 0
+    start = time.perf_counter()
+    for overlay in overlays:
+        out_bytes += len(merge(template_bytes, overlay))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "rows": rows,
+        "seconds": round(elapsed, 4),
+        "merges_per_sec": round(rows / elapsed, 2) if elapsed else None,
+        "ms_per_merge": round(elapsed * 1000.0 / rows, 3),
+        "avg_output_bytes": out_bytes // rows,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--backends", default=",".join(handler.MERGE_BACKENDS))
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    template_bytes = load_template()
+    layout = load_layout()
+    install_signatures()
+
+    equivalent = check_equivalence(template_bytes, layout, backends)
+    results = [bench_backend(template_bytes, layout, b, args.rows) for b in backends]
+
+    report = {"equivalent": equivalent, "template": os.path.basename(TEMPLATE_PATH), "results": results}
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if equivalent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
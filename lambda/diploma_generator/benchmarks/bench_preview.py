@@ -0,0 +1,66 @@
+"""
+Latency of the synchronous preview entry point (handler.preview) with warm caches.
+Fully offline.
+
+    cd lambda/diploma_generator
+    python benchmarks/bench_preview.py --runs 200
+    python benchmarks/bench_preview.py --runs 50 --thumbnail    # needs pymupdf
+
+The first call is reported separately (cold: deferred imports, font setup);
+the rest are warm. Target: warm p99 well under 500 ms.
+"""
+import argparse
+import json
+import sys
+import time
+
+from _common import PROFESORES, handler, install_signatures, load_layout, load_template, percentiles, synthetic_rows
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=200)
+    ap.add_argument("--thumbnail", action="store_true", help="also render the PNG thumbnail")
+    ap.add_argument("--json", help="write the report to this file")
+    args = ap.parse_args()
+
+    # what warm_init would have cached from the admin API
+    install_signatures()
+    handler._TEMPLATE_PDF_BYTES = load_template()
+    handler._FIELD_MAPPINGS = load_layout()
+
+    rows = synthetic_rows(args.runs + 1)
+    draft = load_layout()
+    samples = []
+    cold_ms = None
+    for i, row in enumerate(rows):
+        row["profesor"] = PROFESORES[i % 2]
+        msg = {"type": "preview", "fieldMappings": draft, "row": row, "thumbnail": args.thumbnail}
+        t0 = time.perf_counter_ns()
+        result = handler.preview(msg)
+        elapsed = time.perf_counter_ns() - t0
+        if not result["ok"]:
+            print(json.dumps(result, indent=2), file=sys.stderr)
+            return 1
+        if i == 0:
+            cold_ms = round(elapsed / 1e6, 2)
+        else:
+            samples.append(elapsed)
+
+    report = {
+        "runs": args.runs,
+        "thumbnail": args.thumbnail,
+        "firstCallMs": cold_ms,
+        "warm": {k.replace("Us", "Ms"): (round(v / 1000.0, 2) if k.endswith("Us") else v)
+                 for k, v in percentiles(samples).items()},
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
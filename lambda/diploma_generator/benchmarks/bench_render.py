@@ -0,0 +1,240 @@
+"""
+Micro-benchmarks for the diploma render hot path. Fully offline.
+
+    cd lambda/diploma_generator
+    python benchmarks/bench_render.py                       # sizes 10,1000
+    python benchmarks/bench_render.py --sizes 10,1000,50000 --json run.json
+    python benchmarks/bench_render.py --json new.json --compare run.json
+    python benchmarks/bench_render.py --write-csv /tmp/students-1k.csv --sizes 1000
+
+Benchmarks (per dataset size):
+  parse_csv          parse_csv_rows over the synthetic CSV
+  fecha_a_espanol    one call per row
+  normalize          normalize_diploma_fields vs NormalizationCache.fields
+  signature_png      image_bytes_to_png_bytes_with_transparency per firma
+  generate_pdf       generate_one_pdf_bytes per row (capped by --max-render-rows)
+  zip                ZIP_DEFLATED archive of the rendered PDFs
+  zip_modes          handler.ZipCompressor per mode (deflate / auto / store): wall time,
+                     compress CPU seconds, archive bytes, estimated CPU saved vs bytes given up
+
+Each entry reports latency percentiles (microseconds), rows/sec and, where it
+applies, bytes per diploma. --compare prints the ratio new/old of p50 and rows/sec.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import zipfile
+from io import BytesIO
+from typing import Callable, Dict, List
+
+from _common import (
+    firma_paths,
+    handler,
+    install_signatures,
+    load_layout,
+    load_template,
+    percentiles,
+    synthetic_csv,
+    synthetic_rows,
+)
+
+
+def timed_per_item(items: List, fn: Callable) -> Dict[str, float]:
+    samples = []
+    perf = time.perf_counter_ns
+    start = perf()
+    for item in items:
+        t0 = perf()
+        fn(item)
+        samples.append(perf() - t0)
+    total_s = (perf() - start) / 1e9
+    out = percentiles(samples)
+    out["rowsPerSec"] = round(len(items) / total_s, 2) if total_s else None
+    return out
+
+
+def bench_parse_csv(size: int) -> Dict[str, float]:
+    data = synthetic_csv(size)
+    t0 = time.perf_counter()
+    rows = handler.parse_csv_rows(data)
+    elapsed = time.perf_counter() - t0
+    return {"n": len(rows), "totalMs": round(elapsed * 1000.0, 3), "rowsPerSec": round(len(rows) / elapsed, 2)}
+
+
+def bench_fecha(rows: List[Dict[str, str]]) -> Dict[str, float]:
+    return timed_per_item([r["fecha"] for r in rows], handler.fecha_a_espanol)
+
+
+def bench_normalize(rows: List[Dict[str, str]]) -> Dict[str, Dict[str, float]]:
+    args = [(r["nombre"], r["curso"], r["fecha"], r["profesor"]) for r in rows]
+    plain = timed_per_item(args, lambda a: handler.normalize_diploma_fields(*a))
+    cache = handler.NormalizationCache()
+    cached = timed_per_item(args, lambda a: cache.fields(*a))
+    cached["hitRate"] = cache.stats()["hitRate"]
+    return {"plain": plain, "cached": cached}
+
+
+def bench_signature_png(iterations: int) -> Dict[str, Dict[str, float]]:
+    out = {}
+    for path in firma_paths():
+        with open(path, "rb") as f:
+            raw = f.read()
+        out[os.path.basename(path)] = timed_per_item(
+            [raw] * iterations, handler.image_bytes_to_png_bytes_with_transparency
+        )
+    return out
+
+
+def bench_generate(rows: List[Dict[str, str]], template: bytes, layout: dict, backend: str):
+    pdfs: List[bytes] = []
+
+    def render(row: Dict[str, str]) -> None:
+        pdfs.append(handler.generate_one_pdf_bytes(
+            template_pdf_bytes=template,
+            layout=layout,
+            nombre=row["nombre"],
+            curso=row["curso"],
+            fecha=row["fecha"],
+            profesor_value=row["profesor"],
+            signature_url=handler.resolve_signature_url(row["profesor"]),
+            merge_backend=backend,
+        ))
+
+    stats = timed_per_item(rows, render)
+    stats["bytesPerDiploma"] = sum(len(p) for p in pdfs) // max(len(pdfs), 1)
+    return stats, pdfs
+
+
+def bench_zip(pdfs: List[bytes]) -> Dict[str, float]:
+    buf = BytesIO()
+    t0 = time.perf_counter()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, pdf in enumerate(pdfs):
+            zf.writestr(f"diploma_{i:06d}.pdf", pdf)
+    elapsed = time.perf_counter() - t0
+    raw = sum(len(p) for p in pdfs)
+    return {
+        "n": len(pdfs),
+        "totalMs": round(elapsed * 1000.0, 3),
+        "rowsPerSec": round(len(pdfs) / elapsed, 2) if elapsed else None,
+        "inputBytes": raw,
+        "zipBytes": buf.tell(),
+        "ratio": round(buf.tell() / raw, 4) if raw else None,
+        "mbPerSec": round(raw / 1e6 / elapsed, 2) if elapsed else None,
+    }
+
+
+def bench_zip_modes(pdfs: List[bytes]) -> Dict[str, Dict[str, float]]:
+    out = {}
+    for mode in ("deflate", "auto", "store"):
+        compressor = handler.ZipCompressor(mode=mode)
+        t0 = time.perf_counter()
+        for pdf, future in [(pdf, compressor.submit(pdf)) for pdf in pdfs]:
+            compressor.record(len(pdf), future.result())
+        elapsed = time.perf_counter() - t0
+        compressor.shutdown()
+        summary = compressor.summary()
+        summary["totalMs"] = round(elapsed * 1000.0, 3)
+        summary["rowsPerSec"] = round(len(pdfs) / elapsed, 2) if elapsed else None
+        out[mode] = summary
+    return out
+
+
+def run(sizes: List[int], max_render_rows: int, backend: str, signature_iterations: int) -> Dict:
+    template = load_template()
+    layout = load_layout()
+    install_signatures()
+
+    # warm-up: font metrics, first image decode, imports inside backends
+    warm = synthetic_rows(1)
+    bench_generate(warm, template, layout, backend)
+
+    results: Dict[str, Dict] = {"signature_png": bench_signature_png(signature_iterations)}
+    for size in sizes:
+        rows = synthetic_rows(size)
+        render_rows = rows[:max_render_rows]
+        generate_stats, pdfs = bench_generate(render_rows, template, layout, backend)
+        results[str(size)] = {
+            "parse_csv": bench_parse_csv(size),
+            "fecha_a_espanol": bench_fecha(rows),
+            "normalize": bench_normalize(rows),
+            "generate_pdf": generate_stats,
+            "zip": bench_zip(pdfs),
+            "zip_modes": bench_zip_modes(pdfs),
+        }
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            "mergeBackend": backend,
+            "sizes": sizes,
+            "maxRenderRows": max_render_rows,
+        },
+        "results": results,
+    }
+
+
+def _flatten(prefix: str, node, out: Dict[str, float]) -> None:
+    if isinstance(node, dict):
+        for k, v in node.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(node, (int, float)):
+        out[prefix] = node
+
+
+def compare(new: Dict, old: Dict) -> List[str]:
+    """
+    Ratio new/old for p50 latency and throughput (lower p50 / higher rows/sec is better).
+    """
+    a: Dict[str, float] = {}
+    b: Dict[str, float] = {}
+    _flatten("", new["results"], a)
+    _flatten("", old["results"], b)
+    lines = []
+    for key in sorted(a):
+        if not (key.endswith(".p50Us") or key.endswith(".rowsPerSec")) or not b.get(key):
+            continue
+        lines.append(f"{key:60s} {b[key]:>12.2f} -> {a[key]:>12.2f}  x{a[key] / b[key]:.2f}")
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000", help="comma separated dataset sizes (e.g. 10,1000,50000)")
+    parser.add_argument("--max-render-rows", type=int, default=1000,
+                        help="rows actually rendered per size (rendering 50k rows takes a long time)")
+    parser.add_argument("--backend", default=handler.PDF_MERGE_BACKEND, choices=sorted(handler.MERGE_BACKENDS))
+    parser.add_argument("--signature-iterations", type=int, default=20)
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    parser.add_argument("--compare", help="previous report to compare against")
+    parser.add_argument("--write-csv", help="only write the synthetic CSV of the (last) size and exit")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    if args.write_csv:
+        with open(args.write_csv, "wb") as f:
+            f.write(synthetic_csv(sizes[-1]))
+        print(f"wrote {sizes[-1]} rows to {args.write_csv}")
+        return 0
+
+    report = run(sizes, args.max_render_rows, args.backend, args.signature_iterations)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        print("\n".join(compare(report, old)), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
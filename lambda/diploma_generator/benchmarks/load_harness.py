@@ -0,0 +1,405 @@
+"""
+End-to-end load harness for handler.lambda_handler. Fully offline.
+
+Starts two local HTTP servers and points handler.py at them:
+  fake admin API   GET /internal/signatures, /internal/templates/active, /internal/configuration
+                   PATCH /internal/diploma-batches/{id}
+                   GET /files/...   template, firmas and the synthetic batch CSVs
+  S3 stand-in      path-style PUT/GET/HEAD /{bucket}/{key} (S3_ENDPOINT_URL)
+
+then drives N SQS-shaped events through lambda_handler with a given concurrency.
+Each worker is a separate process by default, so every worker behaves like its
+own Lambda container (cold on its first batch, warm afterwards).
+
+    cd lambda/diploma_generator
+    python benchmarks/load_harness.py                                  # 8 batches x 50 rows, concurrency 2
+    python benchmarks/load_harness.py --batches 20 --rows 200 --concurrency 4 --json load.json
+    python benchmarks/load_harness.py --mode thread --concurrency 4    # one shared "container"
+    python benchmarks/load_harness.py --mode worker --sizes 2000,20,20 --max-active 1   # worker.py, FIFO
+    python benchmarks/load_harness.py --output objects --s3-latency-ms 40   # one S3 object per diploma
+    IO_MODE=sync python benchmarks/load_harness.py --admin-latency-ms 80 --s3-latency-ms 40   # vs default async I/O
+    python benchmarks/load_harness.py --patch-fail-rate 0.5   # flaky status endpoint (StatusDispatcher retries)
+
+Reports per-batch latency (p50/p99), batches/sec and rows/sec, final PATCH
+statuses and what landed in the S3 stand-in.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUCKET = "load-harness"
+CSV_PREFIX = "generacion-diplomas/generated-diplomas/load-harness"
+
+
+# -----------------------------------------------------------------------------
+# Fake admin API + resources
+# -----------------------------------------------------------------------------
+class FakeAdmin:
+    """
+    In-memory stand-in for the admin API and the resources CDN.
+    """
+
+    def __init__(self, latency_s: float = 0.0, patch_fail_rate: float = 0.0):
+        self.lock = threading.Lock()
+        self.latency_s = latency_s   # added to every request (network round trip)
+        self.patch_fail_rate = patch_fail_rate   # share of status PATCHes answered with 503
+        self.patch_failures = 0
+        self.files: Dict[str, bytes] = {}
+        self.signatures: List[Dict[str, Any]] = []
+        self.field_mappings: Dict[str, Any] = {}
+        self.patches: List[Tuple[int, Dict[str, Any]]] = []
+        self.status_times: Dict[int, float] = {}   # batch id -> perf_counter of its last status PATCH
+        self.requests = 0
+        self.base_url = ""
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, str, bytes]:
+        with self.lock:
+            self.requests += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        base_url = self.base_url
+
+        if method == "GET" and path.startswith("/files/"):
+            data = self.files.get(path[len("/files/"):])
+            if data is None:
+                return 404, "text/plain", b"not found"
+            ctype = "application/pdf" if path.endswith(".pdf") else "application/octet-stream"
+            return 200, ctype, data
+
+        if method == "GET" and path == "/internal/signatures":
+            return _json(200, {"signatures": self.signatures})
+        if method == "GET" and path == "/internal/templates/active":
+            return _json(200, {"template": {"url": f"{base_url}/files/template.pdf"}})
+        if method == "GET" and path == "/internal/configuration":
+            return _json(200, {"fieldMappings": self.field_mappings})
+
+        m = re.match(r"^/internal/diploma-batches/(\d+)$", path)
+        if method == "PATCH" and m:
+            payload = json.loads(body or b"{}")
+            if self.patch_fail_rate and random.random() < self.patch_fail_rate:
+                with self.lock:
+                    self.patch_failures += 1
+                return 503, "text/plain", b"unavailable"
+            with self.lock:
+                self.patches.append((int(m.group(1)), payload))
+                if "status" in payload:
+                    self.status_times[int(m.group(1))] = time.perf_counter()
+            return _json(200, {"ok": True})
+
+        return 404, "text/plain", b"not found"
+
+    def final_statuses(self) -> Dict[str, int]:
+        last: Dict[int, str] = {}
+        with self.lock:
+            for batch_id, payload in self.patches:
+                if "status" in payload:
+                    last[batch_id] = payload["status"]
+        counts: Dict[str, int] = {}
+        for status in last.values():
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+
+class FakeS3:
+    """
+    Minimal path-style S3: PUT / GET / HEAD objects, NoSuchKey on miss.
+    Only what boto3's put_object / get_object need.
+    """
+
+    def __init__(self, latency_s: float = 0.0):
+        self.lock = threading.Lock()
+        self.objects: Dict[str, bytes] = {}
+        self.requests = 0
+        self.latency_s = latency_s   # added to every request (network round trip)
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        with self.lock:
+            self.requests += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        key = unquote(path.lstrip("/"))
+        if method == "PUT":
+            with self.lock:
+                self.objects[key] = body
+            return 200, {"ETag": '"%032x"' % (hash(body) & (2 ** 128 - 1))}, b""
+
+        if method in ("GET", "HEAD"):
+            with self.lock:
+                data = self.objects.get(key)
+            if data is None:
+                err = (
+                    "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+                    f"<Error><Code>NoSuchKey</Code><Message>The specified key does not exist.</Message>"
+                    f"<Key>{key}</Key></Error>"
+                ).encode("utf-8")
+                return 404, {"Content-Type": "application/xml"}, err
+            headers = {
+                "Content-Type": "application/octet-stream",
+                "ETag": '"%032x"' % (hash(data) & (2 ** 128 - 1)),
+                "Last-Modified": formatdate(usegmt=True),
+            }
+            return 200, headers, data
+
+        return 405, {"Content-Type": "text/plain"}, b"method not allowed"
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            keys = list(self.objects)
+            total = sum(len(v) for v in self.objects.values())
+        return {
+            "objects": len(keys),
+            "bytes": total,
+            "zips": sum(1 for k in keys if k.endswith(".zip")),
+            "pdfs": sum(1 for k in keys if k.endswith(".pdf")),
+        }
+
+
+def _json(status: int, payload: Any) -> Tuple[int, str, bytes]:
+    return status, "application/json", json.dumps(payload).encode("utf-8")
+
+
+def _make_request_handler(admin: Optional[FakeAdmin] = None, s3: Optional[FakeS3] = None):
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _dispatch(self, method: str):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            path = urlparse(self.path).path
+            if admin is not None:
+                status, ctype, data = admin.handle(method, path, body)
+                headers = {"Content-Type": ctype}
+            else:
+                status, headers, data = s3.handle(method, path, body)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if method != "HEAD":
+                self.wfile.write(data)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_HEAD(self):
+            self._dispatch("HEAD")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def do_PATCH(self):
+            self._dispatch("PATCH")
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return RequestHandler
+
+
+def start_server(handler_cls) -> Tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+# -----------------------------------------------------------------------------
+# Workers
+# -----------------------------------------------------------------------------
+def run_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One SQS event through lambda_handler; runs in a worker process or thread.
+    """
+    from _common import handler
+
+    t0 = time.perf_counter_ns()
+    error = None
+    try:
+        out = handler.lambda_handler(event, None)
+        results = out.get("results", [])
+        status = results[0].get("status") if results else None
+    except Exception as e:
+        status = "exception"
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "latencyNs": time.perf_counter_ns() - t0,
+        "status": status,
+        "error": error,
+        "pid": os.getpid(),
+    }
+
+
+def build_events(base_url: str, admin: FakeAdmin, sizes: List[int], seed: int,
+                 output_mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    from _common import synthetic_csv
+
+    events = []
+    for i, rows in enumerate(sizes, start=1):
+        path = f"{CSV_PREFIX}/proceso-{i}/carga-{i}.csv"
+        admin.files[path] = synthetic_csv(rows, seed=seed + i)
+        body = {"batch_id": i, "csv_url": f"{base_url}/files/{path}"}
+        if output_mode:
+            body["output_mode"] = output_mode
+        events.append({"Records": [{"messageId": f"load-{i}", "body": json.dumps(body)}]})
+    return events
+
+
+def run_worker(events: List[Dict[str, Any]], admin: FakeAdmin, args) -> List[Dict[str, Any]]:
+    """
+    Enqueues every event body on a temporary SQLite queue and drains it with
+    worker.Worker; latency per batch = enqueue -> final status PATCH.
+    """
+    import tempfile
+
+    import worker
+
+    queue = worker.SqliteQueue(os.path.join(tempfile.mkdtemp(prefix="load-harness-"), "queue.db"))
+    batch_ids = []
+    for event in events:
+        body = event["Records"][0]["body"]
+        batch_ids.append(json.loads(body)["batch_id"])
+        queue.enqueue(body)
+
+    t0 = time.perf_counter()
+    w = worker.Worker(queue, processes=args.concurrency, max_active=args.max_active, policy=args.scheduling)
+    w.run(once=True)
+
+    statuses = {b: p["status"] for b, p in admin.patches if "status" in p}
+    results = []
+    for batch_id in batch_ids:
+        done = admin.status_times.get(batch_id)
+        results.append({
+            "latencyNs": int(((done or time.perf_counter()) - t0) * 1e9),
+            "status": statuses.get(batch_id, "missing"),
+            "error": None if batch_id in statuses else "no status PATCH",
+            "pid": os.getpid(),
+        })
+    return results
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--batches", type=int, default=8, help="number of SQS events (one batch each)")
+    ap.add_argument("--rows", type=int, default=50, help="rows per batch CSV")
+    ap.add_argument("--sizes", help="comma-separated rows per batch (overrides --batches/--rows), e.g. 2000,20,20")
+    ap.add_argument("--concurrency", type=int, default=2, help="parallel invocations (worker mode: pool processes)")
+    ap.add_argument("--mode", choices=("process", "thread", "worker"), default="process",
+                    help="process: one container per worker; thread: all workers share one module; "
+                         "worker: drain a SQLite queue with worker.py")
+    ap.add_argument("--max-active", type=int, default=4, help="worker mode: batches rendered at the same time")
+    ap.add_argument("--scheduling", default="round-robin", help="worker mode: round-robin | shortest-first")
+    ap.add_argument("--output", choices=("zip", "objects"), help="output_mode sent with every batch")
+    ap.add_argument("--s3-latency-ms", type=float, default=0.0, help="delay added to every S3 stand-in request")
+    ap.add_argument("--admin-latency-ms", type=float, default=0.0,
+                    help="delay added to every admin API / resources request")
+    ap.add_argument("--patch-fail-rate", type=float, default=0.0,
+                    help="share of status PATCHes the fake admin API answers with 503")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--json", help="write the report to this file")
+    args = ap.parse_args()
+
+    admin = FakeAdmin(latency_s=args.admin_latency_ms / 1000.0, patch_fail_rate=args.patch_fail_rate)
+    s3 = FakeS3(latency_s=args.s3_latency_ms / 1000.0)
+    admin_server, admin_url = start_server(_make_request_handler(admin=admin))
+    s3_server, s3_url = start_server(_make_request_handler(s3=s3))
+    admin.base_url = admin_url
+
+    # handler.py reads these at import time; set them before _common imports it
+    os.environ["ADMIN_BASE"] = f"{admin_url}/internal"
+    os.environ["RESOURCES_BASE_URL"] = f"{admin_url}/files"
+    os.environ["RESOURCES_BUCKET"] = BUCKET
+    os.environ["S3_ENDPOINT_URL"] = s3_url
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "load-harness")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "load-harness")
+    os.environ.setdefault("EMIT_EMF_METRICS", "false")
+    sys.path.insert(0, HERE)
+
+    from _common import firma_paths, load_layout, load_template, percentiles
+
+    admin.files["template.pdf"] = load_template()
+    admin.field_mappings = load_layout()
+    for path in firma_paths():
+        filename = os.path.basename(path)
+        with open(path, "rb") as f:
+            admin.files[f"firmas/{filename}"] = f.read()
+        admin.signatures.append({
+            "name": os.path.splitext(filename)[0].replace("_", " "),
+            "url": f"{admin_url}/files/firmas/{filename}",
+        })
+
+    sizes = [int(n) for n in args.sizes.split(",")] if args.sizes else [args.rows] * args.batches
+    events = build_events(admin_url, admin, sizes, args.seed, args.output)
+
+    t0 = time.perf_counter()
+    if args.mode == "worker":
+        results = run_worker(events, admin, args)
+    else:
+        if args.mode == "process":
+            pool = ProcessPoolExecutor(max_workers=args.concurrency, mp_context=multiprocessing.get_context("fork"))
+        else:
+            pool = ThreadPoolExecutor(max_workers=args.concurrency)
+        with pool:
+            results = list(pool.map(run_event, events))
+    wall_s = time.perf_counter() - t0
+
+    admin_server.shutdown()
+    s3_server.shutdown()
+
+    latencies = [r["latencyNs"] for r in results]
+    lat = {k.replace("Us", "Ms"): (round(v / 1000.0, 1) if k.endswith("Us") else v) for k, v in percentiles(latencies).items()}
+    outcome: Dict[str, int] = {}
+    for r in results:
+        outcome[str(r["status"])] = outcome.get(str(r["status"]), 0) + 1
+    errors = [r["error"] for r in results if r["error"]]
+
+    report = {
+        "config": {
+            "batches": len(sizes),
+            "rowsPerBatch": sizes if args.sizes else args.rows,
+            "concurrency": args.concurrency,
+            "mode": args.mode,
+            "cpuCount": os.cpu_count(),
+        },
+        "wallSeconds": round(wall_s, 3),
+        "batchesPerSec": round(len(sizes) / wall_s, 3) if wall_s else None,
+        "rowsPerSec": round(sum(sizes) / wall_s, 1) if wall_s else None,
+        "batchLatencyMs": lat,
+        "perBatch": [
+            {"batchId": i, "rows": n, "latencyMs": round(r["latencyNs"] / 1e6, 1), "status": r["status"]}
+            for i, (n, r) in enumerate(zip(sizes, results), start=1)
+        ] if args.sizes else None,
+        "workers": len({r["pid"] for r in results}),
+        "results": outcome,
+        "errors": errors[:10],
+        "adminApi": {
+            "requests": admin.requests,
+            "patchFailures": admin.patch_failures,
+            "finalStatuses": admin.final_statuses(),
+        },
+        "s3": {"requests": s3.requests, **s3.summary()},
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -80,6 +80,9 @@ from reportlab.lib.utils import ImageReader
 from PIL import Image
 import zipfile
 
+from secret_provider import SecretProvider
+from status_dispatch import StatusDispatcher, flush_timeout
+
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
@@ -102,13 +105,19 @@ RESOURCES_BUCKET = os.environ.get("RESOURCES_BUCKET", "resources.my-website.com"
 
 API_KEY_HEADER_NAME = "api-key-pohualizcalli"
 
+# Status PATCHes go through StatusDispatcher (status_dispatch.py): retried with backoff in the background,
+# flushed for at most STATUS_FLUSH_SECONDS before the invocation returns
+STATUS_MAX_ATTEMPTS = int(os.environ.get("STATUS_MAX_ATTEMPTS", "6"))
+STATUS_RETRY_BASE_SECONDS = float(os.environ.get("STATUS_RETRY_BASE_SECONDS", "0.5"))
+STATUS_RETRY_MAX_SECONDS = float(os.environ.get("STATUS_RETRY_MAX_SECONDS", "20"))
+STATUS_FLUSH_SECONDS = float(os.environ.get("STATUS_FLUSH_SECONDS", "10"))
+
 # PDF page width (letter)
 page_width = letter[0]
 
 # ---------------------------------------------------------------------------
 # Global caches (persist across Lambda invocations in the same container)
 # ---------------------------------------------------------------------------
-_API_KEY: Optional[str] = None
 _SIGNATURES_INDEX: Optional[Dict[str, str]] = None  # key: normalized name/professorName, value: URL
 _FIELD_MAPPINGS: Optional[Dict[str, Any]] = None   # layout from /internal/configuration
 _TEMPLATE_BYTES: Optional[bytes] = None            # PDF template bytes
@@ -118,13 +127,35 @@ _SIGNATURE_IMAGE_CACHE: Dict[str, bytes] = {}      # url -> bytes
 # ===========================================================================
 # Helpers: configuration / HTTP
 # ===========================================================================
+def fetch_api_key() -> str:
+    logger.info("Fetching API key from SSM: %s", SSM_PARAM_NAME)
+    resp = ssm.get_parameter(Name=SSM_PARAM_NAME, WithDecryption=True)
+    return resp["Parameter"]["Value"]
+
+
+# cached for SECRET_TTL_SECONDS and refreshed in the background (see secret_provider.py)
+API_KEY_SECRET = SecretProvider("api-key", fetch_api_key)
+
+
 def get_api_key() -> str:
-    global _API_KEY
-    if _API_KEY is None:
-        logger.info("Fetching API key from SSM: %s", SSM_PARAM_NAME)
-        resp = ssm.get_parameter(Name=SSM_PARAM_NAME, WithDecryption=True)
-        _API_KEY = resp["Parameter"]["Value"]
-    return _API_KEY
+    return API_KEY_SECRET.get()
+
+
+def admin_request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    One admin API call; on 401 the API key is re-fetched once (rotated through
+    /internal/reload-api-key) and the call retried with the new key.
+    """
+    api_key = get_api_key()
+    extra = kwargs.pop("headers", {})
+    resp = requests.request(method, url, headers={API_KEY_HEADER_NAME: api_key, **extra}, **kwargs)
+    if resp.status_code == 401:
+        fresh = API_KEY_SECRET.reload(api_key)
+        if fresh != api_key:
+            logger.info("%s %s returned 401; retrying with the reloaded API key", method, url)
+            resp = requests.request(method, url, headers={API_KEY_HEADER_NAME: fresh, **extra}, **kwargs)
+    resp.raise_for_status()
+    return resp
 
 
 def admin_get(path: str) -> Any:
@@ -132,13 +163,9 @@ def admin_get(path: str) -> Any:
     GET to admin internal API returning JSON.
     path example: '/signatures' or '/templates/active'
     """
-    api_key = get_api_key()
     url = ADMIN_API_BASE.rstrip("/") + path
-    headers = {API_KEY_HEADER_NAME: api_key}
     logger.info("GET %s", url)
-    resp = requests.get(url, headers=headers, timeout=30)
-    resp.raise_for_status()
-    return resp.json()
+    return admin_request("GET", url, timeout=30).json()
 
 
 def http_get_bytes(url: str) -> bytes:
@@ -552,14 +579,22 @@ def upload_zip_to_s3(local_zip_path: str, csv_path_rel: str, original_file_name:
     return url
 
 
-def update_batch_status(batch_id: int, status: str, total_records: int, zip_url: Optional[str], error: Optional[str] = None):
-    api_key = get_api_key()
+# ===========================================================================
+# Status updates (background delivery)
+# ===========================================================================
+STATUS_UPDATES = StatusDispatcher(1, STATUS_MAX_ATTEMPTS, STATUS_RETRY_BASE_SECONDS, STATUS_RETRY_MAX_SECONDS)
+
+
+def send_batch_status(batch_id: int, payload: Dict[str, Any]):
     url = f"{ADMIN_API_BASE.rstrip('/')}/diploma-batches/{batch_id}"
-    headers = {
-        "Content-Type": "application/json",
-        API_KEY_HEADER_NAME: api_key,
-    }
+    logger.info("PATCH %s -> %s", url, payload)
+    admin_request("PATCH", url, headers={"Content-Type": "application/json"}, json=payload, timeout=30)
 
+
+def update_batch_status(batch_id: int, status: str, total_records: int, zip_url: Optional[str], error: Optional[str] = None):
+    """
+    Queues the PATCH on STATUS_UPDATES; lambda_handler flushes it before returning.
+    """
     payload: Dict[str, Any] = {
         "status": status,
         "totalRecords": total_records,
@@ -569,9 +604,7 @@ def update_batch_status(batch_id: int, status: str, total_records: int, zip_url:
     if error:
         payload["errorMessage"] = error
 
-    logger.info("PATCH %s -> %s", url, payload)
-    resp = requests.patch(url, headers=headers, json=payload, timeout=30)
-    resp.raise_for_status()
+    STATUS_UPDATES.post(batch_id, lambda body: send_batch_status(batch_id, body), payload)
 
 
 def process_single_message(msg_body: Dict[str, Any]):
@@ -702,6 +735,9 @@ def lambda_handler(event, context):
             # We log but let SQS redrive (DLQ etc.) handle retries
             results.append({"messageId": record.get("messageId"), "status": f"ERROR: {str(e)}"})
 
+    # deliver the queued status PATCHes, leaving a second of the Lambda's time
+    STATUS_UPDATES.flush(flush_timeout(context, STATUS_FLUSH_SECONDS))
+
     return {
         "statusCode": 200,
         "results": results,
@@ -24,6 +24,9 @@ Environment Variables:
     - TEMPLATE_BUCKET: S3 bucket containing PDF templates
     - TEMPLATE_KEY: S3 key for the default template (optional, can be in event)
     - SIGNATURES_BUCKET: S3 bucket containing signature images
+    - SIGNATURES_PREFIX: Key prefix of the signature images (default "signatures/")
+    - SIGNATURE_INDEX_TTL_SECONDS: How long the signature listing is reused by a warm container (default 900)
+    - SIGNATURE_FETCH_WORKERS: Parallel signature downloads (default 8)
     - OUTPUT_BUCKET: S3 bucket for generated ZIP files
 
 Event Structure:
@@ -51,8 +54,10 @@ import json
 import zipfile
 import tempfile
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from urllib.parse import unquote_plus
 
 import boto3
@@ -65,6 +70,8 @@ from reportlab.pdfbase.ttfonts import TTFont
 from PIL import Image
 from pypdf import PdfReader, PdfWriter
 
+from status_dispatch import StatusDispatcher, flush_timeout
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -76,12 +83,34 @@ s3_client = boto3.client('s3')
 TEMP_DIR = '/tmp'
 TEXT_COLOR = Color(0.1, 0.1, 0.3)  # Deep royal blue
 
+# Callbacks are delivered in the background (see status_dispatch.StatusDispatcher) and flushed
+# for at most CALLBACK_FLUSH_SECONDS before the handler returns
+CALLBACK_MAX_ATTEMPTS = int(os.environ.get('CALLBACK_MAX_ATTEMPTS', '5'))
+CALLBACK_RETRY_BASE_SECONDS = float(os.environ.get('CALLBACK_RETRY_BASE_SECONDS', '0.5'))
+CALLBACK_RETRY_MAX_SECONDS = float(os.environ.get('CALLBACK_RETRY_MAX_SECONDS', '20'))
+CALLBACK_FLUSH_SECONDS = float(os.environ.get('CALLBACK_FLUSH_SECONDS', '10'))
+
+# Signature index (name -> S3 object) cached per container; see load_signatures
+SIGNATURE_INDEX_TTL_SECONDS = float(os.environ.get('SIGNATURE_INDEX_TTL_SECONDS', '900'))
+SIGNATURE_INDEX_MIN_AGE_SECONDS = 60  # a professor missing from an older index triggers a re-list
+SIGNATURE_FETCH_WORKERS = int(os.environ.get('SIGNATURE_FETCH_WORKERS', '8'))
+
+# Cached across warm invocations
+_SIGNATURE_INDEX: Optional[Dict[str, Tuple[str, str]]] = None  # name -> (S3 key, ETag)
+_SIGNATURE_INDEX_SOURCE: Optional[Tuple[str, str]] = None      # (bucket, prefix) it was listed from
+_SIGNATURE_INDEX_BUILT_AT = 0.0
+_SIGNATURE_BYTES: Dict[Tuple[str, str], bytes] = {}            # (S3 key, ETag) -> image bytes
+
 
 class DiplomaGeneratorError(Exception):
     """Custom exception for diploma generation errors."""
     pass
 
 
+CALLBACKS = StatusDispatcher(1, CALLBACK_MAX_ATTEMPTS, CALLBACK_RETRY_BASE_SECONDS, CALLBACK_RETRY_MAX_SECONDS,
+                             name='callback')
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Main Lambda handler function.
@@ -131,8 +160,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             template_bytes = download_file_from_s3(template_bucket, template_key)
             logger.info(f"Downloaded template from {template_bucket}/{template_key}")
         
-        # Load signature mappings
-        signatures = load_signatures()
+        # Load the signatures of the professors in this CSV only
+        signatures = load_signatures(row.get('professor_name', '') for row in csv_data)
         
         # Generate diplomas
         generated_files = []
@@ -219,6 +248,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         return error_response
 
+    finally:
+        # Deliver queued callbacks, leaving a second of the invocation's time
+        CALLBACKS.flush(flush_timeout(context, CALLBACK_FLUSH_SECONDS))
+
 
 def download_csv_from_s3(bucket: str, key: str) -> List[Dict[str, str]]:
     """
@@ -283,10 +316,87 @@ def download_file_from_s3(bucket: str, key: str) -> bytes:
     return response['Body'].read()
 
 
-def load_signatures() -> Dict[str, bytes]:
+def signature_lookup_keys(professor_name: str) -> List[str]:
+    """
+    Signature names tried for a professor, in order.
+    
+    Args:
+        professor_name: Professor name as written in the CSV
+        
+    Returns:
+        Candidate keys into the signatures dictionary
+    """
+    professor_key = professor_name.lower().replace('.', '').replace(' ', '_')
+    return [professor_key, professor_name.lower()]
+
+
+def build_signature_index(bucket: str, prefix: str) -> Dict[str, Tuple[str, str]]:
+    """
+    List every signature object under the prefix (all pages).
+    
+    Args:
+        bucket: Signatures bucket
+        prefix: Key prefix of the signature images
+        
+    Returns:
+        Dictionary mapping professor names to (S3 key, ETag)
+    """
+    index = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            # Extract professor name from filename (e.g., "signatures/dr_jane_smith.png")
+            filename = os.path.basename(key)
+            if not filename:
+                continue
+            name_part = os.path.splitext(filename)[0].replace('_', ' ').lower()
+            index[name_part] = (key, obj.get('ETag', ''))
+    logger.info(f"Indexed {len(index)} signatures under {bucket}/{prefix}")
+    return index
+
+
+def get_signature_index(bucket: str, prefix: str, refresh: bool = False) -> Dict[str, Tuple[str, str]]:
+    """
+    Signature index cached per container, rebuilt after SIGNATURE_INDEX_TTL_SECONDS.
+    
+    Args:
+        bucket: Signatures bucket
+        prefix: Key prefix of the signature images
+        refresh: Rebuild now if the index is older than SIGNATURE_INDEX_MIN_AGE_SECONDS
+        
+    Returns:
+        Dictionary mapping professor names to (S3 key, ETag)
+    """
+    global _SIGNATURE_INDEX, _SIGNATURE_INDEX_SOURCE, _SIGNATURE_INDEX_BUILT_AT
+    age = time.monotonic() - _SIGNATURE_INDEX_BUILT_AT
+    stale = (
+        _SIGNATURE_INDEX is None
+        or _SIGNATURE_INDEX_SOURCE != (bucket, prefix)
+        or age > SIGNATURE_INDEX_TTL_SECONDS
+        or (refresh and age > SIGNATURE_INDEX_MIN_AGE_SECONDS)
+    )
+    if stale:
+        _SIGNATURE_INDEX = build_signature_index(bucket, prefix)
+        _SIGNATURE_INDEX_SOURCE = (bucket, prefix)
+        _SIGNATURE_INDEX_BUILT_AT = time.monotonic()
+        # drop images that were replaced (new ETag) or deleted
+        current = set(_SIGNATURE_INDEX.values())
+        for obj in [obj for obj in _SIGNATURE_BYTES if obj not in current]:
+            del _SIGNATURE_BYTES[obj]
+    return _SIGNATURE_INDEX
+
+
+def load_signatures(professor_names: Iterable[str]) -> Dict[str, bytes]:
     """
-    Load signature images from S3.
+    Load the signature images of the given professors from S3.
     
+    Names are resolved through the cached signature index; images not
+    downloaded by an earlier invocation are fetched in parallel.
+    
+    Args:
+        professor_names: Professor names from the CSV (repeats are fine)
+        
     Returns:
         Dictionary mapping professor names to image bytes
     """
@@ -298,27 +408,40 @@ def load_signatures() -> Dict[str, bytes]:
         logger.warning("SIGNATURES_BUCKET not set, skipping signature loading")
         return signatures
     
+    names = {name for name in professor_names if name}
+    if not names:
+        return signatures
+    
     try:
-        response = s3_client.list_objects_v2(
-            Bucket=signatures_bucket,
-            Prefix=signatures_prefix
-        )
-        
-        for obj in response.get('Contents', []):
-            key = obj['Key']
-            # Extract professor name from filename (e.g., "signatures/dr_jane_smith.png")
-            filename = os.path.basename(key)
-            name_part = os.path.splitext(filename)[0].replace('_', ' ').lower()
-            
-            try:
-                img_bytes = download_file_from_s3(signatures_bucket, key)
-                signatures[name_part] = img_bytes
-                logger.info(f"Loaded signature for: {name_part}")
-            except Exception as e:
-                logger.warning(f"Failed to load signature {key}: {str(e)}")
-                
+        index = get_signature_index(signatures_bucket, signatures_prefix)
+        if any(not any(key in index for key in signature_lookup_keys(name)) for name in names):
+            # the signature may have been uploaded after the index was built
+            index = get_signature_index(signatures_bucket, signatures_prefix, refresh=True)
     except Exception as e:
         logger.warning(f"Failed to list signatures: {str(e)}")
+        return signatures
+    
+    wanted = {key for name in names for key in signature_lookup_keys(name)}
+    found = {name: index[name] for name in wanted if name in index}
+    missing = sorted({obj for obj in found.values() if obj not in _SIGNATURE_BYTES})
+    
+    def fetch(obj: Tuple[str, str]) -> Tuple[Tuple[str, str], Optional[bytes]]:
+        try:
+            return obj, download_file_from_s3(signatures_bucket, obj[0])
+        except Exception as e:
+            logger.warning(f"Failed to load signature {obj[0]}: {str(e)}")
+            return obj, None
+    
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(SIGNATURE_FETCH_WORKERS, len(missing)))) as pool:
+            for obj, img_bytes in pool.map(fetch, missing):
+                if img_bytes is not None:
+                    _SIGNATURE_BYTES[obj] = img_bytes
+    
+    for name, obj in found.items():
+        if obj in _SIGNATURE_BYTES:
+            signatures[name] = _SIGNATURE_BYTES[obj]
+            logger.info(f"Loaded signature for: {name}")
     
     return signatures
 
@@ -417,10 +540,8 @@ def generate_diploma(
     
     # Try to find and draw signature image
     if professor_name:
-        professor_key = professor_name.lower().replace('.', '').replace(' ', '_')
-        
         # Try different name formats
-        for key in [professor_key, professor_name.lower()]:
+        for key in signature_lookup_keys(professor_name):
             if key in signatures:
                 try:
                     draw_signature(c, signatures[key], width, height)
@@ -581,7 +702,19 @@ def sanitize_filename(filename: str) -> str:
 
 def send_callback(url: str, data: Dict[str, Any]):
     """
-    Send a callback notification to the provided URL.
+    Queue a callback notification to the provided URL (delivered by CALLBACKS,
+    flushed before the handler returns).
+    
+    Args:
+        url: Callback URL
+        data: Data to send
+    """
+    CALLBACKS.post((url, data.get('batch_id')), lambda body: post_callback(url, body), data)
+
+
+def post_callback(url: str, data: Dict[str, Any]):
+    """
+    POST a callback notification; raises on failure.
     
     Args:
         url: Callback URL
@@ -589,17 +722,14 @@ def send_callback(url: str, data: Dict[str, Any]):
     """
     import urllib.request
     
-    try:
-        req = urllib.request.Request(
-            url,
-            data=json.dumps(data).encode('utf-8'),
-            headers={'Content-Type': 'application/json'},
-            method='POST'
-        )
-        with urllib.request.urlopen(req, timeout=10) as response:
-            logger.info(f"Callback sent successfully: {response.status}")
-    except Exception as e:
-        logger.error(f"Failed to send callback: {str(e)}")
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(data).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    with urllib.request.urlopen(req, timeout=10) as response:
+        logger.info(f"Callback sent successfully: {response.status}")
 
 
 # # For local testing
@@ -1,25 +1,35 @@
 import os
 import re
+import base64
 import csv
+import errno
 import json
 import uuid
+import hashlib
+import time
 import zipfile
 import logging
+import resource
+import shutil
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
 from io import BytesIO, StringIO
 from datetime import datetime
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Dict, Any, Optional, Tuple, List, Callable, Iterator, TYPE_CHECKING
 from urllib.parse import urlparse
-
-import boto3
-import requests
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfbase import pdfmetrics
-from reportlab.lib.utils import ImageReader
-from PIL import Image
 import unicodedata
 
+from secret_provider import SecretProvider
+from status_dispatch import StatusDispatcher, flush_timeout
+
+# boto3, requests, PyPDF2, reportlab and PIL are imported where they are first
+# used: a cold start only pays for what the invocation actually touches
+# (python benchmarks/bench_cold_start.py).
+if TYPE_CHECKING:
+    from reportlab.pdfgen import canvas
+
 
 # -----------------------------------------------------------------------------
 # Logging
@@ -30,10 +40,11 @@ logger.setLevel(logging.INFO)
 # -----------------------------------------------------------------------------
 # ENV VARS (required)
 # -----------------------------------------------------------------------------
-API_KEY = os.environ.get("MY-API-KEY")  # required
-if not API_KEY:
+API_KEY = os.environ.get("MY-API-KEY")  # required unless API_KEY_SSM_PARAM is set (then the fallback)
+API_KEY_SSM_PARAM = os.environ.get("API_KEY_SSM_PARAM", "")
+if not API_KEY and not API_KEY_SSM_PARAM:
     # raise at import time so you fail fast in Lambda configuration
-    raise RuntimeError("Missing required env var: MY-API-KEY")
+    raise RuntimeError("Missing required env var: MY-API-KEY (or API_KEY_SSM_PARAM)")
 
 ADMIN_BASE = os.environ.get("ADMIN_BASE", "https://admin.my-website.com/internal")
 RESOURCES_BASE_URL = os.environ.get("RESOURCES_BASE_URL", "https://resources.my-website.com")
@@ -46,10 +57,120 @@ if not RESOURCES_BUCKET:
 
 API_KEY_HEADER = "api-key-pohualizcalli"
 
+# Template + overlay merge implementation: "pypdf2" (default, pure Python) or
+# "pikepdf" (qpdf, native). pikepdf must be packaged separately when selected.
+PDF_MERGE_BACKEND = os.environ.get("PDF_MERGE_BACKEND", "pypdf2").strip().lower()
+
+# Content-addressed store of rendered diplomas (reprints are copied, not rendered).
+# S3 prefix inside RESOURCES_BUCKET, or a local directory stand-in. Disabled if neither is set.
+RENDER_STORE_PREFIX = os.environ.get("RENDER_STORE_PREFIX", "").strip("/")
+RENDER_STORE_DIR = os.environ.get("RENDER_STORE_DIR", "")
+# Bump whenever the drawing code changes the output bytes for the same inputs
+RENDER_STORE_VERSION = "1"
+
+# Pre-flight validation before rendering:
+#   "reject" (default) -> batch with problems is marked "error" and nothing is rendered
+#   "report"           -> problems are logged/returned, rows are still rendered one by one
+#   "off"              -> skip pre-flight
+PREFLIGHT_MODE = os.environ.get("PREFLIGHT_MODE", "reject").strip().lower()
+
+# CloudWatch Embedded Metric Format: one JSON log line per batch
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "DiplomaGenerator")
+EMIT_EMF_METRICS = os.environ.get("EMIT_EMF_METRICS", "true").strip().lower() not in ("0", "false", "no")
+
+# On-demand profiling: "cprofile" (pstats + sampled flamegraph) or "sample" (flamegraph only).
+# Per message with {"profile": true | "cprofile" | "sample"}; this env var turns it on for all.
+DIPLOMA_PROFILE = os.environ.get("DIPLOMA_PROFILE", "").strip().lower()
+PROFILE_SAMPLE_HZ = float(os.environ.get("PROFILE_SAMPLE_HZ", "200"))
+
+# Opt-in tracemalloc report (per-stage peaks, top allocation sites, global cache growth).
+# Per message with {"memory_report": true}; this env var turns it on for all batches.
+MEMORY_REPORT = os.environ.get("MEMORY_REPORT", "").strip().lower() in ("1", "true", "yes")
+MEMORY_TOP_N = int(os.environ.get("MEMORY_TOP_N", "10"))
+
+# Network I/O: "async" (default) runs downloads, admin API calls and render store reads/writes on a
+# background event loop (asyncio.to_thread) so they overlap rendering; "sync" keeps every call inline.
+IO_MODE = os.environ.get("IO_MODE", "async").strip().lower()
+IO_CONCURRENCY = int(os.environ.get("IO_CONCURRENCY", "8"))          # blocking calls in flight at once
+IO_PREFETCH_DEPTH = int(os.environ.get("IO_PREFETCH_DEPTH", "8"))    # render store reads ahead of rendering
+
+# Unique renders per chunk handed to a chunk runner (inline in Lambda, process pool in worker.py)
+RENDER_CHUNK_ROWS = int(os.environ.get("RENDER_CHUNK_ROWS", "50"))
+
+# Render parallelism: "auto" (CPU count + memory headroom, see ConcurrencyController),
+# a number (upper bound) or "1" (single process, original behaviour)
+RENDER_PROCESSES = os.environ.get("RENDER_PROCESSES", "auto").strip().lower()
+RENDER_PROCESS_MB = int(os.environ.get("RENDER_PROCESS_MB", "100"))   # memory budget per render process
+MEMORY_HIGH_WATERMARK = float(os.environ.get("MEMORY_HIGH_WATERMARK", "0.80"))
+MEMORY_CRITICAL_WATERMARK = float(os.environ.get("MEMORY_CRITICAL_WATERMARK", "0.90"))
+
+# Per-batch scratch directories (see ScratchSpace); budget 0 = 90% of the filesystem
+SCRATCH_ROOT = os.environ.get("SCRATCH_ROOT", "/tmp/diploma-batches")
+SCRATCH_BUDGET_MB = int(os.environ.get("SCRATCH_BUDGET_MB", "0"))
+SCRATCH_RESERVE_MB = int(os.environ.get("SCRATCH_RESERVE_MB", "16"))   # always left free on /tmp
+
+# Split the output into part-NNN.zip files past either limit (0 = no limit; see ShardedArchive)
+ARCHIVE_MAX_MB = int(os.environ.get("ARCHIVE_MAX_MB", "0"))
+ARCHIVE_MAX_ROWS = int(os.environ.get("ARCHIVE_MAX_ROWS", "0"))
+ARCHIVE_UPLOAD_THREADS = int(os.environ.get("ARCHIVE_UPLOAD_THREADS", "2"))
+
+# Archive entries: "auto" (deflate unless a sample shows the PDF barely shrinks), "deflate" or "store".
+# Compressed on ZIP_THREADS threads (0 = one per CPU); see ZipCompressor.
+ZIP_COMPRESSION = os.environ.get("ZIP_COMPRESSION", "auto").strip().lower()
+ZIP_STORE_RATIO = float(os.environ.get("ZIP_STORE_RATIO", "0.95"))
+ZIP_THREADS = int(os.environ.get("ZIP_THREADS", "0"))
+
+# Batch output: "zip" (default) or "objects" (one S3 object per diploma + JSON-lines manifest).
+# Per message with {"output_mode": "objects"}.
+OUTPUT_MODE = os.environ.get("OUTPUT_MODE", "zip").strip().lower()
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "16"))   # concurrent object uploads
+
+# Batch status PATCHes are queued and delivered by background threads (see status_dispatch.py);
+# failures retry with exponential backoff. Each invocation waits at most STATUS_FLUSH_SECONDS
+# (and never past the Lambda deadline) for the queue to drain before returning.
+STATUS_DISPATCH_THREADS = int(os.environ.get("STATUS_DISPATCH_THREADS", "2"))
+STATUS_MAX_ATTEMPTS = int(os.environ.get("STATUS_MAX_ATTEMPTS", "6"))
+STATUS_RETRY_BASE_SECONDS = float(os.environ.get("STATUS_RETRY_BASE_SECONDS", "0.5"))
+STATUS_RETRY_MAX_SECONDS = float(os.environ.get("STATUS_RETRY_MAX_SECONDS", "20"))
+STATUS_FLUSH_SECONDS = float(os.environ.get("STATUS_FLUSH_SECONDS", "10"))
+
+REQUIRED_CSV_COLUMNS = ("nombre", "curso", "fecha", "profesor")
+REQUIRED_LAYOUT_FIELDS = ("estudiante", "curso", "profesor-signature", "profesor", "fecha")
+
 # -----------------------------------------------------------------------------
 # AWS clients
 # -----------------------------------------------------------------------------
-s3 = boto3.client("s3")
+# Optional S3-compatible endpoint (local load harness, LocalStack, MinIO); path-style addressing
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+# HTTP connections kept by the shared client; must cover every concurrent upload thread
+S3_MAX_POOL_CONNECTIONS = int(
+    os.environ.get("S3_MAX_POOL_CONNECTIONS") or max(10, UPLOAD_CONCURRENCY + ARCHIVE_UPLOAD_THREADS)
+)
+
+s3 = None  # built on first use by get_s3()
+_S3_LOCK = threading.Lock()
+
+
+def get_s3():
+    """
+    Returns the shared S3 client, creating it on first use (boto3 import + client
+    construction is the single largest cold-start cost).
+    """
+    global s3
+    if s3 is None:
+        with _S3_LOCK:
+            if s3 is None:
+                import boto3
+                from botocore.config import Config
+                if S3_ENDPOINT_URL:
+                    s3 = boto3.client(
+                        "s3",
+                        endpoint_url=S3_ENDPOINT_URL,
+                        config=Config(s3={"addressing_style": "path"}, max_pool_connections=S3_MAX_POOL_CONNECTIONS),
+                    )
+                else:
+                    s3 = boto3.client("s3", config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+    return s3
 
 # -----------------------------------------------------------------------------
 # Globals (cached across warm invocations)
@@ -59,16 +180,117 @@ _SIGNATURES_BY_FILE: Optional[Dict[str, str]] = None      # normalized filename
 _TEMPLATE_PDF_BYTES: Optional[bytes] = None
 _FIELD_MAPPINGS: Optional[Dict[str, Any]] = None
 _SIGNATURE_BYTES_CACHE: Dict[str, bytes] = {}             # url -> raw image bytes
+_SIGNATURE_PNG_CACHE: Dict[Tuple[str, int], bytes] = {}   # (url, bg_threshold) -> transparent PNG bytes
+_SIGNATURE_DIGEST_CACHE: Dict[str, str] = {}              # url -> sha256 of the image bytes
+
+
+class SingleFlight:
+    """
+    One fetch per key at a time. The first caller for a key runs `fn`; callers
+    arriving while it runs wait and get the same value, or the same exception.
+    Nothing is remembered once the call finishes: the loaders keep successful
+    values in their own caches, and a failure is simply retried by the next
+    caller. So `fn` must check that cache again first: a caller that missed it
+    just before the previous fetch finished becomes the next leader.
+
+        _LOADS.do(("signature", url), lambda: cache.get(url) or http_get_bytes(url))
+    """
+
+    class _Call:
+        __slots__ = ("done", "value", "error")
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.value: Any = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, "SingleFlight._Call"] = {}
+        self.shared = 0   # calls that waited on another caller's fetch
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
 
-# PDF letter page width
-PAGE_WIDTH = letter[0]
+_LOADS = SingleFlight()   # warm_init loaders + signature downloads
+
+# PDF letter page size (reportlab.lib.pagesizes.letter)
+LETTER = (612.0, 792.0)
+PAGE_WIDTH = LETTER[0]
 
 
 # =============================================================================
 # HTTP helpers
 # =============================================================================
-def _headers() -> Dict[str, str]:
-    return {API_KEY_HEADER: API_KEY}
+_SSM = None
+
+
+def fetch_api_key() -> str:
+    """
+    The admin API key: SSM parameter API_KEY_SSM_PARAM (SecureString) when
+    configured, else the MY-API-KEY environment variable.
+    """
+    global _SSM
+    if not API_KEY_SSM_PARAM:
+        return API_KEY
+    if _SSM is None:
+        import boto3
+        _SSM = boto3.client("ssm")
+    logger.info("Fetching API key from SSM: %s", API_KEY_SSM_PARAM)
+    return _SSM.get_parameter(Name=API_KEY_SSM_PARAM, WithDecryption=True)["Parameter"]["Value"]
+
+
+# from SSM: serve MY-API-KEY (if any) until the first background fetch lands, refresh every TTL;
+# env only: read once, never refreshed
+API_KEY_SECRET = (
+    SecretProvider("api-key", fetch_api_key, fallback=API_KEY or None)
+    if API_KEY_SSM_PARAM
+    else SecretProvider("api-key", fetch_api_key, ttl=float("inf"))
+)
+
+
+def _headers(api_key: Optional[str] = None) -> Dict[str, str]:
+    return {API_KEY_HEADER: api_key or API_KEY_SECRET.get()}
+
+
+def _admin_request(method: str, url: str, **kwargs: Any) -> Any:
+    """
+    One admin API call; on 401 the API key is re-fetched once (rotated through
+    /internal/reload-api-key) and the call retried with the new key.
+    """
+    import requests
+    api_key = API_KEY_SECRET.get()
+    extra = kwargs.pop("headers", {})
+    r = requests.request(method, url, headers={**_headers(api_key), **extra}, **kwargs)
+    if r.status_code == 401:
+        fresh = API_KEY_SECRET.reload(api_key)
+        if fresh != api_key:
+            logger.info("%s %s returned 401; retrying with the reloaded API key", method, url)
+            r = requests.request(method, url, headers={**_headers(fresh), **extra}, **kwargs)
+    r.raise_for_status()
+    return r
 
 
 def admin_get(path: str) -> Any:
@@ -77,9 +299,7 @@ def admin_get(path: str) -> Any:
     """
     url = ADMIN_BASE.rstrip("/") + path
     logger.info("GET %s", url)
-    r = requests.get(url, headers=_headers(), timeout=30)
-    r.raise_for_status()
-    return r.json()
+    return _admin_request("GET", url, timeout=30).json()
 
 
 def admin_patch(path: str, payload: Dict[str, Any]) -> Any:
@@ -88,23 +308,560 @@ def admin_patch(path: str, payload: Dict[str, Any]) -> Any:
     """
     url = ADMIN_BASE.rstrip("/") + path
     logger.info("PATCH %s payload=%s", url, payload)
-    r = requests.patch(
-        url,
-        headers={**_headers(), "Content-Type": "application/json"},
-        json=payload,
-        timeout=30,
-    )
-    r.raise_for_status()
+    r = _admin_request("PATCH", url, headers={"Content-Type": "application/json"}, json=payload, timeout=30)
     return r.json() if r.content else None
 
 
+STATUS_UPDATES = StatusDispatcher(STATUS_DISPATCH_THREADS, STATUS_MAX_ATTEMPTS, STATUS_RETRY_BASE_SECONDS,
+                                  STATUS_RETRY_MAX_SECONDS)
+
+
+TERMINAL_STATUSES = ("completado", "error")
+
+
+class StatusUndelivered(RuntimeError):
+    """
+    A batch's final status (completado / error) did not reach the admin API
+    before the invocation ended: the message must go back to the queue.
+    """
+
+
+def batch_status_key(batch_id: Any) -> Tuple[str, str]:
+    # "9" and 9 (raw SQS body vs BatchPlan) are the same batch
+    return ("batch", str(batch_id))
+
+
+def post_batch_status(batch_id: Any, payload: Dict[str, Any]) -> None:
+    """
+    Queues PATCH /diploma-batches/<batch_id> on STATUS_UPDATES (coalesced per batch).
+    """
+    path = f"/diploma-batches/{batch_id}"
+    STATUS_UPDATES.post(batch_status_key(batch_id), lambda body: admin_patch(path, body), payload)
+
+
+def status_flush_timeout(context: Any) -> float:
+    """
+    STATUS_FLUSH_SECONDS, cut to leave one second of the Lambda's remaining time.
+    """
+    return flush_timeout(context, STATUS_FLUSH_SECONDS)
+
+
 def http_get_bytes(url: str, timeout: int = 60) -> bytes:
     logger.info("Downloading %s", url)
+    import requests
     r = requests.get(url, timeout=timeout)
     r.raise_for_status()
     return r.content
 
 
+# =============================================================================
+# Async I/O (network calls overlap each other and rendering)
+# =============================================================================
+def timed_call(fn: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    return fn(*args), time.perf_counter() - t0
+
+
+_IO_LOOP: Optional[Any] = None     # see io_loop()
+_IO_LOOP_LOCK = threading.Lock()
+
+
+def io_loop() -> Any:
+    """
+    The process's asyncio loop for AsyncIO, on a daemon thread started on first
+    use and kept for the life of the process, so open_io() starts no thread or
+    executor per call. The executor has room for a few AsyncIO users at once
+    (worker-mode batches); each holds itself to its own `concurrency`.
+    """
+    global _IO_LOOP
+    with _IO_LOOP_LOCK:
+        if _IO_LOOP is None:
+            import asyncio
+            from concurrent.futures import ThreadPoolExecutor
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=IO_CONCURRENCY * 4, thread_name_prefix="io"))
+            threading.Thread(target=loop.run_forever, name="async-io", daemon=True).start()
+            _IO_LOOP = loop
+        return _IO_LOOP
+
+
+def _forget_io_loop() -> None:
+    global _IO_LOOP, _IO_LOOP_LOCK
+    _IO_LOOP = None                     # its thread did not survive the fork
+    _IO_LOOP_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_io_loop)
+
+
+class AsyncIO:
+    """
+    A session on the process's asyncio loop (io_loop()). The blocking calls
+    (requests / boto3) run through asyncio.to_thread, at most `concurrency`
+    at once, so downloads, admin API calls and S3 reads/writes proceed while
+    the calling thread renders:
+
+        with open_io() as io:
+            for key, pdf in io.prefetch(render_store_get, keys):   # bounded window ahead
+                ...
+            io.submit(render_store_put, key, pdf)                  # waited for on close
+
+    Results come back as values; a failed call yields its exception.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None):
+        import asyncio
+        self.concurrency = max(1, concurrency or IO_CONCURRENCY)
+        self.loop = io_loop()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._submitted: List[Any] = []   # submit(): waited for on close
+        self._prefetched: List[Any] = []  # prefetch(): cancelled on close if never consumed
+
+    async def _call(self, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+        import asyncio
+        async with self._slots:
+            return await asyncio.to_thread(fn, *args)
+
+    def _future(self, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(self._call(fn, args), self.loop)
+
+    @staticmethod
+    def _outcome(future: Any) -> Any:
+        try:
+            return future.result()
+        except Exception as e:
+            return e
+
+    def gather(self, calls: List[Tuple[Callable[..., Any], Tuple[Any, ...]]]) -> List[Any]:
+        futures = [self._future(fn, args) for fn, args in calls]
+        return [self._outcome(f) for f in futures]
+
+    def prefetch(self, fn: Callable[[Any], Any], keys: List[Any], depth: Optional[int] = None) -> Iterator[Tuple[Any, Any]]:
+        """
+        Yields (key, fn(key)) in key order, keeping up to `depth` calls running
+        or finished ahead of the consumer (IO_PREFETCH_DEPTH).
+        """
+        depth = max(1, depth or IO_PREFETCH_DEPTH)
+        window: List[Tuple[Any, Any]] = []
+        pending = list(keys)
+        pending.reverse()
+        while pending or window:
+            while pending and len(window) < depth:
+                key = pending.pop()
+                future = self._future(fn, (key,))
+                self._prefetched.append(future)
+                window.append((key, future))
+            key, future = window.pop(0)
+            yield key, self._outcome(future)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        """
+        Fire-and-forget; close() waits for it, so `fn` must handle its own errors.
+        """
+        self._submitted.append(self._future(fn, args))
+
+    def close(self) -> None:
+        # the loop stays up for the next session; cancelled prefetches unwind on it
+        for future in self._prefetched:
+            future.cancel()
+        for future in self._submitted:
+            self._outcome(future)
+
+    def __enter__(self) -> "AsyncIO":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class SyncIO(AsyncIO):
+    """
+    IO_MODE=sync: same interface, every call runs inline in the calling thread.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None):
+        pass
+
+    def gather(self, calls: List[Tuple[Callable[..., Any], Tuple[Any, ...]]]) -> List[Any]:
+        out = []
+        for fn, args in calls:
+            try:
+                out.append(fn(*args))
+            except Exception as e:
+                out.append(e)
+        return out
+
+    def prefetch(self, fn: Callable[[Any], Any], keys: List[Any], depth: Optional[int] = None) -> Iterator[Tuple[Any, Any]]:
+        for key in keys:
+            yield key, self.gather([(fn, (key,))])[0]
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        fn(*args)
+
+    def close(self) -> None:
+        pass
+
+
+def open_io(concurrency: Optional[int] = None) -> AsyncIO:
+    return SyncIO() if IO_MODE == "sync" else AsyncIO(concurrency)
+
+
+# =============================================================================
+# Batch metrics (stage timers + counters, CloudWatch EMF)
+# =============================================================================
+# Metric names are part of the dashboard contract: add new ones, do not rename.
+METRIC_STAGES = (
+    "Init",          # warm_init: admin API + template download
+    "CsvDownload",   # CSV download + parse
+    "Preflight",
+    "RenderStore",   # content-addressed store lookups / writes
+    "Render",        # overlay drawing (incl. signature fetch)
+    "Merge",         # template + overlay merge
+    "WriteFiles",    # PDFs + result CSV to /tmp
+    "Zip",
+    "S3Upload",
+    "StatusUpdate",  # PATCH /diploma-batches/{id}
+)
+METRIC_COUNTERS = (
+    "Rows",
+    "RowsRendered",
+    "RowErrors",
+    "DuplicateRows",
+    "RenderStoreHits",
+    "RenderStoreMisses",
+    "NormalizationHits",
+    "NormalizationMisses",
+    "BytesWritten",
+    "ZipBytes",
+    "ObjectsUploaded",
+)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+class BatchMetrics:
+    """
+    Wall-clock time per stage and counters for one batch.
+
+        metrics = BatchMetrics()
+        with metrics.stage("Zip"):
+            ...
+        metrics.incr("RowsRendered")
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stage_seconds: Dict[str, float] = {name: 0.0 for name in METRIC_STAGES}
+        self.counters: Dict[str, int] = {name: 0 for name in METRIC_COUNTERS}
+        self.memory: Optional["MemoryTracker"] = None
+
+    def begin(self, name: str) -> float:
+        if self.memory is not None:
+            self.memory.enter(name)
+        return time.perf_counter()
+
+    def end(self, name: str, started: float) -> None:
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + (time.perf_counter() - started)
+        if self.memory is not None:
+            self.memory.exit(name)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name, t0)
+
+    def incr(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Adds stage seconds / counters recorded elsewhere (a chunk rendered in
+        another process). Stage times then sum work across processes.
+        """
+        for name, sec in other.get("stageSeconds", {}).items():
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + sec
+        for name, value in other.get("counters", {}).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "batchMs": round(elapsed * 1000.0, 1),
+            "stagesMs": {name: round(sec * 1000.0, 1) for name, sec in self.stage_seconds.items()},
+            "counters": dict(self.counters),
+            "rowsPerSec": round(self.counters["Rows"] / elapsed, 2) if elapsed > 0 else 0.0,
+            "peakRssMb": peak_rss_mb(),
+        }
+
+    def emit_emf(self, status: str, properties: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Prints one CloudWatch Embedded Metric Format line (stdout, not the logger:
+        EMF lines must be bare JSON). Dimension: FunctionName.
+        """
+        if not EMIT_EMF_METRICS:
+            return
+        summary = self.summary()
+        values: Dict[str, Tuple[float, str]] = {
+            "BatchMs": (summary["batchMs"], "Milliseconds"),
+            "RowsPerSec": (summary["rowsPerSec"], "Count/Second"),
+            "PeakRssMb": (summary["peakRssMb"], "Megabytes"),
+        }
+        for name, ms in summary["stagesMs"].items():
+            values[f"{name}Ms"] = (ms, "Milliseconds")
+        for name, count in summary["counters"].items():
+            values[name] = (count, "Bytes" if "Bytes" in name else "Count")
+
+        doc: Dict[str, Any] = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["FunctionName"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in values.items()],
+                }],
+            },
+            "FunctionName": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "diploma-generator"),
+            "Status": status,
+        }
+        doc.update(properties or {})
+        doc.update({name: value for name, (value, _) in values.items()})
+        print(json.dumps(doc, default=str), flush=True)
+
+
+# =============================================================================
+# Memory instrumentation (opt-in, tracemalloc)
+# =============================================================================
+# Sizes of the module-level caches / leftover /tmp files at the end of the previous batch
+_PREVIOUS_CACHE_SIZES: Dict[str, int] = {}
+
+
+def memory_report_enabled(msg: Dict[str, Any]) -> bool:
+    return bool(msg.get("memory_report", MEMORY_REPORT))
+
+
+def global_cache_sizes() -> Dict[str, int]:
+    """
+    Current size of everything that survives between warm invocations.
+    """
+    tmp_bytes = 0
+    tmp_entries = 0
+    try:
+        tmp_entries = len(os.listdir("/tmp"))
+        for root, _, files in os.walk("/tmp"):
+            for filename in files:
+                try:
+                    tmp_bytes += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+    return {
+        "signatureBytesCacheBytes": sum(len(b) for b in _SIGNATURE_BYTES_CACHE.values()),
+        "signatureBytesCacheEntries": len(_SIGNATURE_BYTES_CACHE),
+        "signaturePngCacheBytes": sum(len(b) for b in _SIGNATURE_PNG_CACHE.values()),
+        "signaturePngCacheEntries": len(_SIGNATURE_PNG_CACHE),
+        "templatePdfBytes": len(_TEMPLATE_PDF_BYTES or b""),
+        "signatureIndexEntries": len(_SIGNATURES_BY_NAME or {}) + len(_SIGNATURES_BY_FILE or {}),
+        "tmpBytes": tmp_bytes,
+        "tmpEntries": tmp_entries,
+    }
+
+
+def cache_growth_report() -> Dict[str, Dict[str, Optional[int]]]:
+    """
+    {name: {"current", "previous", "growth"}} against the previous batch in this container.
+    "previous" is None on the first batch of a container.
+    """
+    global _PREVIOUS_CACHE_SIZES
+    current = global_cache_sizes()
+    report = {
+        name: {
+            "current": value,
+            "previous": _PREVIOUS_CACHE_SIZES.get(name),
+            "growth": value - _PREVIOUS_CACHE_SIZES.get(name, 0),
+        }
+        for name, value in current.items()
+    }
+    _PREVIOUS_CACHE_SIZES = current
+    return report
+
+
+class MemoryTracker:
+    """
+    tracemalloc-based memory report for one batch.
+
+    Stage peaks are the highest traced memory (KiB) seen while that stage ran;
+    top allocation sites are the lines whose retained memory grew the most
+    between batch start and end (leak candidates).
+    """
+
+    def __init__(self, top_n: int = MEMORY_TOP_N):
+        self.top_n = top_n
+        self.stage_peaks: Dict[str, int] = {}
+        self.overall_peak = 0
+        self._owns_tracing = False
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self._baseline = tracemalloc.take_snapshot()
+
+    def enter(self, name: str) -> None:
+        _, peak = tracemalloc.get_traced_memory()
+        self.overall_peak = max(self.overall_peak, peak)
+        tracemalloc.reset_peak()
+
+    def exit(self, name: str) -> None:
+        _, peak = tracemalloc.get_traced_memory()
+        self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak)
+        self.overall_peak = max(self.overall_peak, peak)
+
+    def report(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        self.overall_peak = max(self.overall_peak, peak)
+
+        top: List[Dict[str, Any]] = []
+        if self._baseline is not None:
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            end = tracemalloc.take_snapshot().filter_traces(ignore)
+            for stat in end.compare_to(self._baseline.filter_traces(ignore), "lineno")[: self.top_n]:
+                frame = stat.traceback[0]
+                top.append({
+                    "site": f"{frame.filename}:{frame.lineno}",
+                    "sizeKb": round(stat.size / 1024.0, 1),
+                    "growthKb": round(stat.size_diff / 1024.0, 1),
+                    "count": stat.count,
+                })
+
+        if self._owns_tracing:
+            tracemalloc.stop()
+
+        return {
+            "tracedPeakKb": round(self.overall_peak / 1024.0, 1),
+            "tracedEndKb": round(current / 1024.0, 1),
+            "stagePeakKb": {name: round(v / 1024.0, 1) for name, v in self.stage_peaks.items()},
+            "topAllocations": top,
+            "globalCaches": cache_growth_report(),
+            "peakRssMb": peak_rss_mb(),
+        }
+
+
+# =============================================================================
+# On-demand profiling (artifacts uploaded next to the ZIP)
+# =============================================================================
+def profile_mode(msg: Dict[str, Any]) -> str:
+    """
+    "" (off), "cprofile" or "sample". Message flag wins over DIPLOMA_PROFILE.
+    """
+    flag = msg.get("profile", DIPLOMA_PROFILE)
+    if flag is True:
+        return "cprofile"
+    value = str(flag or "").strip().lower()
+    if value in ("", "0", "false", "off", "no"):
+        return ""
+    return "sample" if value == "sample" else "cprofile"
+
+
+class BatchProfiler:
+    """
+    Profiles the calling thread between start() and stop().
+
+    - "cprofile": deterministic cProfile (pstats) + stack sampler
+    - "sample":   stack sampler only (low overhead)
+
+    The sampler reads the thread's current frame PROFILE_SAMPLE_HZ times per
+    second and aggregates collapsed stacks ("a;b;c <count>"), the input format
+    of flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.samples: Dict[str, int] = {}
+        self.sample_count = 0
+        self._profile = None
+        self._target_thread = 0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._target_thread = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample_loop, name="batch-profiler", daemon=True)
+        self._sampler.start()
+        if self.mode == "cprofile":
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=2)
+
+    def _sample_loop(self) -> None:
+        interval = 1.0 / max(PROFILE_SAMPLE_HZ, 1.0)
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(self._target_thread)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+            self.sample_count += 1
+
+    def pstats_bytes(self) -> Optional[bytes]:
+        """
+        Same format as pstats.Stats.dump_stats (load with pstats.Stats(path)).
+        """
+        if self._profile is None:
+            return None
+        import marshal
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)
+
+    def collapsed_bytes(self) -> bytes:
+        lines = [f"{stack} {count}" for stack, count in sorted(self.samples.items())]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def upload_profile(profiler: BatchProfiler, msg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Uploads <original_file>.profile.pstats / .profile.collapsed.txt under diploma-generated/.
+    Never raises: profiling must not change the batch outcome.
+    """
+    info: Dict[str, Any] = {"mode": profiler.mode, "samples": profiler.sample_count}
+    try:
+        _, _, parent_prefix, original_file = extract_process_and_paths(msg["csv_url"])
+        base_key = f"{parent_prefix}/diploma-generated/{original_file}.profile"
+
+        pstats_data = profiler.pstats_bytes()
+        if pstats_data is not None:
+            info["pstatsUrl"] = upload_bytes_to_s3(f"{base_key}.pstats", pstats_data, "application/octet-stream")
+        info["flamegraphUrl"] = upload_bytes_to_s3(
+            f"{base_key}.collapsed.txt", profiler.collapsed_bytes(), "text/plain; charset=utf-8"
+        )
+        logger.info("Profile uploaded: %s", info)
+    except Exception as e:
+        logger.warning("Profile upload failed: %s", e)
+        info["error"] = str(e)
+    return info
+
+
 # =============================================================================
 # Normalization + mapping
 # =============================================================================
@@ -135,10 +892,15 @@ def load_signatures_once() -> Tuple[Dict[str, str], Dict[str, str]]:
       - by name/professorName
       - by filename (url basename)
     """
-    global _SIGNATURES_BY_NAME, _SIGNATURES_BY_FILE
     if _SIGNATURES_BY_NAME is not None and _SIGNATURES_BY_FILE is not None:
         return _SIGNATURES_BY_NAME, _SIGNATURES_BY_FILE
+    return _LOADS.do("signatures", _fetch_signatures)
 
+
+def _fetch_signatures() -> Tuple[Dict[str, str], Dict[str, str]]:
+    global _SIGNATURES_BY_NAME, _SIGNATURES_BY_FILE
+    if _SIGNATURES_BY_NAME is not None and _SIGNATURES_BY_FILE is not None:
+        return _SIGNATURES_BY_NAME, _SIGNATURES_BY_FILE   # loaded while this caller waited to lead
     data = admin_get("/signatures")
     sigs = data.get("signatures", [])
 
@@ -179,10 +941,15 @@ def load_template_once() -> bytes:
     Downloads template PDF once and caches.
     Also writes it to /tmp/template.pdf for debugging / repeatability.
     """
-    global _TEMPLATE_PDF_BYTES
     if _TEMPLATE_PDF_BYTES is not None:
         return _TEMPLATE_PDF_BYTES
+    return _LOADS.do("template", _fetch_template)
 
+
+def _fetch_template() -> bytes:
+    global _TEMPLATE_PDF_BYTES
+    if _TEMPLATE_PDF_BYTES is not None:
+        return _TEMPLATE_PDF_BYTES   # loaded while this caller waited to lead
     data = admin_get("/templates/active")
     template = data.get("template") or {}
     template_url = template.get("url")
@@ -209,10 +976,15 @@ def load_configuration_once() -> Dict[str, Any]:
       GET /configuration
     Caches fieldMappings only.
     """
-    global _FIELD_MAPPINGS
     if _FIELD_MAPPINGS is not None:
         return _FIELD_MAPPINGS
+    return _LOADS.do("configuration", _fetch_configuration)
 
+
+def _fetch_configuration() -> Dict[str, Any]:
+    global _FIELD_MAPPINGS
+    if _FIELD_MAPPINGS is not None:
+        return _FIELD_MAPPINGS   # loaded while this caller waited to lead
     data = admin_get("/configuration")
     field_mappings = data.get("fieldMappings")
     if not field_mappings:
@@ -225,11 +997,31 @@ def load_configuration_once() -> Dict[str, Any]:
 
 def warm_init():
     """
-    Force initialization so it happens once per warm container.
+    Force initialization so it happens once per warm container. The three
+    loaders are independent and run concurrently (IO_MODE=sync: in order).
+    """
+    if _SIGNATURES_BY_NAME is not None and _TEMPLATE_PDF_BYTES is not None and _FIELD_MAPPINGS is not None:
+        return   # warm: nothing to load, no loop needed
+    with open_io() as io:
+        results = io.gather([(load_signatures_once, ()), (load_template_once, ()), (load_configuration_once, ())])
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+
+def reset_init_caches():
+    """
+    Drops everything warm_init and the signature caches hold, so the next call
+    re-fetches signatures, template and configuration (e.g. after a template change).
     """
-    load_signatures_once()
-    load_template_once()
-    load_configuration_once()
+    global _SIGNATURES_BY_NAME, _SIGNATURES_BY_FILE, _TEMPLATE_PDF_BYTES, _FIELD_MAPPINGS
+    _SIGNATURES_BY_NAME = None
+    _SIGNATURES_BY_FILE = None
+    _TEMPLATE_PDF_BYTES = None
+    _FIELD_MAPPINGS = None
+    _SIGNATURE_BYTES_CACHE.clear()
+    _SIGNATURE_PNG_CACHE.clear()
+    _SIGNATURE_DIGEST_CACHE.clear()
 
 
 # =============================================================================
@@ -251,12 +1043,12 @@ def hex_to_rgb01(hex_color: str):
     return (r, g, b)
 
 
-def set_fill_hex(c: canvas.Canvas, hex_color: str):
+def set_fill_hex(c: "canvas.Canvas", hex_color: str):
     r, g, b = hex_to_rgb01(hex_color)
     c.setFillColorRGB(r, g, b)
 
 
-def apply_font(c: canvas.Canvas, font_cfg: dict):
+def apply_font(c: "canvas.Canvas", font_cfg: dict):
     c.setFont(font_cfg["name"], float(font_cfg["size"]))
     set_fill_hex(c, font_cfg.get("color", "#000000"))
 
@@ -265,6 +1057,8 @@ def image_bytes_to_png_bytes_with_transparency(raw_bytes: bytes, bg_threshold: i
     """
     Same idea as your function, but takes raw bytes from URL instead of local path.
     """
+    from PIL import Image
+
     im = Image.open(BytesIO(raw_bytes))
 
     # If GIF has multiple frames, take the first frame
@@ -292,6 +1086,8 @@ def image_bytes_to_png_bytes_with_transparency(raw_bytes: bytes, bg_threshold: i
 
 
 def centered_x_in_range(text: str, x_min: float, x_max: float, font_name: str, font_size: float) -> float:
+    from reportlab.pdfbase import pdfmetrics
+
     width = pdfmetrics.stringWidth(text, font_name, font_size)
     center = (x_min + x_max) / 2.0
     x = center - (width / 2.0)
@@ -305,6 +1101,20 @@ def centered_x_in_range(text: str, x_min: float, x_max: float, font_name: str, f
     return x
 
 
+_MESES = [
+    "enero", "febrero", "marzo", "abril", "mayo", "junio",
+    "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
+]
+
+# (strptime format, precompiled pattern) tried in order
+_FECHA_FORMATOS = [
+    ("%Y-%m-%d", re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$")),
+    ("%Y/%m/%d", re.compile(r"^\d{4}/\d{1,2}/\d{1,2}$")),
+    ("%d-%m-%Y", re.compile(r"^\d{1,2}-\d{1,2}-\d{4}$")),
+    ("%d/%m/%Y", re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$")),
+]
+
+
 def fecha_a_espanol(fecha_str: str) -> str:
     """
     Same as your improved version:
@@ -315,23 +1125,11 @@ def fecha_a_espanol(fecha_str: str) -> str:
         return fecha_str
 
     fecha_str = fecha_str.strip()
-    meses = [
-        "enero", "febrero", "marzo", "abril", "mayo", "junio",
-        "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
-    ]
-
-    formatos = [
-        ("%Y-%m-%d", r"^\d{4}-\d{1,2}-\d{1,2}$"),
-        ("%Y/%m/%d", r"^\d{4}/\d{1,2}/\d{1,2}$"),
-        ("%d-%m-%Y", r"^\d{1,2}-\d{1,2}-\d{4}$"),
-        ("%d/%m/%Y", r"^\d{1,2}/\d{1,2}/\d{4}$"),
-    ]
-
-    for fmt, regex in formatos:
-        if re.match(regex, fecha_str):
+    for fmt, pattern in _FECHA_FORMATOS:
+        if pattern.match(fecha_str):
             try:
                 fecha = datetime.strptime(fecha_str, fmt)
-                mes = meses[fecha.month - 1]
+                mes = _MESES[fecha.month - 1]
                 return f"{mes} de {fecha.year}"
             except ValueError:
                 pass
@@ -346,15 +1144,207 @@ def clean_name(name: str) -> str:
     return cleaned
 
 
+def normalize_diploma_fields(nombre: str, curso: str, fecha: str, profesor_value: str) -> Tuple[str, str, str, str]:
+    """
+    User-visible values exactly as they are drawn on the diploma:
+      (nombre capitalized, curso upper, fecha in Spanish, profesor stripped)
+    """
+    nombre_pretty = " ".join(word.capitalize() for word in str(nombre).split())
+    curso_upper = str(curso).upper()
+    fecha_out = fecha_a_espanol(str(fecha).strip())
+    profesor_text = str(profesor_value).strip()
+    return nombre_pretty, curso_upper, fecha_out, profesor_text
+
+
+class NormalizationCache:
+    """
+    Per-batch memo of field normalizations.
+
+    fecha / curso / profesor usually have a handful of distinct values in a
+    batch, so each distinct (interned) value is transformed once and reused.
+    Hits/misses are counted per transformation.
+    """
+
+    def __init__(self):
+        self._interned: Dict[str, str] = {}
+        self._tables: Dict[str, Dict[str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, value: str) -> str:
+        return self._interned.setdefault(value, value)
+
+    def _memo(self, table_name: str, value: str, fn: Callable[[str], str]) -> str:
+        table = self._tables.setdefault(table_name, {})
+        out = table.get(value)
+        if out is not None:
+            self.hits += 1
+            return out
+        self.misses += 1
+        out = self.intern(fn(value))
+        table[self.intern(value)] = out
+        return out
+
+    def nombre(self, value: str) -> str:
+        return self._memo("nombre", str(value), lambda v: " ".join(word.capitalize() for word in v.split()))
+
+    def curso(self, value: str) -> str:
+        return self._memo("curso", str(value), str.upper)
+
+    def fecha(self, value: str) -> str:
+        return self._memo("fecha", str(value), lambda v: fecha_a_espanol(v.strip()))
+
+    def profesor(self, value: str) -> str:
+        return self._memo("profesor", str(value), str.strip)
+
+    def clean_name(self, value: str) -> str:
+        return self._memo("clean_name", str(value), clean_name)
+
+    def fields(self, nombre: str, curso: str, fecha: str, profesor_value: str) -> Tuple[str, str, str, str]:
+        """
+        Same result as normalize_diploma_fields, memoized.
+        """
+        return self.nombre(nombre), self.curso(curso), self.fecha(fecha), self.profesor(profesor_value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "distinctValues": {name: len(table) for name, table in self._tables.items()},
+        }
+
+
+def row_content_hash(fields: Tuple[str, ...], signature_url: Optional[str], signature_digest: Optional[str]) -> str:
+    """
+    Stable hash of normalized row content (+ signature used, by URL and by image
+    bytes: a signature re-uploaded under the same URL changes the hash).
+    Two rows with the same hash render to the same PDF.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for value in (*fields, signature_url or "", signature_digest or ""):
+        h.update(value.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
 def get_signature_bytes(signature_url: str) -> bytes:
     """
-    Downloads signature bytes once per URL per warm container.
+    Downloads signature bytes once per URL per warm container (concurrent
+    callers for the same URL share one download).
+    """
+    b = _SIGNATURE_BYTES_CACHE.get(signature_url)
+    if b is not None:
+        return b
+
+    def fetch() -> bytes:
+        cached = _SIGNATURE_BYTES_CACHE.get(signature_url)
+        if cached is not None:
+            return cached   # downloaded while this caller waited to lead
+        data = http_get_bytes(signature_url, timeout=60)
+        _SIGNATURE_BYTES_CACHE[signature_url] = data
+        return data
+
+    return _LOADS.do(("signature", signature_url), fetch)
+
+
+def get_signature_digest(signature_url: str) -> Optional[str]:
+    """
+    sha256 of the signature image, or None when it cannot be downloaded (the
+    diploma is then rendered without it and kept out of the render store).
+    """
+    digest = _SIGNATURE_DIGEST_CACHE.get(signature_url)
+    if digest is None:
+        try:
+            data = get_signature_bytes(signature_url)
+        except Exception as e:
+            logger.warning("Signature download failed (%s): %s; retried when rendering", signature_url, e)
+            return None
+        digest = _SIGNATURE_DIGEST_CACHE[signature_url] = hashlib.sha256(data).hexdigest()
+    return digest
+
+
+def get_signature_png(signature_url: str, bg_threshold: int = 245) -> bytes:
+    """
+    Transparent PNG for a signature, converted once per (url, bg_threshold)
+    per warm container instead of once per rendered row.
+    """
+    key = (signature_url, bg_threshold)
+    png = _SIGNATURE_PNG_CACHE.get(key)
+    if png is None:
+        raw = get_signature_bytes(signature_url)
+        png = image_bytes_to_png_bytes_with_transparency(raw, bg_threshold=bg_threshold).getvalue()
+        _SIGNATURE_PNG_CACHE[key] = png
+    return png
+
+
+# =============================================================================
+# PDF merge backends (template page + rendered overlay -> single-page PDF)
+# =============================================================================
+def merge_overlay_pypdf2(template_pdf_bytes: bytes, overlay_pdf_bytes: bytes) -> bytes:
+    """
+    Pure Python merge with PyPDF2 merge_page (original behaviour).
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+
+    overlay_reader = PdfReader(BytesIO(overlay_pdf_bytes))
+    base_reader = PdfReader(BytesIO(template_pdf_bytes))
+    page = base_reader.pages[0]
+    page.merge_page(overlay_reader.pages[0])
+
+    writer = PdfWriter()
+    writer.add_page(page)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def merge_overlay_pikepdf(template_pdf_bytes: bytes, overlay_pdf_bytes: bytes) -> bytes:
+    """
+    Native merge with pikepdf (qpdf). The overlay is placed on its own mediabox
+    so coordinates match merge_page exactly (no scaling / centering).
+    Only the first template page is kept, same as the PyPDF2 path.
+    The overlay is drawn as a Form XObject with a fixed name (Page.add_overlay
+    picks a random one), so the same inputs give byte-identical output and the
+    render store can reuse it.
+    """
+    try:
+        import pikepdf
+    except ImportError as e:
+        raise RuntimeError("PDF_MERGE_BACKEND=pikepdf requires the 'pikepdf' package") from e
+
+    with pikepdf.open(BytesIO(template_pdf_bytes)) as base, pikepdf.open(BytesIO(overlay_pdf_bytes)) as overlay:
+        del base.pages[1:]
+        page = base.pages[0]
+        form = base.copy_foreign(overlay.pages[0].as_form_xobject())
+        name = page.add_resource(form, pikepdf.Name.XObject, pikepdf.Name("/DiplomaOverlay"))
+        # template content in its own graphics state, then the overlay (identity transform:
+        # the form's BBox is the overlay mediabox, drawn in page coordinates like merge_page)
+        page.contents_add(base.make_stream(b"q\n"), prepend=True)
+        page.contents_add(base.make_stream(b"Q\nq\n" + bytes(name) + b" Do\nQ\n"))
+
+        out = BytesIO()
+        # /ID derived from content instead of random, so output is reproducible
+        base.save(out, deterministic_id=True)
+        return out.getvalue()
+
+
+MERGE_BACKENDS: Dict[str, Callable[[bytes, bytes], bytes]] = {
+    "pypdf2": merge_overlay_pypdf2,
+    "pikepdf": merge_overlay_pikepdf,
+}
+
+
+def get_merge_backend(name: Optional[str] = None) -> Callable[[bytes, bytes], bytes]:
+    """
+    Returns the merge function for `name` (defaults to PDF_MERGE_BACKEND env var).
     """
-    if signature_url in _SIGNATURE_BYTES_CACHE:
-        return _SIGNATURE_BYTES_CACHE[signature_url]
-    b = http_get_bytes(signature_url, timeout=60)
-    _SIGNATURE_BYTES_CACHE[signature_url] = b
-    return b
+    key = (name or PDF_MERGE_BACKEND).strip().lower()
+    try:
+        return MERGE_BACKENDS[key]
+    except KeyError:
+        raise ValueError(f"Unknown PDF merge backend {key!r} (expected one of {sorted(MERGE_BACKENDS)})")
 
 
 def generate_one_pdf_bytes(
@@ -365,20 +1355,30 @@ def generate_one_pdf_bytes(
     fecha: str,
     profesor_value: str,
     signature_url: Optional[str],
+    merge_backend: Optional[str] = None,
+    normalizer: Optional[NormalizationCache] = None,
+    metrics: Optional[BatchMetrics] = None,
 ) -> bytes:
     """
     Produces filled diploma as PDF bytes.
     Uses layout keys exactly as returned by /internal/configuration:
       estudiante, curso, profesor-signature, profesor, fecha
+    merge_backend overrides PDF_MERGE_BACKEND (see MERGE_BACKENDS).
+    normalizer: per-batch NormalizationCache (optional).
+    metrics: when given, overlay time goes to "Render" and merge time to "Merge".
     """
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.lib.utils import ImageReader
+
+    t_render = metrics.begin("Render") if metrics is not None else 0.0
     # Normalize user-visible values
-    nombre_pretty = " ".join(word.capitalize() for word in str(nombre).split())
-    curso_upper = str(curso).upper()
-    fecha_out = fecha_a_espanol(str(fecha).strip())
-    profesor_text = str(profesor_value).strip()
+    normalize = normalizer.fields if normalizer is not None else normalize_diploma_fields
+    nombre_pretty, curso_upper, fecha_out, profesor_text = normalize(nombre, curso, fecha, profesor_value)
 
     buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
+    # invariant: fixed creation date + document ID, same input -> same bytes
+    c = canvas.Canvas(buffer, pagesize=LETTER, invariant=1)
 
     # ------------------------------
     # ESTUDIANTE (centered by page)
@@ -421,9 +1421,7 @@ def generate_one_pdf_bytes(
 
     if signature_url:
         try:
-            raw_sig = get_signature_bytes(signature_url)
-            png_bytes = image_bytes_to_png_bytes_with_transparency(raw_sig, bg_threshold=bg_threshold)
-            img = ImageReader(png_bytes)
+            img = ImageReader(BytesIO(get_signature_png(signature_url, bg_threshold)))
 
             c.drawImage(
                 img,
@@ -457,19 +1455,14 @@ def generate_one_pdf_bytes(
 
     # finalize overlay
     c.save()
-    buffer.seek(0)
 
-    overlay_reader = PdfReader(buffer)
-    base_reader = PdfReader(BytesIO(template_pdf_bytes))
-    page = base_reader.pages[0]
-    page.merge_page(overlay_reader.pages[0])
+    merge = get_merge_backend(merge_backend)
+    if metrics is None:
+        return merge(template_pdf_bytes, buffer.getvalue())
 
-    writer = PdfWriter()
-    writer.add_page(page)
-    out = BytesIO()
-    writer.write(out)
-    out.seek(0)
-    return out.getvalue()
+    metrics.end("Render", t_render)
+    with metrics.stage("Merge"):
+        return merge(template_pdf_bytes, buffer.getvalue())
 
 
 # =============================================================================
@@ -496,6 +1489,15 @@ def parse_csv_rows(csv_bytes: bytes) -> List[Dict[str, str]]:
     return rows
 
 
+def parse_csv_header(csv_bytes: bytes) -> List[str]:
+    """
+    Column names of the first CSV line (normalized: stripped, lower case).
+    """
+    text = csv_bytes.decode("utf-8-sig")
+    first_line = next(csv.reader(StringIO(text)), [])
+    return [normalize_key(col) for col in first_line]
+
+
 def extract_process_and_paths(csv_url: str) -> Tuple[str, str, str, str]:
     """
     From csv_url:
@@ -520,7 +1522,31 @@ def extract_process_and_paths(csv_url: str) -> Tuple[str, str, str, str]:
     return path_rel, process_folder, parent_prefix, original_file
 
 
-def upload_zip_to_s3(zip_path: str, parent_prefix: str, original_file: str) -> str:
+def upload_bytes_to_s3(key: str, data: bytes, content_type: str) -> str:
+    """
+    Upload small in-memory artifacts; returns https://resources.../<key>
+    """
+    logger.info("Uploading %d bytes to s3://%s/%s", len(data), RESOURCES_BUCKET, key)
+    get_s3().put_object(Bucket=RESOURCES_BUCKET, Key=key, Body=data, ContentType=content_type)
+    return f"{RESOURCES_BASE_URL.rstrip('/')}/{key}"
+
+
+def upload_file_to_s3(path: str, key: str, content_type: str) -> str:
+    """
+    Upload a file from disk; returns https://resources.../<key>
+    """
+    logger.info("Uploading %s to s3://%s/%s", os.path.basename(path), RESOURCES_BUCKET, key)
+    with open(path, "rb") as f:
+        get_s3().put_object(
+            Bucket=RESOURCES_BUCKET,
+            Key=key,
+            Body=f,
+            ContentType=content_type,
+        )
+    return f"{RESOURCES_BASE_URL.rstrip('/')}/{key}"
+
+
+def upload_zip_to_s3(zip_path: str, parent_prefix: str, original_file: str) -> str:
     """
     Upload to:
       <parent_prefix>/diploma-generated/<original_file>.zip
@@ -528,17 +1554,80 @@ def upload_zip_to_s3(zip_path: str, parent_prefix: str, original_file: str) -> s
       https://resources.../<key>
     """
     key = f"{parent_prefix}/diploma-generated/{original_file}.zip"
-    logger.info("Uploading ZIP to s3://%s/%s", RESOURCES_BUCKET, key)
+    return upload_file_to_s3(zip_path, key, "application/zip")
+
+
+# =============================================================================
+# Render store (content-addressed, shared across batches and containers)
+# =============================================================================
+def render_store_enabled() -> bool:
+    return bool(RENDER_STORE_PREFIX or RENDER_STORE_DIR)
 
-    with open(zip_path, "rb") as f:
-        s3.put_object(
+
+def render_fingerprint(template_pdf_bytes: bytes, layout: Dict[str, Any]) -> str:
+    """
+    Everything besides the row that determines output bytes:
+    template content, layout (canonical JSON), merge backend and store version.
+    """
+    h = hashlib.sha256()
+    h.update(RENDER_STORE_VERSION.encode("utf-8"))
+    h.update(PDF_MERGE_BACKEND.encode("utf-8"))
+    h.update(hashlib.sha256(template_pdf_bytes).digest())
+    h.update(json.dumps(layout, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+    return h.hexdigest()
+
+
+def render_store_key(fingerprint: str, content_hash: str) -> str:
+    digest = hashlib.sha256(f"{fingerprint}:{content_hash}".encode("utf-8")).hexdigest()
+    return f"{digest[:2]}/{digest}.pdf"
+
+
+def render_store_get(key: str) -> Optional[bytes]:
+    """
+    Returns stored PDF bytes or None. Store errors are treated as a miss.
+    """
+    if RENDER_STORE_DIR:
+        try:
+            with open(os.path.join(RENDER_STORE_DIR, key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Render store read failed (%s): %s", key, e)
+            return None
+
+    from botocore.exceptions import ClientError
+    try:
+        resp = get_s3().get_object(Bucket=RESOURCES_BUCKET, Key=f"{RENDER_STORE_PREFIX}/{key}")
+        return resp["Body"].read()
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            logger.warning("Render store read failed (%s): %s", key, e)
+        return None
+    except Exception as e:
+        logger.warning("Render store read failed (%s): %s", key, e)
+        return None
+
+
+def render_store_put(key: str, pdf_bytes: bytes) -> None:
+    try:
+        if RENDER_STORE_DIR:
+            path = os.path.join(RENDER_STORE_DIR, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, path)
+            return
+
+        get_s3().put_object(
             Bucket=RESOURCES_BUCKET,
-            Key=key,
-            Body=f,
-            ContentType="application/zip",
+            Key=f"{RENDER_STORE_PREFIX}/{key}",
+            Body=pdf_bytes,
+            ContentType="application/pdf",
         )
-
-    return f"{RESOURCES_BASE_URL.rstrip('/')}/{key}"
+    except Exception as e:
+        logger.warning("Render store write failed (%s): %s", key, e)
 
 
 def resolve_signature_url(profesor_value: str) -> Optional[str]:
@@ -560,111 +1649,1702 @@ def resolve_signature_url(profesor_value: str) -> Optional[str]:
     return by_name.get(normalize_key(raw))
 
 
+# =============================================================================
+# Pre-flight validation (no rendering)
+# =============================================================================
+_MES_DE_ANIO_RE = re.compile(
+    r"^(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)"
+    r"\s+de\s+\d{4}$",
+    re.IGNORECASE,
+)
+
+
+def is_valid_fecha(fecha: str) -> bool:
+    """
+    Valid if fecha_a_espanol can convert it, or it is already '<mes> de <año>'.
+    """
+    value = (fecha or "").strip()
+    if not value:
+        return False
+    return fecha_a_espanol(value) != value or bool(_MES_DE_ANIO_RE.match(value))
+
+
+def validate_layout(layout: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Checks required fieldMappings keys, fonts (must be known to reportlab) and colors.
+    """
+    from reportlab.pdfbase import pdfmetrics
+
+    problems: List[Dict[str, Any]] = []
+    for field in REQUIRED_LAYOUT_FIELDS:
+        if field not in layout:
+            problems.append({"field": field, "message": f"fieldMappings is missing '{field}'"})
+
+    for field, cfg in layout.items():
+        if not isinstance(cfg, dict) or not isinstance(cfg.get("font"), dict):
+            continue
+        font = cfg["font"]
+        try:
+            pdfmetrics.getFont(font.get("name"))
+        except Exception:
+            problems.append({"field": field, "message": f"Unknown font {font.get('name')!r}"})
+        try:
+            hex_to_rgb01(font.get("color", "#000000"))
+        except Exception as e:
+            problems.append({"field": field, "message": str(e)})
+
+    prof_cfg = layout.get("profesor")
+    if isinstance(prof_cfg, dict) and len(prof_cfg.get("x_range") or []) != 2:
+        problems.append({"field": "profesor", "message": "profesor.x_range must be [x_min, x_max]"})
+    return problems
+
+
+def preflight_validate(header: List[str], rows: List[Dict[str, str]], layout: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validates a parsed batch without rendering and reports every problem at once.
+    Row problems are grouped by distinct value, each with the (1-based) data rows affected:
+      {"ok": False, "totalRecords": 3, "elapsedMs": 1.2,
+       "errors": [{"field": "profesor", "value": "Nadie", "rows": [3], "message": "..."}],
+       "warnings": [{"field": "fecha", "value": "Junio 2024", "rows": [2], "message": "..."}]}
+    A fecha that fecha_a_espanol cannot convert is only a warning: it renders as written.
+    """
+    started = time.perf_counter()
+    errors: List[Dict[str, Any]] = []
+    warnings: List[Dict[str, Any]] = []
+
+    missing = [col for col in REQUIRED_CSV_COLUMNS if col not in header]
+    if missing:
+        errors.append({"field": "csv", "message": f"Missing CSV column(s): {', '.join(missing)}"})
+
+    errors.extend(validate_layout(layout))
+
+    if not rows:
+        errors.append({"field": "csv", "message": "CSV has no data rows"})
+
+    # group rows by distinct value so each value is checked once
+    rows_by_profesor: Dict[str, List[int]] = {}
+    rows_by_fecha: Dict[str, List[int]] = {}
+    empty_nombre: List[int] = []
+    for row_number, row in enumerate(rows, start=1):
+        if not row["nombre"]:
+            empty_nombre.append(row_number)
+        rows_by_profesor.setdefault(row["profesor"], []).append(row_number)
+        rows_by_fecha.setdefault(row["fecha"], []).append(row_number)
+
+    if empty_nombre:
+        errors.append({"field": "nombre", "value": "", "rows": empty_nombre, "message": "Empty nombre"})
+
+    for profesor, row_numbers in rows_by_profesor.items():
+        if not resolve_signature_url(profesor):
+            errors.append({
+                "field": "profesor",
+                "value": profesor,
+                "rows": row_numbers,
+                "message": f"No signature found for profesor='{profesor}'",
+            })
+
+    for fecha, row_numbers in rows_by_fecha.items():
+        if not is_valid_fecha(fecha):
+            warnings.append({
+                "field": "fecha",
+                "value": fecha,
+                "rows": row_numbers,
+                "message": f"Unrecognized fecha '{fecha}' (rendered as written)",
+            })
+
+    return {
+        "ok": not errors,
+        "totalRecords": len(rows),
+        "distinctProfesores": len(rows_by_profesor),
+        "distinctFechas": len(rows_by_fecha),
+        "errors": errors,
+        "warnings": warnings,
+        "elapsedMs": round((time.perf_counter() - started) * 1000.0, 3),
+    }
+
+
+def summarize_preflight(report: Dict[str, Any], limit: int = 5) -> str:
+    """
+    Short human readable summary (for errorMessage / logs).
+    """
+    parts = []
+    for err in report["errors"][:limit]:
+        rows = err.get("rows")
+        suffix = f" (filas: {len(rows)})" if rows else ""
+        parts.append(f"{err['message']}{suffix}")
+    more = len(report["errors"]) - limit
+    if more > 0:
+        parts.append(f"... y {more} más")
+    return "; ".join(parts)
+
+
+def validate_only(msg: Dict[str, Any], publish: bool = False) -> Dict[str, Any]:
+    """
+    "validate-only" message: download + parse the CSV and run pre-flight.
+    Does not download the template, render or PATCH the batch.
+    publish=True (SQS, where the return value goes nowhere) also uploads the
+    result as <original_file>.preflight.json under diploma-generated/.
+    """
+    csv_bytes = http_get_bytes(msg["csv_url"], timeout=90)
+    report = preflight_validate(parse_csv_header(csv_bytes), parse_csv_rows(csv_bytes), load_configuration_once())
+    logger.info("Validate-only batch=%s ok=%s errors=%d", msg.get("batch_id"), report["ok"], len(report["errors"]))
+    result = {
+        "batch_id": msg.get("batch_id"),
+        "type": "validate-only",
+        "preflight": report,
+    }
+    if publish:
+        _, _, parent_prefix, original_file = extract_process_and_paths(msg["csv_url"])
+        result["reportUrl"] = upload_bytes_to_s3(
+            f"{parent_prefix}/diploma-generated/{original_file}.preflight.json",
+            json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8"),
+            "application/json",
+        )
+    return result
+
+
+def sample_row() -> Dict[str, str]:
+    """
+    Placeholder diploma values for warm-up and preview renders.
+    """
+    return {
+        "nombre": "Nombre de Prueba",
+        "curso": "Curso de Prueba",
+        "fecha": datetime.now().strftime("%Y-%m-%d"),
+        "profesor": "Profesor de Prueba",
+    }
+
+
+def warm_up(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    "warm-up" event: gets the container hot before real traffic.
+      init        warm_init (signatures index, template, configuration)
+      clients     deferred imports (reportlab, PyPDF2, PIL) + S3 client
+      compile     layout validation + render fingerprint
+      signatures  download + transparency PNG for every known signature
+      render      one throwaway diploma (fonts, merge backend)
+    {"refresh": true} drops the cached template/configuration/signatures first.
+    Nothing is uploaded or PATCHed.
+    """
+    timings: Dict[str, float] = {}
+
+    @contextmanager
+    def step(name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[name] = round((time.perf_counter() - t0) * 1000.0, 2)
+
+    if msg.get("refresh"):
+        with step("refresh"):
+            reset_init_caches()
+
+    with step("init"):
+        warm_init()
+
+    with step("clients"):
+        import PyPDF2  # noqa: F401
+        import reportlab.pdfgen.canvas  # noqa: F401
+        from PIL import Image  # noqa: F401
+        get_s3()
+
+    with step("compile"):
+        template_pdf_bytes = load_template_once()
+        layout = load_configuration_once()
+        layout_problems = validate_layout(layout)
+        fingerprint = render_fingerprint(template_pdf_bytes, layout)
+
+    sig_cfg = layout.get("profesor-signature") if isinstance(layout.get("profesor-signature"), dict) else {}
+    bg_threshold = int(sig_cfg.get("bg_threshold", 245))
+    by_name, by_file = load_signatures_once()
+    signature_urls = sorted(set(by_name.values()) | set(by_file.values()))
+    failed: List[Dict[str, str]] = []
+    with step("signatures"):
+        for url in signature_urls:
+            try:
+                get_signature_png(url, bg_threshold)
+            except Exception as e:
+                logger.warning("Warm-up: signature %s failed: %s", url, e)
+                failed.append({"url": url, "error": str(e)})
+
+    render_bytes = 0
+    if not layout_problems:
+        sample_url = next((u for u in signature_urls if u not in {f["url"] for f in failed}), None)
+        row = sample_row()
+        with step("render"):
+            render_bytes = len(generate_one_pdf_bytes(
+                template_pdf_bytes, layout, row["nombre"], row["curso"], row["fecha"], row["profesor"], sample_url,
+            ))
+
+    timings["total"] = round(sum(timings.values()), 2)
+    logger.info("Warm-up done: %s", json.dumps(timings))
+    return {
+        "type": "warm-up",
+        "ok": not layout_problems and not failed,
+        "timingsMs": timings,
+        "renderFingerprint": fingerprint,
+        "templateBytes": len(template_pdf_bytes),
+        "layoutProblems": layout_problems,
+        "signatures": {"total": len(signature_urls), "preprocessed": len(signature_urls) - len(failed), "failed": failed},
+        "renderBytes": render_bytes,
+    }
+
+
+def render_thumbnail_png(pdf_bytes: bytes, width: int) -> bytes:
+    """
+    First page as PNG, `width` pixels wide. Optional dependency: PyMuPDF.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf  # PyMuPDF < 1.24
+        except ImportError as e:
+            raise RuntimeError("Preview thumbnails require the 'pymupdf' package") from e
+
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page = doc[0]
+        zoom = float(width) / page.rect.width
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        return pix.tobytes("png")
+
+
+def preview(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    "preview" event (synchronous, for the configuration/templates pages):
+    {
+      "type": "preview",
+      "fieldMappings": {...},    (optional draft; defaults to the saved configuration)
+      "row": {"nombre": "...", "curso": "...", "fecha": "...", "profesor": "..."},   (optional, per field)
+      "thumbnail": true,         (optional PNG of the page, needs pymupdf)
+      "thumbnailWidth": 480
+    }
+    Renders one diploma from the warm template/signature caches and returns it
+    base64-encoded. Nothing is uploaded or PATCHed.
+    """
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    warm_init()
+    template_pdf_bytes = load_template_once()
+    layout = msg.get("fieldMappings") or load_configuration_once()
+    if not isinstance(layout, dict):
+        raise ValueError("fieldMappings must be an object")
+
+    layout_problems = validate_layout(layout)
+    if layout_problems:
+        return {
+            "type": "preview",
+            "ok": False,
+            "layoutProblems": layout_problems,
+            "elapsedMs": round((time.perf_counter() - t0) * 1000.0, 2),
+        }
+
+    row = {**sample_row(), **{k: str(v) for k, v in (msg.get("row") or {}).items() if v not in (None, "")}}
+    warnings: List[str] = []
+    sig_url = resolve_signature_url(row["profesor"])
+    if not sig_url:
+        warnings.append(f"No signature found for profesor='{row['profesor']}'")
+
+    t_render = time.perf_counter()
+    try:
+        pdf_bytes = generate_one_pdf_bytes(
+            template_pdf_bytes, layout, row["nombre"], row["curso"], row["fecha"], row["profesor"], sig_url,
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        # malformed draft (missing font/x/y, bad numbers): report, do not fail the invoke
+        return {
+            "type": "preview",
+            "ok": False,
+            "layoutProblems": [],
+            "error": f"Render failed: {type(e).__name__}: {e}",
+            "elapsedMs": round((time.perf_counter() - t0) * 1000.0, 2),
+        }
+    timings["render"] = round((time.perf_counter() - t_render) * 1000.0, 2)
+
+    result: Dict[str, Any] = {
+        "type": "preview",
+        "ok": True,
+        "layoutProblems": [],
+        "warnings": warnings,
+        "pdfBase64": base64.b64encode(pdf_bytes).decode("ascii"),
+        "pdfBytes": len(pdf_bytes),
+    }
+
+    if msg.get("thumbnail"):
+        t_thumb = time.perf_counter()
+        try:
+            png = render_thumbnail_png(pdf_bytes, int(msg.get("thumbnailWidth") or 480))
+            result["pngBase64"] = base64.b64encode(png).decode("ascii")
+        except Exception as e:
+            logger.warning("Preview thumbnail failed: %s", e)
+            warnings.append(f"Thumbnail unavailable: {e}")
+        timings["thumbnail"] = round((time.perf_counter() - t_thumb) * 1000.0, 2)
+
+    result["timingsMs"] = timings
+    result["elapsedMs"] = round((time.perf_counter() - t0) * 1000.0, 2)
+    logger.info("Preview rendered in %.1f ms (%d bytes)", result["elapsedMs"], len(pdf_bytes))
+    return result
+
+
+def _http_response(status_code: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(payload),
+    }
+
+
+def preview_http(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Function URL / API Gateway proxy wrapper around preview(): JSON body in,
+    JSON body out, 400 on a bad request or invalid layout.
+    """
+    try:
+        body = event.get("body") or "{}"
+        if event.get("isBase64Encoded"):
+            body = base64.b64decode(body).decode("utf-8")
+        msg = json.loads(body)
+        if not isinstance(msg, dict):
+            raise ValueError("body must be a JSON object")
+        result = preview(msg)
+    except (ValueError, KeyError) as e:
+        return _http_response(400, {"type": "preview", "ok": False, "error": str(e)})
+    return _http_response(200 if result["ok"] else 400, result)
+
+
 # =============================================================================
 # Core processing
 # =============================================================================
-def process_one_batch(msg: Dict[str, Any]) -> Dict[str, Any]:
+def process_one_batch(
+    msg: Dict[str, Any],
+    chunk_runner: Optional[Callable[["BatchPlan", BatchMetrics], None]] = None,
+) -> Dict[str, Any]:
     """
     msg example:
     {
       "created_by": "...",
       "file_name": "diploma-datos-afp.csv",
       "csv_url": "https://resources.../proceso-2/diploma-datos-afp.csv",
-      "batch_id": 2
+      "batch_id": 2,
+      "profile": "cprofile",     (optional: "cprofile" | "sample" | true)
+      "memory_report": true      (optional: tracemalloc report in the result)
     }
+    chunk_runner renders the plan's chunks (default: default_chunk_runner).
+    A profiled or memory-tracked batch always renders inline: cProfile and
+    tracemalloc only see this process, not forked or pooled render processes.
     """
-    warm_init()
+    metrics = BatchMetrics()
+    status = "exception"
+    batch_id = msg.get("batch_id")
+
+    mode = profile_mode(msg)
+    profiler = BatchProfiler(mode) if mode else None
+    if memory_report_enabled(msg):
+        metrics.memory = MemoryTracker()
+    if profiler is not None or metrics.memory is not None:
+        logger.info("Batch %s is profiled/memory-tracked: rendering inline in one process", batch_id)
+        chunk_runner = run_chunks_inline
+
+    result: Optional[Dict[str, Any]] = None
+    try:
+        if metrics.memory is not None:
+            metrics.memory.start()
+        if profiler is not None:
+            profiler.start()
+        result = _process_one_batch(msg, metrics, chunk_runner)
+        status = result["status"]
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profile_info = upload_profile(profiler, msg)
+            if result is not None:
+                result["profile"] = profile_info
+        if metrics.memory is not None:
+            memory_info = metrics.memory.report()
+            logger.info("Memory report: %s", json.dumps(memory_info))
+            if result is not None:
+                result["memory"] = memory_info
+        if result is not None:
+            result["metrics"] = metrics.summary()
+        metrics.emit_emf(status, {"BatchId": batch_id})
+    return result
 
-    batch_id = int(msg["batch_id"])
-    csv_url = msg["csv_url"]
 
-    template_pdf = load_template_once()
-    layout = load_configuration_once()
+# =============================================================================
+# Scratch space (/tmp): isolated directory per batch, quota, cleanup
+# =============================================================================
+class ScratchSpaceFull(RuntimeError):
+    """
+    The batch needs more /tmp than the budget or the filesystem has left.
+    """
 
-    # Download CSV
-    csv_bytes = http_get_bytes(csv_url, timeout=90)
-    rows = parse_csv_rows(csv_bytes)
-    total_records = len(rows)
-    logger.info("CSV rows parsed: %d", total_records)
 
-    # /tmp/<proceso-x>
-    _, process_folder, parent_prefix, original_file = extract_process_and_paths(csv_url)
-    workdir = f"/tmp/{process_folder}"
-    os.makedirs(workdir, exist_ok=True)
+_ACTIVE_SCRATCH: Dict[str, "ScratchSpace"] = {}   # path -> live batch scratch in this process
+_SCRATCH_LOCK = threading.Lock()
 
-    # Prepare result CSV
-    base_name = os.path.splitext(original_file)[0]
-    result_csv_name = f"{base_name}-resultado.csv"
-    result_csv_path = os.path.join(workdir, result_csv_name)
 
-    results: List[List[str]] = []
-    results.append(["nombre", "curso", "fecha", "profesor", "resultado"])
+def scratch_has_room(path: str, nbytes: int) -> bool:
+    """
+    True when writing nbytes under `path` still leaves SCRATCH_RESERVE_MB free.
+    """
+    try:
+        free = shutil.disk_usage(path).free
+    except OSError:
+        return True
+    return free - nbytes > SCRATCH_RESERVE_MB * 1024 * 1024
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
 
-    interrupted = False
-    any_row_errors = False
 
+def clean_stale_scratch(root: str = SCRATCH_ROOT) -> int:
+    """
+    Removes batch directories left behind by runs that never reached cleanup
+    (timeout, OOM kill): any batch-* dir not live in this process whose owner
+    pid is this process or no longer exists. Returns bytes freed.
+    """
+    freed = 0
     try:
-        for row in rows:
-            nombre = row["nombre"]
-            curso = row["curso"]
-            fecha = row["fecha"]
-            profesor_value = row["profesor"]
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    me = os.getpid()
+    for name in names:
+        parts = name.split("-")
+        if not name.startswith("batch-") or len(parts) < 4 or not parts[-2].isdigit():
+            continue
+        path = os.path.join(root, name)
+        with _SCRATCH_LOCK:
+            if path in _ACTIVE_SCRATCH:
+                continue
+        owner = int(parts[-2])
+        if owner != me and _pid_alive(owner):
+            continue
+        for dirpath, _, files in os.walk(path):
+            for filename in files:
+                try:
+                    freed += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info("Removed stale scratch dir %s", path)
+    return freed
+
+
+class ScratchSpace:
+    """
+    One batch's private directory under SCRATCH_ROOT:
+      <root>/batch-<id>-<pid>-<rand>/files/   rendered PDFs (render processes write here)
+      <root>/batch-<id>-<pid>-<rand>/*.zip    archive being built
+    Bytes are tracked against the budget (SCRATCH_BUDGET_MB, default 90% of the
+    filesystem); cleanup() removes everything, on success or failure.
+    """
+
+    def __init__(self, batch_id: Any, root: str = SCRATCH_ROOT):
+        os.makedirs(root, exist_ok=True)
+        self.stale_bytes_freed = clean_stale_scratch(root)
+        self.path = os.path.join(root, f"batch-{batch_id}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self.files_dir = os.path.join(self.path, "files")
+        os.makedirs(self.files_dir)
+        try:
+            total = shutil.disk_usage(root).total
+        except OSError:
+            total = 512 * 1024 * 1024
+        self.budget = SCRATCH_BUDGET_MB * 1024 * 1024 if SCRATCH_BUDGET_MB else int(total * 0.9)
+        self.used = 0
+        self.peak = 0
+        self.spilled = 0    # PDFs handed over in memory because /tmp was short
+        self._lock = threading.Lock()   # archive writer threads account next to the batch thread
+        with _SCRATCH_LOCK:
+            _ACTIVE_SCRATCH[self.path] = self
+
+    def account(self, nbytes: int) -> None:
+        with self._lock:
+            self.used = max(0, self.used + nbytes)
+            self.peak = max(self.peak, self.used)
+
+    def has_room(self, nbytes: int) -> bool:
+        return self.used + nbytes <= self.budget and scratch_has_room(self.path, nbytes)
+
+    def ensure(self, nbytes: int, what: str) -> None:
+        if not self.has_room(nbytes):
+            raise ScratchSpaceFull(
+                f"Not enough /tmp space for {what} ({nbytes} bytes; {self.used} of {self.budget} in use)"
+            )
 
+    def cleanup(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+        with _SCRATCH_LOCK:
+            _ACTIVE_SCRATCH.pop(self.path, None)
+        logger.info("Scratch %s removed (peak %d bytes, %d spilled PDFs)", self.path, self.peak, self.spilled)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budgetBytes": self.budget,
+            "peakBytes": self.peak,
+            "spilledPdfs": self.spilled,
+            "staleBytesFreed": self.stale_bytes_freed,
+        }
+
+
+class ZipCompressor:
+    """
+    Compresses archive entries on worker threads (zlib releases the GIL, so
+    they run next to rendering and to each other) and decides per entry
+    whether deflate is worth it. With ZIP_COMPRESSION=auto a few slices of the
+    PDF are deflated first; when they shrink to no less than ZIP_STORE_RATIO of
+    their size the PDF is stored as is. Skipped work is estimated from the
+    sample (CPU seconds saved vs bytes given up) and reported in summary().
+    """
+
+    SAMPLE_SLICES = 16          # spread over the file: 32 KB sample tracks the full ratio within ~1%
+    SAMPLE_SLICE_BYTES = 2048
+
+    def __init__(self, mode: Optional[str] = None, threads: Optional[int] = None,
+                 store_ratio: Optional[float] = None):
+        from concurrent.futures import ThreadPoolExecutor
+        self.mode = (mode or ZIP_COMPRESSION).strip().lower()
+        self.threads = max(1, threads or ZIP_THREADS or available_cpus())
+        self.store_ratio = ZIP_STORE_RATIO if store_ratio is None else store_ratio
+        self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="zip-compress")
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deflated = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.cpu_seconds = 0.0          # spent deflating (samples included)
+        self.cpu_seconds_saved = 0.0    # estimated deflate time of stored entries
+        self.bytes_given_up = 0         # estimated extra archive bytes of stored entries
+
+    def _sample(self, data: bytes) -> bytes:
+        n, size = self.SAMPLE_SLICES, self.SAMPLE_SLICE_BYTES
+        if len(data) <= n * size:
+            return data
+        step = (len(data) - size) // (n - 1)
+        return b"".join(data[i * step:i * step + size] for i in range(n))
+
+    def _compress(self, data: bytes) -> Dict[str, Any]:
+        import zlib
+        t0 = time.thread_time()
+        out: Dict[str, Any] = {"crc": zlib.crc32(data), "savedCpu": 0.0, "givenUp": 0}
+        if self.mode == "store" or not data:
+            out.update(method=zipfile.ZIP_STORED, payload=data)
+        else:
+            if self.mode == "auto":
+                sample = self._sample(data)
+                s0 = time.thread_time()
+                ratio = len(zlib.compress(sample, 6)) / len(sample)
+                sample_cpu = time.thread_time() - s0
+                if ratio >= self.store_ratio:
+                    scale = len(data) / len(sample)
+                    out.update(method=zipfile.ZIP_STORED, payload=data,
+                               savedCpu=max(0.0, sample_cpu * scale - sample_cpu),
+                               givenUp=max(0, int(len(data) * (1 - ratio))))
+            if "method" not in out:
+                deflater = zlib.compressobj(6, zlib.DEFLATED, -15)   # raw deflate, as ZIP stores it
+                payload = deflater.compress(data) + deflater.flush()
+                if len(payload) < len(data):
+                    out.update(method=zipfile.ZIP_DEFLATED, payload=payload)
+                else:
+                    out.update(method=zipfile.ZIP_STORED, payload=data)
+        out["cpu"] = time.thread_time() - t0
+        return out
+
+    def submit(self, data: bytes) -> Any:
+        """Future of the finished entry: method, payload, crc and sample stats."""
+        return self._pool.submit(self._compress, data)
+
+    def record(self, size: int, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            if entry["method"] == zipfile.ZIP_STORED:
+                self.stored += 1
+            else:
+                self.deflated += 1
+            self.input_bytes += size
+            self.output_bytes += len(entry["payload"])
+            self.cpu_seconds += entry["cpu"]
+            self.cpu_seconds_saved += entry["savedCpu"]
+            self.bytes_given_up += entry["givenUp"]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "threads": self.threads,
+            "stored": self.stored,
+            "deflated": self.deflated,
+            "inputBytes": self.input_bytes,
+            "outputBytes": self.output_bytes,
+            "compressCpuSeconds": round(self.cpu_seconds, 3),
+            "estCpuSecondsSaved": round(self.cpu_seconds_saved, 3),
+            "estBytesGivenUp": self.bytes_given_up,
+        }
+
+
+class ZipAppender:
+    """
+    Writes a ZIP file whose entries arrive already compressed (stored, or raw
+    deflate with their CRC), so writing an entry is appending its local header
+    and payload. zipfile has no public way to add a compressed payload, hence
+    the records below (APPNOTE 4.3). Past zipfile's own limits (2 GB offsets,
+    65535 entries) the offsets go to zip64 extras and zip64 end records; a
+    single entry (a PDF) must stay under 2 GB.
+    """
+
+    LIMIT = zipfile.ZIP64_LIMIT
+    COUNT_LIMIT = zipfile.ZIP_FILECOUNT_LIMIT
+
+    def __init__(self, path: str):
+        self.fp = open(path, "wb")
+        self.infos: List[zipfile.ZipInfo] = []
+
+    @staticmethod
+    def _dos_time(info: zipfile.ZipInfo) -> Tuple[int, int]:
+        y, mo, d, h, mi, s = info.date_time
+        return h << 11 | mi << 5 | s // 2, (y - 1980) << 9 | mo << 5 | d
+
+    def append(self, info: zipfile.ZipInfo, payload: bytes) -> int:
+        """
+        Writes `payload` as `info`, whose compress_type, CRC and file_size are
+        already set. Returns the bytes added to the file.
+        """
+        if max(info.file_size, len(payload)) >= self.LIMIT:
+            raise ValueError(f"archive entry {info.filename} is over 2 GB")
+        import struct
+        info.compress_size = len(payload)
+        info.header_offset = self.fp.tell()
+        name = info.filename.encode("utf-8")
+        dos_time, dos_date = self._dos_time(info)
+        header = struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, 0x800, info.compress_type, dos_time,
+                             dos_date, info.CRC, info.compress_size, info.file_size, len(name), 0)
+        self.fp.write(header + name)
+        self.fp.write(payload)
+        self.infos.append(info)
+        return len(header) + len(name) + len(payload)
+
+    def close(self) -> None:
+        if self.fp.closed:
+            return
+        import struct
+        start = self.fp.tell()
+        for info in self.infos:
+            name = info.filename.encode("utf-8")
+            offset, extra, version = info.header_offset, b"", 20
+            if offset >= self.LIMIT:
+                offset, extra, version = 0xFFFFFFFF, struct.pack("<HHQ", 1, 8, info.header_offset), 45
+            dos_time, dos_date = self._dos_time(info)
+            self.fp.write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 3 << 8 | version, version, 0x800,
+                                      info.compress_type, dos_time, dos_date, info.CRC, info.compress_size,
+                                      info.file_size, len(name), len(extra), 0, 0, 0, info.external_attr,
+                                      offset) + name + extra)
+        end = self.fp.tell()
+        count, size = len(self.infos), end - start
+        if count >= self.COUNT_LIMIT or start >= self.LIMIT or size >= self.LIMIT:
+            self.fp.write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, size, start))
+            self.fp.write(struct.pack("<IIQI", 0x07064B50, 0, end, 1))
+            count, size, start = min(count, 0xFFFF), min(size, 0xFFFFFFFF), min(start, 0xFFFFFFFF)
+        self.fp.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, size, start, 0))
+        self.fp.close()
+
+
+class BatchArchive:
+    """
+    The batch ZIP, filled while chunks complete: each rendered PDF moves from
+    the scratch files dir into memory and is deleted, is compressed on a
+    ZipCompressor thread and appended, in submission order, by the archive's
+    writer thread, so /tmp holds the archive plus at most a few chunks instead
+    of every PDF twice. At most 4 entries per compressor thread wait in memory.
+    """
+
+    def __init__(self, scratch: ScratchSpace, name: str, compressor: ZipCompressor):
+        from concurrent.futures import ThreadPoolExecutor
+        self.scratch = scratch
+        self.path = os.path.join(scratch.path, name)
+        self.zf = ZipAppender(self.path)
+        self.compressor = compressor
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zip-write")
+        self.pending: List[Any] = []   # write futures, in write order
+        self.entries = 0
+
+    def _write_entry(self, arcname: str, size: int, compressed: Any) -> None:
+        entry = compressed.result()
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime(time.time())[:6])
+        info.external_attr = 0o600 << 16
+        info.compress_type = entry["method"]
+        info.CRC = entry["crc"]
+        info.file_size = size
+        self.scratch.ensure(len(entry["payload"]) + 1024, f"archive entry {arcname}")
+        try:
+            added = self.zf.append(info, entry["payload"])
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise ScratchSpaceFull(f"/tmp filled up while adding {arcname} to the archive") from e
+            raise
+        self.scratch.account(added)
+        self.compressor.record(size, entry)
+
+    def _drain(self, keep: int) -> None:
+        while len(self.pending) > keep:
+            self.pending.pop(0).result()
+
+    def add_bytes(self, data: bytes, arcname: str) -> None:
+        compressed = self.compressor.submit(data)
+        self.pending.append(self._writer.submit(self._write_entry, arcname, len(data), compressed))
+        self.entries += 1
+        self._drain(self.compressor.threads * 4)
+
+    def add_file(self, path: str, arcname: str) -> None:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.remove(path)
+        self.scratch.account(-len(data))
+        self.add_bytes(data, arcname)
+
+    def close(self) -> int:
+        self._drain(0)
+        self._writer.shutdown(wait=True)
+        self.zf.close()
+        return os.path.getsize(self.path)
+
+    def abort(self) -> None:
+        for future in self.pending:
+            future.cancel()
+        self.pending = []
+        self._writer.shutdown(wait=True, cancel_futures=True)
+        self.zf.close()
+
+
+class ShardedArchive:
+    """
+    The batch output as one or more ZIP parts. A part is closed once adding the
+    next PDF would pass ARCHIVE_MAX_MB (uncompressed size, so parts stay under
+    it) or ARCHIVE_MAX_ROWS PDFs; closed parts upload on background threads
+    while rendering continues, and are deleted from /tmp once uploaded.
+
+    A batch that fits in one part is uploaded as before
+    (<original_file>.zip); otherwise the parts go to
+    <original_file>/part-001.zip, part-002.zip, ... next to a manifest.json,
+    and the manifest URL becomes the batch's zipUrl.
+    """
+
+    def __init__(self, scratch: ScratchSpace, parent_prefix: str, original_file: str,
+                 max_bytes: Optional[int] = None, max_rows: Optional[int] = None):
+        from concurrent.futures import ThreadPoolExecutor
+        self.scratch = scratch
+        self.parent_prefix = parent_prefix
+        self.original_file = original_file
+        self.max_bytes = ARCHIVE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.max_rows = ARCHIVE_MAX_ROWS if max_rows is None else max_rows
+        self.parts: List[Dict[str, Any]] = []   # closed parts: part, path, bytes, files, future
+        self.part_raw_bytes = 0
+        self.compressor = ZipCompressor()
+        self.current = self._open_part()
+        self._uploads = ThreadPoolExecutor(max_workers=max(1, ARCHIVE_UPLOAD_THREADS),
+                                           thread_name_prefix="archive-upload")
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.parts)
+
+    def _open_part(self) -> BatchArchive:
+        self.part_raw_bytes = 0
+        return BatchArchive(self.scratch, f"part-{len(self.parts) + 1:03d}.zip", self.compressor)
+
+    def part_key(self, number: int) -> str:
+        return f"{self.parent_prefix}/diploma-generated/{self.original_file}/part-{number:03d}.zip"
+
+    def _upload_part(self, path: str, key: str) -> str:
+        size = os.path.getsize(path)
+        url = upload_file_to_s3(path, key, "application/zip")
+        os.remove(path)
+        self.scratch.account(-size)
+        return url
+
+    def _rollover(self) -> None:
+        part = self.current
+        number = len(self.parts) + 1
+        size = part.close()
+        self.parts.append({
+            "part": number,
+            "bytes": size,
+            "files": part.entries,
+            "future": self._uploads.submit(self._upload_part, part.path, self.part_key(number)),
+        })
+        logger.info("Archive part %d closed (%d files, %d bytes); uploading", number, part.entries, size)
+        self.current = self._open_part()
+
+    def _make_room(self, nbytes: int) -> None:
+        if not self.current.entries:
+            return
+        if (self.max_bytes and self.part_raw_bytes + nbytes > self.max_bytes) or \
+                (self.max_rows and self.current.entries >= self.max_rows):
+            self._rollover()
+
+    def add_file(self, path: str, arcname: str) -> None:
+        size = os.path.getsize(path)
+        self._make_room(size)
+        self.current.add_file(path, arcname)
+        self.part_raw_bytes += size
+
+    def add_bytes(self, data: bytes, arcname: str) -> None:
+        self._make_room(len(data))
+        self.current.add_bytes(data, arcname)
+        self.part_raw_bytes += len(data)
+
+    def finish(self, extra: Dict[str, bytes]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Adds `extra` (arcname -> bytes, e.g. the result CSV) to the last part,
+        uploads whatever is left and waits for every part. Returns the URL to
+        report (ZIP or manifest) and a summary for the batch result.
+        """
+        for arcname, data in extra.items():
+            self.current.add_bytes(data, arcname)
+        if not self.parts:
+            size = self.current.close()
+            self._log_compression()
+            url = upload_zip_to_s3(self.current.path, self.parent_prefix, self.original_file)
+            self._uploads.shutdown()
+            return url, {"parts": 1, "bytes": size, "compression": self.compressor.summary()}
+
+        self._rollover()
+        self.current.close()   # the empty part opened by the rollover
+        self._log_compression()
+        parts = [{"part": p["part"], "url": p["future"].result(), "bytes": p["bytes"], "files": p["files"]}
+                 for p in self.parts]
+        self._uploads.shutdown()
+        manifest = {
+            "originalFile": self.original_file,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "parts": parts,
+            "resultCsv": {"part": parts[-1]["part"], "names": sorted(extra)},
+        }
+        key = f"{self.parent_prefix}/diploma-generated/{self.original_file}/manifest.json"
+        url = upload_bytes_to_s3(key, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"),
+                                 "application/json")
+        return url, {
+            "parts": len(parts),
+            "bytes": sum(p["bytes"] for p in parts),
+            "manifestUrl": url,
+            "compression": self.compressor.summary(),
+        }
+
+    def _log_compression(self) -> None:
+        self.compressor.shutdown()
+        logger.info("Archive compression: %s", self.compressor.summary())
+
+    def abort(self) -> None:
+        """
+        Failure path: stops queued uploads and compression and waits for running
+        ones so the scratch directory can be removed safely.
+        """
+        self.current.abort()
+        self.compressor.shutdown()
+        for p in self.parts:
+            p["future"].cancel()
+        self._uploads.shutdown(wait=True)
+
+
+# =============================================================================
+# Per-diploma object output (OUTPUT_MODE=objects)
+# =============================================================================
+class ObjectUploader:
+    """
+    Uploads each rendered PDF as its own S3 object while the batch is still
+    rendering: BatchPlan.record submits a PDF as soon as its chunk completes,
+    so total time approaches max(render, upload) rather than their sum.
+    At most UPLOAD_CONCURRENCY uploads run at once and twice that may be
+    queued; beyond that submit() blocks, which slows chunk dispatch instead of
+    piling PDFs up in memory.
+    """
+
+    def __init__(self, scratch: ScratchSpace, key_prefix: str, workers: Optional[int] = None):
+        from concurrent.futures import ThreadPoolExecutor
+        workers = max(1, workers or UPLOAD_CONCURRENCY)
+        self.scratch = scratch
+        self.key_prefix = key_prefix
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="object-upload")
+        self._slots = threading.BoundedSemaphore(workers * 3)
+        self.futures: Dict[int, Any] = {}   # task index -> Future[(url, bytes)]
+        self.bytes = 0                      # uploaded, totalled by wait()
+
+    def key(self, filename: str) -> str:
+        return f"{self.key_prefix}/{filename}"
+
+    def _put(self, filename: str, path: Optional[str], data: Optional[bytes]) -> Tuple[str, int]:
+        try:
+            key = self.key(filename)
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+                get_s3().put_object(Bucket=RESOURCES_BUCKET, Key=key, Body=data, ContentType="application/pdf")
+                os.remove(path)
+                self.scratch.account(-len(data))
+            else:
+                get_s3().put_object(Bucket=RESOURCES_BUCKET, Key=key, Body=data, ContentType="application/pdf")
+            return f"{RESOURCES_BASE_URL.rstrip('/')}/{key}", len(data)
+        finally:
+            self._slots.release()
+
+    def submit(self, index: int, filename: str, path: Optional[str] = None, data: Optional[bytes] = None) -> None:
+        self._slots.acquire()
+        self.futures[index] = self._pool.submit(self._put, filename, path, data)
+
+    def wait(self) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """
+        Blocks until every submitted upload finished: task index -> (url, error).
+        """
+        out: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        for index, future in self.futures.items():
             try:
-                sig_url = resolve_signature_url(profesor_value)
-                if not sig_url:
-                    raise RuntimeError(f"No signature found for profesor='{profesor_value}'")
-
-                pdf_bytes = generate_one_pdf_bytes(
-                    template_pdf_bytes=template_pdf,
-                    layout=layout,
-                    nombre=nombre,
-                    curso=curso,
-                    fecha=fecha,
-                    profesor_value=profesor_value if not looks_like_image_filename(profesor_value) else profesor_value,
-                    signature_url=sig_url,
+                url, size = future.result()
+                out[index] = (url, None)
+                self.bytes += size
+            except Exception as e:
+                logger.error("Upload of task %d failed: %s", index, e)
+                out[index] = (None, str(e))
+        self._pool.shutdown()
+        return out
+
+    def abort(self) -> None:
+        for future in self.futures.values():
+            future.cancel()
+        self._pool.shutdown(wait=True)
+
+
+# =============================================================================
+# Adaptive render concurrency (CPU count + memory headroom)
+# =============================================================================
+LAMBDA_MB_PER_VCPU = 1769  # Lambda allocates one full vCPU per 1,769 MB
+
+
+def lambda_memory_mb() -> Optional[int]:
+    value = os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    return int(value) if value and value.isdigit() else None
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may use; inside Lambda capped by the configured memory
+    (os.cpu_count() reports the host, not the share we get).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    memory_mb = lambda_memory_mb()
+    if memory_mb:
+        cpus = min(cpus, max(1, -(-memory_mb // LAMBDA_MB_PER_VCPU)))
+    return max(1, cpus)
+
+
+def memory_limit_mb() -> float:
+    """
+    Lambda memory size, else the cgroup v2 limit, else physical memory.
+    """
+    memory_mb = lambda_memory_mb()
+    if memory_mb:
+        return float(memory_mb)
+    try:
+        with open("/sys/fs/cgroup/memory.max", "r") as f:
+            value = f.read().strip()
+        if value.isdigit():
+            return int(value) / (1024.0 * 1024.0)
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024.0 * 1024.0)
+    except (ValueError, OSError, AttributeError):
+        return 1024.0
+
+
+def rss_mb(pid: int) -> float:
+    """
+    Current resident set of a process (Linux /proc); 0 when unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0.0
+
+
+class ConcurrencyController:
+    """
+    Picks how many render chunks may run at once and adapts while a batch runs.
+
+    Start: min(CPUs, processes that fit in memory, cap) where a render process is
+    budgeted RENDER_PROCESS_MB. While running, the RSS of this process plus its
+    render processes is compared with the memory limit:
+      >= MEMORY_CRITICAL_WATERMARK  pause: no new chunk until in-flight ones finish
+      >= MEMORY_HIGH_WATERMARK      scale down by one
+      <  MEMORY_HIGH_WATERMARK * 0.75 for a cooldown  scale back up by one
+    Every decision is logged and kept for the batch result.
+    """
+
+    def __init__(self, cap: Optional[int] = None, limit_mb: Optional[float] = None, cooldown_s: float = 5.0):
+        self.cpus = available_cpus()
+        self.limit_mb = limit_mb or memory_limit_mb()
+        self.cooldown_s = cooldown_s
+        base_mb = rss_mb(os.getpid())
+        by_memory = int((self.limit_mb * MEMORY_HIGH_WATERMARK - base_mb) // max(1, RENDER_PROCESS_MB))
+        self.max_workers = max(1, min(self.cpus, by_memory, cap or self.cpus))
+        self.target = self.max_workers
+        self.paused = False
+        self.peak_mb = base_mb
+        self.decisions: List[Dict[str, Any]] = []
+        self._last_change = time.monotonic()
+        self._last_sample = 0.0
+        self._decide("initial", base_mb, cpus=self.cpus, byMemory=by_memory, cap=cap)
+
+    def _decide(self, action: str, used_mb: float, **extra: Any) -> None:
+        decision = {
+            "action": action,
+            "target": self.target,
+            "usedMb": round(used_mb, 1),
+            "limitMb": round(self.limit_mb, 1),
+            **{k: v for k, v in extra.items() if v is not None},
+        }
+        logger.info("Concurrency: %s", json.dumps(decision))
+        if len(self.decisions) < 50:
+            self.decisions.append(decision)
+
+    def update(self, pids: List[int]) -> None:
+        """
+        Samples memory (at most every 0.25 s) and adjusts target / pause.
+        pids: render processes to count besides this one.
+        """
+        now = time.monotonic()
+        if now - self._last_sample < 0.25:
+            return
+        self._last_sample = now
+        used = rss_mb(os.getpid()) + sum(rss_mb(pid) for pid in pids)
+        self.peak_mb = max(self.peak_mb, used)
+        ratio = used / self.limit_mb if self.limit_mb else 0.0
+
+        if ratio >= MEMORY_CRITICAL_WATERMARK:
+            if not self.paused or self.target > 1:
+                self.paused = True
+                self.target = max(1, self.target - 1)
+                self._last_change = now
+                self._decide("pause", used)
+        elif ratio >= MEMORY_HIGH_WATERMARK:
+            if self.paused:
+                self.paused = False
+                self._decide("resume", used)
+            if self.target > 1 and now - self._last_change >= self.cooldown_s / 5:
+                self.target -= 1
+                self._last_change = now
+                self._decide("scale-down", used)
+        else:
+            if self.paused:
+                self.paused = False
+                self._decide("resume", used)
+            if (
+                ratio < MEMORY_HIGH_WATERMARK * 0.75
+                and self.target < self.max_workers
+                and now - self._last_change >= self.cooldown_s
+            ):
+                self.target += 1
+                self._last_change = now
+                self._decide("scale-up", used)
+
+    def can_dispatch(self, inflight: int) -> bool:
+        """
+        Backpressure: while paused only a fully drained pipeline gets a new chunk.
+        """
+        if self.paused:
+            return inflight == 0
+        return inflight < self.target
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "cpus": self.cpus,
+            "limitMb": round(self.limit_mb, 1),
+            "maxWorkers": self.max_workers,
+            "finalTarget": self.target,
+            "peakMb": round(self.peak_mb, 1),
+            "decisions": self.decisions,
+        }
+
+
+# =============================================================================
+# Batch stages: plan -> render chunks -> finalize
+# =============================================================================
+class BatchPlan:
+    """
+    Everything decided before rendering one batch: parsed rows, signature per row,
+    duplicates and output file names. The unique renders are handed out as
+    picklable chunks (see render_chunk), so they can run inline (Lambda), on a
+    process pool or interleaved with other batches (worker.py).
+    """
+
+    def __init__(self, msg: Dict[str, Any], template_pdf: bytes, layout: Dict[str, Any]):
+        self.msg = msg
+        self.batch_id = int(msg["batch_id"])
+        self.csv_url = msg["csv_url"]
+        self.template_pdf = template_pdf
+        self.layout = layout
+        self.rows: List[Dict[str, str]] = []
+        self.total_records = 0
+        self.preflight: Optional[Dict[str, Any]] = None
+        self.rejection: Optional[Dict[str, Any]] = None   # result when pre-flight rejected the batch
+
+        _, self.process_folder, self.parent_prefix, self.original_file = extract_process_and_paths(self.csv_url)
+        self.scratch: Optional[ScratchSpace] = None      # created once the batch passes pre-flight
+        self.output_mode = str(msg.get("output_mode") or OUTPUT_MODE).strip().lower()
+        self.archive: Optional[ShardedArchive] = None      # output_mode "zip"
+        self.uploader: Optional[ObjectUploader] = None     # output_mode "objects"
+        self.workdir = ""
+        self.scratch_reserved = 0   # scratch bytes promised to chunks still rendering (reserve_scratch)
+        self._scratch_lock = threading.Lock()
+
+        self.normalizer = NormalizationCache()
+        self.use_store = render_store_enabled()
+        self.fingerprint = render_fingerprint(template_pdf, layout) if self.use_store else ""
+
+        # one entry per CSV row: ("render", task index) | ("duplicate", task index) | ("error", message)
+        self.row_plan: List[Tuple[str, Any]] = []
+        self.tasks: List[Dict[str, Any]] = []
+        self.outcomes: Dict[int, Dict[str, Any]] = {}      # task index -> render_chunk outcome
+        self.duplicate_rows = 0
+        self.store_hits = 0
+        self.store_misses = 0
+        self.concurrency: Optional[Dict[str, Any]] = None  # ConcurrencyController.summary() when parallel
+
+    @property
+    def pending_tasks(self) -> int:
+        return len(self.tasks) - len(self.outcomes)
+
+    def chunks(self, size: Optional[int] = None, portable: bool = False) -> List[Dict[str, Any]]:
+        """
+        Unique renders in chunks of `size` rows (RENDER_CHUNK_ROWS by default).
+        portable=True leaves out the in-process normalizer so the chunk can be
+        pickled to another process.
+        """
+        size = max(1, size or RENDER_CHUNK_ROWS)
+        out = []
+        for start in range(0, len(self.tasks), size):
+            chunk: Dict[str, Any] = {
+                "batchId": self.batch_id,
+                "workdir": self.workdir,
+                "template": self.template_pdf,
+                "layout": self.layout,
+                "useStore": self.use_store,
+                "fingerprint": self.fingerprint,
+                "tasks": self.tasks[start:start + size],
+            }
+            if not portable:
+                chunk["normalizer"] = self.normalizer
+            out.append(chunk)
+        return out
+
+    def reserve_scratch(self, chunk: Dict[str, Any], slots: int) -> Dict[str, Any]:
+        """
+        Call right before dispatching `chunk`: sets chunk["scratchAllowance"] to
+        its share of the scratch budget nobody has used or reserved yet, split
+        across the `slots` chunks that may render at once. render_chunk writes
+        at most that many bytes to the workdir and hands the rest over in memory;
+        record() releases the reservation.
+        """
+        with self._scratch_lock:
+            free = self.scratch.budget - self.scratch.used - self.scratch_reserved
+            allowance = max(0, free // max(1, slots))
+            self.scratch_reserved += allowance
+        chunk["scratchAllowance"] = allowance
+        return chunk
+
+    def record(self, chunk_result: Dict[str, Any], metrics: BatchMetrics) -> None:
+        """
+        Stores the outcomes of one render_chunk call; merges the chunk's own
+        metrics when it ran in another process.
+        """
+        with self._scratch_lock:
+            self.scratch_reserved = max(0, self.scratch_reserved - chunk_result.get("scratchAllowance", 0))
+        if "metrics" in chunk_result:
+            metrics.merge(chunk_result["metrics"])
+        self.store_hits += chunk_result["storeHits"]
+        self.store_misses += chunk_result["storeMisses"]
+        for outcome in chunk_result["outcomes"]:
+            self.outcomes[outcome["index"]] = outcome
+            if outcome["error"]:
+                continue
+            filename = self.tasks[outcome["index"]]["filename"]
+            pdf = outcome.pop("pdf", None)
+            if pdf is not None:
+                # /tmp short or the chunk's scratch allowance used up: PDF handed over in memory
+                self.scratch.spilled += 1
+            else:
+                self.scratch.account(outcome.get("bytes", 0))
+            path = os.path.join(self.workdir, filename)
+            if self.uploader is not None:
+                self.uploader.submit(outcome["index"], filename, path=None if pdf is not None else path, data=pdf)
+                continue
+            with metrics.stage("Zip"):
+                if pdf is not None:
+                    self.archive.add_bytes(pdf, filename)
+                else:
+                    self.archive.add_file(path, filename)
+
+
+def plan_batch(msg: Dict[str, Any], metrics: BatchMetrics) -> BatchPlan:
+    """
+    Init + CSV download + pre-flight, then resolves signatures, content hashes and
+    duplicates for every row. A batch rejected by pre-flight is PATCHed here and
+    comes back with plan.rejection set.
+    """
+    # Init and CSV download overlap; each stage records its own duration
+    with open_io() as io:
+        init, download = io.gather([(timed_call, (warm_init,)), (timed_call, (http_get_bytes, msg["csv_url"], 90))])
+    for name, outcome in (("Init", init), ("CsvDownload", download)):
+        if isinstance(outcome, Exception):
+            raise outcome
+        metrics.merge({"stageSeconds": {name: outcome[1]}})
+    csv_bytes = download[0]
+    plan = BatchPlan(msg, load_template_once(), load_configuration_once())
+
+    with metrics.stage("CsvDownload"):
+        plan.rows = parse_csv_rows(csv_bytes)
+    plan.total_records = len(plan.rows)
+    metrics.incr("Rows", plan.total_records)
+    logger.info("CSV rows parsed: %d", plan.total_records)
+
+    if PREFLIGHT_MODE != "off":
+        with metrics.stage("Preflight"):
+            plan.preflight = preflight_validate(parse_csv_header(csv_bytes), plan.rows, plan.layout)
+        preflight = plan.preflight
+        logger.info(
+            "Pre-flight ok=%s errors=%d warnings=%d (%.1f ms)",
+            preflight["ok"], len(preflight["errors"]), len(preflight["warnings"]), preflight["elapsedMs"],
+        )
+        if not preflight["ok"] and PREFLIGHT_MODE == "reject":
+            # deterministic failure: report it, do not raise (an SQS retry would fail the same way)
+            error_message = summarize_preflight(preflight)
+            logger.warning("Batch %s rejected by pre-flight: %s", plan.batch_id, error_message)
+            with metrics.stage("StatusUpdate"):
+                post_batch_status(
+                    plan.batch_id,
+                    {
+                        "status": "error",
+                        "totalRecords": plan.total_records,
+                        "errorMessage": error_message,
+                    },
                 )
+            plan.rejection = {
+                "batch_id": plan.batch_id,
+                "status": "error",
+                "totalRecords": plan.total_records,
+                "preflight": preflight,
+            }
+            return plan
+
+    # every signature the batch needs, downloaded concurrently up front instead of one at a
+    # time inside the render loop (the content hash covers the image bytes; render processes
+    # receive the cache with their chunks)
+    sig_urls = {resolve_signature_url(row["profesor"]) for row in plan.rows}
+    missing = sorted(url for url in sig_urls if url and url not in _SIGNATURE_BYTES_CACHE)
+    if missing:
+        with metrics.stage("Render"), open_io() as io:
+            io.gather([(get_signature_digest, (url,)) for url in missing])
+
+    # content hash of normalized row -> task index already planned
+    task_by_hash: Dict[str, int] = {}
+    normalizer = plan.normalizer
+    for row_number, row in enumerate(plan.rows, start=1):
+        profesor_value = row["profesor"]
+        try:
+            sig_url = resolve_signature_url(profesor_value)
+            if not sig_url:
+                raise RuntimeError(f"No signature found for profesor='{profesor_value}'")
 
-                student_clean = clean_name(nombre.lower())
-                course_clean = clean_name(curso.lower())
-                uid = uuid.uuid4().hex
+            sig_digest = get_signature_digest(sig_url)
+            content_hash = row_content_hash(
+                normalizer.fields(row["nombre"], row["curso"], row["fecha"], profesor_value), sig_url, sig_digest
+            )
+            previous = task_by_hash.get(content_hash)
+            if previous is not None:
+                # identical diploma already in the ZIP: reuse it, do not render again
+                plan.duplicate_rows += 1
+                plan.row_plan.append(("duplicate", previous))
+                continue
+
+            student_clean = normalizer.clean_name(row["nombre"].lower())
+            course_clean = normalizer.clean_name(row["curso"].lower())
+            index = len(plan.tasks)
+            plan.tasks.append({
+                "index": index,
+                "rowNumber": row_number,
+                "nombre": row["nombre"],
+                "curso": row["curso"],
+                "fecha": row["fecha"],
+                "profesor": profesor_value,
+                "signatureUrl": sig_url,
+                "signatureDigest": sig_digest,
+                "contentHash": content_hash,
+                "filename": f"{student_clean}_{course_clean}_{uuid.uuid4().hex}.pdf",
+            })
+            task_by_hash[content_hash] = index
+            plan.row_plan.append(("render", index))
 
-                pdf_filename = f"{student_clean}_{course_clean}_{uid}.pdf"
-                pdf_path = os.path.join(workdir, pdf_filename)
-                with open(pdf_path, "wb") as f:
-                    f.write(pdf_bytes)
+        except Exception as e:
+            metrics.incr("RowErrors")
+            logger.exception("Row failed: %s", e)
+            plan.row_plan.append(("error", str(e)))
+
+    if plan.duplicate_rows:
+        logger.info("Duplicate rows skipped (same content as an earlier row): %d", plan.duplicate_rows)
+    metrics.incr("DuplicateRows", plan.duplicate_rows)
+
+    # private scratch dir; PDFs move into the archive (or up to S3) as chunks complete. Created
+    # last: nothing above may fail with it (and its archive/upload threads) left unreleased
+    plan.scratch = ScratchSpace(plan.batch_id)
+    plan.workdir = plan.scratch.files_dir
+    try:
+        if plan.output_mode == "objects":
+            plan.uploader = ObjectUploader(plan.scratch, f"{plan.parent_prefix}/diploma-generated/{plan.original_file}")
+        else:
+            plan.archive = ShardedArchive(plan.scratch, plan.parent_prefix, plan.original_file)
+    except BaseException:
+        plan.scratch.cleanup()
+        raise
+    return plan
+
+
+def render_chunk(chunk: Dict[str, Any], metrics: Optional[BatchMetrics] = None) -> Dict[str, Any]:
+    """
+    Renders (or copies from the render store) and writes to the workdir every
+    task in one chunk from BatchPlan.chunks. Row failures become outcomes, not
+    exceptions. Self-contained so it can run in a pool process: without
+    `metrics`, the chunk's own stage timings/counters are returned for
+    BatchPlan.record to merge.
+    """
+    own_metrics = metrics is None
+    if own_metrics:
+        metrics = BatchMetrics()
+    normalizer = chunk.get("normalizer") or NormalizationCache()
+    template_pdf = chunk["template"]
+    layout = chunk["layout"]
+    use_store = chunk["useStore"]
+    store_hits = 0
+    store_misses = 0
+    outcomes = []
+    # bytes this chunk may write to the workdir (BatchPlan.reserve_scratch); None = free disk only
+    allowance = chunk.get("scratchAllowance")
+    written = 0
+
+    # render store reads run IO_PREFETCH_DEPTH rows ahead of rendering, writes in the background
+    io = open_io() if use_store else SyncIO()
+    tasks = chunk["tasks"]
+    # a row whose signature could not be hashed at planning is rendered but never stored
+    store_keys = [
+        render_store_key(chunk["fingerprint"], task["contentHash"]) if use_store and task["signatureDigest"] else ""
+        for task in tasks
+    ]
+    stored = io.prefetch(lambda key: render_store_get(key) if key else None, store_keys) if use_store else None
 
-                results.append([nombre, curso, fecha, profesor_value, "exitosamente creado"])
+    try:
+        for task, store_key in zip(tasks, store_keys):
+            sig_url = task["signatureUrl"]
+            try:
+                pdf_bytes = None
+                if stored is not None:
+                    # waits only when the read has not finished yet
+                    with metrics.stage("RenderStore"):
+                        _, pdf_bytes = next(stored)
+                    if pdf_bytes is not None:
+                        store_hits += 1
+                    elif store_key:
+                        store_misses += 1
+
+                if pdf_bytes is None:
+                    pdf_bytes = generate_one_pdf_bytes(
+                        template_pdf_bytes=template_pdf,
+                        layout=layout,
+                        nombre=task["nombre"],
+                        curso=task["curso"],
+                        fecha=task["fecha"],
+                        profesor_value=task["profesor"],
+                        signature_url=sig_url,
+                        normalizer=normalizer,
+                        metrics=metrics,
+                    )
+                    metrics.incr("RowsRendered")
+                    # only store complete diplomas (signature download may have failed and been skipped)
+                    if store_key and sig_url in _SIGNATURE_BYTES_CACHE:
+                        with metrics.stage("RenderStore"):
+                            io.submit(render_store_put, store_key, pdf_bytes)
+
+                over_budget = allowance is not None and written + len(pdf_bytes) > allowance
+                if over_budget or not scratch_has_room(chunk["workdir"], len(pdf_bytes)):
+                    # past SCRATCH_BUDGET_MB or /tmp is short: hand the PDF to the archive in memory
+                    # instead of failing with ENOSPC
+                    outcomes.append({"index": task["index"], "error": None, "pdf": pdf_bytes})
+                    continue
+                with metrics.stage("WriteFiles"):
+                    with open(os.path.join(chunk["workdir"], task["filename"]), "wb") as f:
+                        f.write(pdf_bytes)
+                written += len(pdf_bytes)
+                metrics.incr("BytesWritten", len(pdf_bytes))
+                outcomes.append({"index": task["index"], "error": None, "bytes": len(pdf_bytes)})
 
             except Exception as e:
+                metrics.incr("RowErrors")
+                logger.exception("Row failed: %s", e)
+                outcomes.append({"index": task["index"], "error": str(e)})
+    finally:
+        io.close()   # waits for background store writes
+
+    result: Dict[str, Any] = {
+        "batchId": chunk["batchId"],
+        "outcomes": outcomes,
+        "storeHits": store_hits,
+        "storeMisses": store_misses,
+        "scratchAllowance": allowance or 0,
+    }
+    if own_metrics:
+        result["metrics"] = {"stageSeconds": dict(metrics.stage_seconds), "counters": dict(metrics.counters)}
+    return result
+
+
+def run_chunks_inline(plan: BatchPlan, metrics: BatchMetrics) -> None:
+    """
+    Default chunk runner: every chunk in this process, in order (Lambda).
+    """
+    for chunk in plan.chunks():
+        plan.record(render_chunk(plan.reserve_scratch(chunk, 1), metrics=metrics), metrics)
+
+
+def signature_cache_for(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The parent's signature bytes and transparent PNGs for a chunk's tasks, so a
+    render process started from the fork server does not download or convert
+    them again.
+    """
+    urls = {task["signatureUrl"] for task in chunk["tasks"] if task.get("signatureUrl")}
+    return {
+        "bytes": {url: _SIGNATURE_BYTES_CACHE[url] for url in urls if url in _SIGNATURE_BYTES_CACHE},
+        "png": {key: png for key, png in _SIGNATURE_PNG_CACHE.items() if key[0] in urls},
+    }
+
+
+def _render_process_main(conn) -> None:
+    """
+    Render process loop for run_chunks_parallel: chunk in, render_chunk result out,
+    None to exit. Started from the fork server (handler preloaded, no threads),
+    so each chunk brings the signature cache it needs (signature_cache_for).
+    """
+    while True:
+        chunk = conn.recv()
+        if chunk is None:
+            break
+        cache = chunk.pop("signatureCache", None) or {}
+        _SIGNATURE_BYTES_CACHE.update(cache.get("bytes", {}))
+        _SIGNATURE_PNG_CACHE.update(cache.get("png", {}))
+        try:
+            conn.send(render_chunk(chunk))
+        except Exception as e:
+            conn.send({"error": f"{type(e).__name__}: {e}"})
+    conn.close()
+
+
+def run_chunks_parallel(plan: BatchPlan, metrics: BatchMetrics) -> None:
+    """
+    Chunk runner for multi-vCPU Lambdas: render processes fed over pipes
+    (Lambda has no /dev/shm, so multiprocessing pools/queues are not an option),
+    sized and throttled by a ConcurrencyController. One process or one chunk:
+    same as run_chunks_inline.
+
+    The processes come from a forkserver, not a fork of this process: this one
+    runs the status dispatcher, I/O loop and secret refresh threads, and a
+    child could inherit a lock one of them held. The fork server is started
+    once per container with handler preloaded, so a new render process costs a
+    fork, not an import.
+    """
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    cap = int(RENDER_PROCESSES) if RENDER_PROCESSES.isdigit() else None
+    chunks = plan.chunks(portable=True)
+    controller = ConcurrencyController(cap=cap)
+    plan.concurrency = controller.summary()
+    if controller.max_workers <= 1 or len(chunks) <= 1:
+        run_chunks_inline(plan, metrics)
+        return
+
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload([__name__])   # no-op once the server is running
+    procs: Dict[Any, Any] = {}   # parent end of the pipe -> render process
+
+    def spawn() -> Any:
+        parent_conn, child_conn = ctx.Pipe()
+        proc = ctx.Process(target=_render_process_main, args=(child_conn,), daemon=True)
+        proc.start()
+        child_conn.close()
+        procs[parent_conn] = proc
+        return parent_conn
+
+    def retire(conn: Any) -> None:
+        proc = procs.pop(conn)
+        try:
+            conn.send(None)
+        except (OSError, ValueError):
+            pass
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.kill()
+        conn.close()
+
+    idle: List[Any] = []
+    busy: List[Any] = []
+    pending = list(reversed(chunks))
+    try:
+        while pending or busy:
+            controller.update([proc.pid for proc in procs.values()])
+            # scaled down: free the memory of surplus idle processes
+            while idle and len(procs) > controller.target:
+                retire(idle.pop())
+            while pending and controller.can_dispatch(len(busy)):
+                if not idle:
+                    if len(procs) >= min(controller.target, len(chunks)) and busy:
+                        break
+                    idle.append(spawn())
+                conn = idle.pop()
+                chunk = plan.reserve_scratch(pending.pop(), controller.max_workers - len(busy))
+                conn.send({**chunk, "signatureCache": signature_cache_for(chunk)})
+                busy.append(conn)
+            for conn in wait(busy, timeout=0.5):
+                try:
+                    result = conn.recv()
+                except EOFError:
+                    raise RuntimeError("A render process exited unexpectedly (out of memory?)")
+                if "error" in result:
+                    raise RuntimeError(f"Render process failed: {result['error']}")
+                plan.record(result, metrics)
+                busy.remove(conn)
+                idle.append(conn)
+    finally:
+        for conn in list(procs):
+            retire(conn)
+        plan.concurrency = controller.summary()
+
+
+def finalize_batch(plan: BatchPlan, metrics: BatchMetrics) -> Dict[str, Any]:
+    """
+    Result CSV (row order), archive (or object manifest), S3 upload and final PATCH.
+    """
+    batch_id = plan.batch_id
+    total_records = plan.total_records
+
+    # objects mode: every PDF was submitted while rendering; wait for the stragglers
+    object_urls: Dict[int, str] = {}
+    if plan.uploader is not None:
+        with metrics.stage("S3Upload"):
+            for index, (url, error) in plan.uploader.wait().items():
+                if error:
+                    plan.outcomes[index]["error"] = f"error al subir el PDF: {error}"
+                else:
+                    object_urls[index] = url
+        metrics.incr("ObjectsUploaded", len(object_urls))
+
+    results: List[List[str]] = [["nombre", "curso", "fecha", "profesor", "resultado"]]
+    manifest_lines: List[str] = []   # objects mode: one JSON object per CSV row
+    any_row_errors = False
+    for row_number, (row, (kind, value)) in enumerate(zip(plan.rows, plan.row_plan), start=1):
+        base = [row["nombre"], row["curso"], row["fecha"], row["profesor"]]
+        entry: Dict[str, Any] = {"row": row_number, "nombre": row["nombre"], "curso": row["curso"]}
+        if kind == "error":
+            any_row_errors = True
+            results.append(base + [value])
+            entry.update(status="error", error=value)
+        else:
+            task = plan.tasks[value]
+            error = plan.outcomes.get(value, {"error": "not rendered"})["error"]
+            if error:
                 any_row_errors = True
-                err_msg = str(e)
-                logger.exception("Row failed: %s", err_msg)
-                results.append([nombre, curso, fecha, profesor_value, err_msg])
-
-        # Write result CSV inside workdir
-        with open(result_csv_path, "w", encoding="utf-8", newline="") as f:
-            w = csv.writer(f)
-            w.writerows(results)
-
-        # Zip whole workdir
-        zip_path = os.path.join("/tmp", f"{original_file}.zip")
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for root, _, files in os.walk(workdir):
-                for filename in files:
-                    full = os.path.join(root, filename)
-                    arcname = os.path.relpath(full, workdir)
-                    zf.write(full, arcname=arcname)
-
-        zip_url = upload_zip_to_s3(zip_path, parent_prefix, original_file)
-
-        # status per your rule:
-        # - "error" only if interrupted and didn't reach the end
-        # - if reached the end but some rows failed, keep "completado" (and row-level errors in resultado.csv)
-        status = "error" if interrupted else "completado"
-
-        admin_patch(
-            f"/diploma-batches/{batch_id}",
+                results.append(base + [error])
+                entry.update(status="error", error=error)
+            elif kind == "duplicate":
+                results.append(base + [f"duplicado de la fila {task['rowNumber']} ({task['filename']})"])
+                entry.update(status="duplicate", duplicateOf=task["rowNumber"], url=object_urls.get(value))
+            else:
+                results.append(base + ["exitosamente creado"])
+                entry.update(status="created", url=object_urls.get(value))
+        if plan.uploader is not None:
+            manifest_lines.append(json.dumps(entry, ensure_ascii=False))
+
+    store_lookups = plan.store_hits + plan.store_misses
+    render_store_stats = {
+        "enabled": plan.use_store,
+        "hits": plan.store_hits,
+        "misses": plan.store_misses,
+        "hitRate": round(plan.store_hits / store_lookups, 4) if store_lookups else 0.0,
+    }
+    metrics.incr("RenderStoreHits", plan.store_hits)
+    metrics.incr("RenderStoreMisses", plan.store_misses)
+    if plan.use_store:
+        logger.info("Render store: %s", render_store_stats)
+
+    normalizer = plan.normalizer
+    normalization_stats = normalizer.stats()
+    metrics.incr("NormalizationHits", normalizer.hits)
+    metrics.incr("NormalizationMisses", normalizer.misses)
+    logger.info("Normalization cache: %s", normalization_stats)
+
+    # Result CSV into the (last) archive part, next to the PDFs
+    base_name = os.path.splitext(plan.original_file)[0]
+    out = StringIO()
+    csv.writer(out).writerows(results)
+    result_csv = out.getvalue().encode("utf-8")
+    metrics.incr("BytesWritten", len(result_csv))
+
+    archive_stats: Optional[Dict[str, Any]] = None
+    objects_stats: Optional[Dict[str, Any]] = None
+    if plan.uploader is not None:
+        # zipUrl points at the JSON-lines manifest (row -> object URL)
+        key_prefix = plan.uploader.key_prefix
+        with metrics.stage("S3Upload"):
+            result_csv_url = upload_bytes_to_s3(f"{key_prefix}/{base_name}-resultado.csv", result_csv, "text/csv")
+            zip_url = upload_bytes_to_s3(
+                f"{key_prefix}/manifest.jsonl", ("\n".join(manifest_lines) + "\n").encode("utf-8"),
+                "application/x-ndjson",
+            )
+        objects_stats = {
+            "uploaded": len(object_urls),
+            "failed": len(plan.uploader.futures) - len(object_urls),
+            "bytes": plan.uploader.bytes,
+            "resultCsvUrl": result_csv_url,
+            "manifestUrl": zip_url,
+        }
+    else:
+        # uploads the remaining part and waits for parts already uploading in the background
+        with metrics.stage("S3Upload"):
+            zip_url, archive_stats = plan.archive.finish({f"{base_name}-resultado.csv": result_csv})
+        metrics.incr("ZipBytes", archive_stats["bytes"])
+        if plan.archive.sharded:
+            logger.info("Batch %s archive split into %d parts: %s", batch_id, archive_stats["parts"], zip_url)
+
+    # status per your rule:
+    # - "error" only if interrupted and didn't reach the end
+    # - if reached the end but some rows failed, keep "completado" (and row-level errors in resultado.csv)
+    status = "completado"
+
+    # queued: delivered in the background, flushed before the invocation returns
+    with metrics.stage("StatusUpdate"):
+        post_batch_status(
+            batch_id,
             {
                 "status": status,
                 "totalRecords": total_records,
@@ -672,33 +3352,71 @@ def process_one_batch(msg: Dict[str, Any]) -> Dict[str, Any]:
             },
         )
 
-        return {
-            "batch_id": batch_id,
-            "status": status,
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "totalRecords": total_records,
+        "zipUrl": zip_url,
+        "rowErrors": any_row_errors,
+        "duplicateRows": plan.duplicate_rows,
+        "renderStore": render_store_stats,
+        "normalization": normalization_stats,
+        "preflight": plan.preflight,
+        "concurrency": plan.concurrency,
+        "scratch": plan.scratch.stats(),
+        "outputMode": "objects" if plan.uploader is not None else "zip",
+        "archive": archive_stats,
+        "objects": objects_stats,
+        "process_folder": plan.process_folder,
+    }
+
+
+def fail_batch(batch_id: Any, total_records: int) -> None:
+    """
+    Best-effort PATCH of an interrupted batch as "error" (queued; replaces a
+    status for this batch that has not been sent yet).
+    """
+    post_batch_status(
+        batch_id,
+        {
+            "status": "error",
             "totalRecords": total_records,
-            "zipUrl": zip_url,
-            "rowErrors": any_row_errors,
-            "process_folder": process_folder,
-        }
+        },
+    )
 
-    except Exception as e:
-        interrupted = True
-        logger.exception("Batch processing interrupted: %s", e)
 
-        # attempt to update as interrupted error
-        try:
-            admin_patch(
-                f"/diploma-batches/{batch_id}",
-                {
-                    "status": "error",
-                    "totalRecords": total_records,
-                },
-            )
-        except Exception as e2:
-            logger.warning("Failed to PATCH batch error status: %s", e2)
+def default_chunk_runner() -> Callable[[BatchPlan, BatchMetrics], None]:
+    """
+    RENDER_PROCESSES=1 keeps the original single-process loop; "auto" or N lets
+    run_chunks_parallel size the render processes (N is the cap).
+    """
+    return run_chunks_inline if RENDER_PROCESSES == "1" else run_chunks_parallel
+
 
+def _process_one_batch(
+    msg: Dict[str, Any],
+    metrics: BatchMetrics,
+    chunk_runner: Optional[Callable[[BatchPlan, BatchMetrics], None]] = None,
+) -> Dict[str, Any]:
+    plan = plan_batch(msg, metrics)
+    if plan.rejection is not None:
+        return plan.rejection
+
+    try:
+        (chunk_runner or default_chunk_runner())(plan, metrics)
+        return finalize_batch(plan, metrics)
+    except Exception as e:
+        logger.exception("Batch processing interrupted: %s", e)
+        fail_batch(plan.batch_id, plan.total_records)
         # re-raise so SQS redrive can handle retry/DLQ
         raise
+    finally:
+        if plan.archive is not None:
+            plan.archive.abort()
+        if plan.uploader is not None:
+            plan.uploader.abort()
+        if plan.scratch is not None:
+            plan.scratch.cleanup()
 
 
 # =============================================================================
@@ -713,14 +3431,56 @@ def lambda_handler(event, context):
         ...
       ]
     }
+    body with "type": "validate-only" -> pre-flight report only, nothing rendered; the report
+    is uploaded next to the CSV (see validate_only). A direct invoke {"type": "validate-only", ...}
+    returns it instead.
+    body with "type": "warm-up" -> warm caches, one throwaway render (see warm_up).
+    A direct invoke {"type": "warm-up"} (no Records) is accepted too, e.g. after a deploy.
+    Direct invoke {"type": "preview", ...} returns the preview result itself (synchronous);
+    a Function URL / API Gateway request is treated as a preview.
+
+    If a record's final status (completado / error) is still undelivered after
+    the flush, the invocation raises StatusUndelivered, so SQS redelivers the
+    messages instead of leaving the batch "procesando".
     """
+    if "requestContext" in event and "Records" not in event:
+        return preview_http(event)
+    if event.get("type") == "preview" and "Records" not in event:
+        return preview(event)
+    if event.get("type") == "warm-up" and "Records" not in event:
+        return {"ok": True, "results": [warm_up(event)]}
+    if event.get("type") == "validate-only" and "Records" not in event:
+        return validate_only(event)
+
     logger.info("Event received with %d record(s)", len(event.get("Records", [])))
 
     out = []
-    for rec in event.get("Records", []):
-        body = rec.get("body", "")
-        msg = json.loads(body)
-        result = process_one_batch(msg)
-        out.append(result)
-
-    return {"ok": True, "results": out}
+    status_keys: List[Tuple[Any, Any]] = []   # (messageId, status key) per record
+    failed_before = STATUS_UPDATES.stats()["failed"]
+    try:
+        for rec in event.get("Records", []):
+            body = rec.get("body", "")
+            msg = json.loads(body)
+            status_keys.append((rec.get("messageId"), batch_status_key(msg.get("batch_id"))))
+            if msg.get("type") == "validate-only":
+                result = validate_only(msg, publish=True)
+            elif msg.get("type") == "warm-up":
+                result = warm_up(msg)
+            else:
+                result = process_one_batch(msg)
+            out.append(result)
+    finally:
+        # status PATCHes queued by the batches (also the "error" of an interrupted one)
+        status_updates = STATUS_UPDATES.flush(status_flush_timeout(context))
+        logger.info("Status updates: %s", json.dumps(status_updates, default=str))
+
+    undelivered = STATUS_UPDATES.undelivered(failed_before)
+    lost = [
+        message_id
+        for message_id, key in status_keys
+        if (undelivered.get(key) or {}).get("status") in TERMINAL_STATUSES
+    ]
+    if lost:
+        # the trigger does not report batch item failures: failing the invocation returns the messages
+        raise StatusUndelivered(f"Final status undelivered for message(s) {lost}; returning them to SQS")
+    return {"ok": True, "results": out, "statusUpdates": status_updates}
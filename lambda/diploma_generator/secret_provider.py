@@ -0,0 +1,86 @@
+"""
+The admin API key cache shared by handler.py and handler-2.py (see SecretProvider).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger()
+
+# re-fetched in the background after SECRET_REFRESH_AHEAD * SECRET_TTL_SECONDS
+SECRET_TTL_SECONDS = float(os.environ.get("SECRET_TTL_SECONDS", "300"))
+SECRET_REFRESH_AHEAD = float(os.environ.get("SECRET_REFRESH_AHEAD", "0.8"))
+
+
+class SecretProvider:
+    """
+    A secret kept in memory for SECRET_TTL_SECONDS. Reads never wait on the
+    network once a value is known:
+      - past SECRET_REFRESH_AHEAD of the TTL, get() returns the current value
+        and re-fetches it on a background thread;
+      - a failed refresh keeps serving the last value (logged);
+      - reload(stale) re-fetches right away, once per rotation, for a 401.
+    Only the very first get() with no fallback fetches inline.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], str], fallback: Optional[str] = None,
+                 ttl: Optional[float] = None):
+        self.name = name
+        self._fetch = fetch
+        self.ttl = SECRET_TTL_SECONDS if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._value: Optional[str] = fallback
+        self._refresh_at = 0.0   # monotonic time of the next background refresh; a fallback is already due
+        self._refreshing = False
+        self._reloaded_at = float("-inf")
+        self.refreshes = 0
+        self.reloads = 0
+
+    def _store(self, value: str) -> str:
+        self._value = value
+        self._refresh_at = time.monotonic() + self.ttl * SECRET_REFRESH_AHEAD
+        self.refreshes += 1
+        return value
+
+    def _refresh_in_background(self) -> None:
+        try:
+            value = self._fetch()
+            with self._lock:
+                self._store(value)
+        except Exception as e:
+            logger.warning("Secret %s refresh failed, still using the cached value: %s", self.name, e)
+        finally:
+            self._refreshing = False
+
+    def get(self) -> str:
+        value = self._value
+        if value is None:
+            with self._lock:
+                return self._value if self._value is not None else self._store(self._fetch())
+        if time.monotonic() >= self._refresh_at and not self._refreshing:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, name=f"secret-{self.name}",
+                                     daemon=True).start()
+        return value
+
+    def reload(self, stale: str) -> str:
+        """
+        The server rejected `stale`: fetch now, unless another caller already
+        replaced it or a reload ran in the last few seconds (a key the server
+        keeps rejecting must not turn every call into a fetch). Returns the
+        value to retry with (== stale if unchanged).
+        """
+        with self._lock:
+            if self._value != stale or time.monotonic() - self._reloaded_at < 5.0:
+                return self._value
+            self._reloaded_at = time.monotonic()
+            self.reloads += 1
+            try:
+                return self._store(self._fetch())
+            except Exception as e:
+                logger.warning("Secret %s reload failed: %s", self.name, e)
+                return stale
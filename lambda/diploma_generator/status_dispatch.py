@@ -0,0 +1,237 @@
+"""
+Background delivery of status updates and callbacks, shared by handler.py,
+handler-2.py and handler-3.py (see StatusDispatcher).
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Connection errors, timeouts, 5xx, 408 and 429 are worth retrying; any other
+    HTTP 4xx (bad payload, unknown batch, key still rejected) fails the same way again.
+    The status code comes from a requests HTTPError (.response.status_code) or
+    a urllib HTTPError (.code).
+    """
+    code = getattr(getattr(exc, "response", None), "status_code", None)
+    if code is None:
+        code = getattr(exc, "code", None)
+    return not isinstance(code, int) or code >= 500 or code in (408, 429)
+
+
+class StatusDispatcher:
+    """
+    Status updates off the critical path. post(key, send, payload) queues an
+    event and returns; background threads call send(payload):
+      - a newer event for a key that is still waiting replaces it (the newest
+        payload is authoritative), so a batch that moves on quickly only sends
+        its latest state;
+      - at most one event per key is in flight, so updates land in order;
+      - failures are retried after retry_base_seconds * 2^n (jittered, capped
+        at retry_max_seconds), up to max_attempts, unless is_retryable says
+        the error is permanent.
+    flush(timeout) waits for the queue to drain; call it before the invocation
+    returns (the container is frozen afterwards, and may never thaw), then
+    undelivered() tells which keys' latest update never landed.
+    """
+
+    class _Event:
+        __slots__ = ("key", "send", "payload", "attempts", "due", "queued_at")
+
+        def __init__(self, key: Any, send: Callable[[Dict[str, Any]], Any], payload: Dict[str, Any]):
+            self.key = key
+            self.send = send
+            self.payload = payload
+            self.attempts = 0
+            self.due = 0.0
+            self.queued_at = time.monotonic()
+
+    def __init__(self, threads: int = 1, max_attempts: int = 6, retry_base_seconds: float = 0.5,
+                 retry_max_seconds: float = 20.0, name: str = "status"):
+        self.threads = max(1, threads)
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.name = name    # thread names and log lines
+        self._reset()
+        # a forked child (render process) inherits the queue and the lock but not the threads
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._cond = threading.Condition()
+        self._pending: Dict[Any, "StatusDispatcher._Event"] = {}   # insertion order = send order
+        self._inflight: Dict[Any, "StatusDispatcher._Event"] = {}
+        self._workers: List[threading.Thread] = []
+        self.delivered = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failed: List[Dict[str, Any]] = []
+        self._lost: Dict[Any, Dict[str, Any]] = {}   # key -> payload dropped after its retries ran out
+        self.send_seconds = 0.0
+
+    def _ensure_workers(self) -> None:
+        # caller holds the lock; threads start with the first update
+        while len(self._workers) < self.threads:
+            t = threading.Thread(target=self._run, name=f"{self.name}-{len(self._workers)}", daemon=True)
+            self._workers.append(t)
+            t.start()
+
+    def post(self, key: Any, send: Callable[[Dict[str, Any]], Any], payload: Dict[str, Any]) -> None:
+        with self._cond:
+            self._ensure_workers()
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+            self._lost.pop(key, None)
+            self._pending[key] = StatusDispatcher._Event(key, send, payload)
+            self._cond.notify()
+
+    def _next(self) -> Tuple[Optional["StatusDispatcher._Event"], Optional[float]]:
+        # caller holds the lock: (event to send, None) or (None, seconds until one is due / None)
+        now = time.monotonic()
+        wait: Optional[float] = None
+        for key, event in self._pending.items():
+            if key in self._inflight:
+                continue
+            if event.due <= now:
+                del self._pending[key]
+                self._inflight[key] = event
+                return event, None
+            wait = event.due - now if wait is None else min(wait, event.due - now)
+        return None, wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                event, wait = self._next()
+                while event is None:
+                    self._cond.wait(wait)
+                    event, wait = self._next()
+            t0 = time.perf_counter()
+            error: Optional[BaseException] = None
+            try:
+                event.send(event.payload)
+            except Exception as e:
+                error = e
+            elapsed = time.perf_counter() - t0
+            with self._cond:
+                self.send_seconds += elapsed
+                self._inflight.pop(event.key, None)
+                if error is None:
+                    self.delivered += 1
+                else:
+                    self._failed_send(event, error)
+                self._cond.notify_all()
+
+    def _failed_send(self, event: "StatusDispatcher._Event", error: BaseException) -> None:
+        # caller holds the lock
+        event.attempts += 1
+        if event.key in self._pending:
+            # superseded while in flight: the newer event is authoritative
+            self.coalesced += 1
+            logger.info("%s update %s failed (%s); superseded by a newer one", self.name, event.key, error)
+            return
+        if event.attempts >= self.max_attempts or not is_retryable(error):
+            logger.error("%s update %s dropped after %d attempt(s): %s payload=%s",
+                         self.name, event.key, event.attempts, error, event.payload)
+            self.failed.append({"key": event.key, "error": str(error), "payload": event.payload,
+                                "retryable": is_retryable(error)})
+            if is_retryable(error):
+                self._lost[event.key] = event.payload
+            return
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (event.attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        event.due = time.monotonic() + delay
+        self.retries += 1
+        logger.warning("%s update %s failed (attempt %d): %s; retrying in %.1f s",
+                       self.name, event.key, event.attempts, error, delay)
+        self._pending[event.key] = event
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending) + len(self._inflight)
+
+    def flush(self, timeout: float) -> Dict[str, Any]:
+        """
+        Waits up to `timeout` seconds for every queued update to be delivered
+        (or given up on). Undelivered updates stay queued: a warm container keeps
+        retrying them on its next invocation. Returns stats() plus the wait.
+        """
+        t0 = time.monotonic()
+        deadline = t0 + max(0.0, timeout)
+        with self._cond:
+            while self._pending or self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            left = [
+                {"key": str(key), "payload": event.payload, "attempts": event.attempts}
+                for key, event in self._pending.items()
+            ] + [
+                {"key": str(key), "payload": event.payload, "attempts": event.attempts, "inFlight": True}
+                for key, event in self._inflight.items()
+            ]
+        if left:
+            logger.error("%s updates still undelivered after %.1f s: %s", self.name, timeout,
+                         json.dumps(left, default=str))
+        out = self.stats()
+        out["flushSeconds"] = round(time.monotonic() - t0, 3)
+        out["undelivered"] = left
+        return out
+
+    def wait(self, key: Any, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Waits up to `timeout` seconds for `key`'s queued updates, leaving the
+        other keys' alone. Returns the latest payload for `key` that has not
+        landed (still queued, in flight, or out of retries), else None. As in
+        undelivered(), a payload rejected as permanent counts as landed.
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while key in self._pending or key in self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            event = self._inflight.get(key) or self._pending.get(key)
+            return event.payload if event is not None else self._lost.get(key)
+
+    def undelivered(self, since_failed: int = 0) -> Dict[Any, Dict[str, Any]]:
+        """
+        Latest payload per key that has not landed: still queued, in flight, or
+        dropped after its retries ran out (self.failed[since_failed:]). Updates
+        dropped as permanent (is_retryable false) are left out: a resend would
+        be rejected the same way.
+        """
+        with self._cond:
+            out = {f["key"]: f["payload"] for f in self.failed[since_failed:] if f["retryable"]}
+            for key, event in list(self._inflight.items()) + list(self._pending.items()):
+                out[key] = event.payload
+            return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "delivered": self.delivered,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "failed": len(self.failed),
+                "sendSeconds": round(self.send_seconds, 3),
+            }
+
+
+def flush_timeout(context: Any, limit: float) -> float:
+    """
+    `limit` seconds, cut to leave one second of the Lambda's remaining time.
+    """
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining is None:
+        return limit
+    return max(0.0, min(limit, remaining() / 1000.0 - 1.0))
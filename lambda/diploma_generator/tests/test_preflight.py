@@ -0,0 +1,45 @@
+"""
+Pre-flight must not reject a batch over a free-text fecha: it renders as written.
+
+    cd lambda/diploma_generator
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from _common import handler, install_signatures, load_layout, load_template  # noqa: E402
+
+FREE_TEXT_FECHA = "Junio 2024"
+HEADER = ["nombre", "curso", "fecha", "profesor"]
+
+
+def row(fecha: str) -> dict:
+    return {"nombre": "Ana Gómez", "curso": "Taller", "fecha": fecha, "profesor": "Oscar Pimentel"}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def signatures():
+    install_signatures()
+
+
+def test_free_text_fecha_is_a_warning_not_an_error():
+    report = handler.preflight_validate(HEADER, [row("2024-01-29"), row(FREE_TEXT_FECHA)], load_layout())
+
+    assert report["ok"], report["errors"]
+    assert [(w["field"], w["value"], w["rows"]) for w in report["warnings"]] == [("fecha", FREE_TEXT_FECHA, [2])]
+
+
+def test_free_text_fecha_renders_as_written():
+    fitz = pytest.importorskip("fitz")
+    r = row(FREE_TEXT_FECHA)
+    pdf = handler.generate_one_pdf_bytes(
+        load_template(), load_layout(), r["nombre"], r["curso"], r["fecha"], r["profesor"],
+        handler.resolve_signature_url(r["profesor"]),
+    )
+
+    with fitz.open(stream=pdf, filetype="pdf") as doc:
+        assert FREE_TEXT_FECHA in doc[0].get_text()
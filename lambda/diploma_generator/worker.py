@@ -0,0 +1,561 @@
+"""
+Long-running diploma worker (EC2 / any host), outside the Lambda time limit.
+
+Consumes the same messages as handler.lambda_handler from SQS, or from a local
+SQLite queue for tests, and runs each batch through handler.process_one_batch.
+Up to WORKER_MAX_ACTIVE_BATCHES batches run at once; their render chunks are
+interleaved fairly on one process pool sized to the host (FairScheduler), so a
+20-row upload is not stuck behind a 50k-row one. Template, configuration and
+signatures stay cached between batches (refreshed every WORKER_CACHE_TTL_SECONDS).
+
+    # SQS (same queue the Lambda is subscribed to, or a dedicated "large batches" queue)
+    python worker.py --sqs-url https://sqs.us-east-1.amazonaws.com/123/diplomas
+
+    # local SQLite queue
+    python worker.py --sqlite /tmp/diplomas.db enqueue '{"batch_id": 2, "csv_url": "https://..."}'
+    python worker.py --sqlite /tmp/diplomas.db --once
+
+Environment: the same as the Lambda (MY-API-KEY, RESOURCES_BUCKET, ADMIN_BASE, ...) plus
+WORKER_PROCESSES, WORKER_MAX_ACTIVE_BATCHES, WORKER_SCHEDULING, WORKER_POLL_WAIT_SECONDS,
+WORKER_VISIBILITY_TIMEOUT, WORKER_CACHE_TTL_SECONDS.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import handler
+
+logger = logging.getLogger("diploma-worker")
+
+# Render processes cap; 0 = let handler.ConcurrencyController size it from CPUs and memory
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0"))
+WORKER_POLL_WAIT_SECONDS = int(os.environ.get("WORKER_POLL_WAIT_SECONDS", "20"))
+WORKER_VISIBILITY_TIMEOUT = int(os.environ.get("WORKER_VISIBILITY_TIMEOUT", "300"))
+WORKER_CACHE_TTL_SECONDS = float(os.environ.get("WORKER_CACHE_TTL_SECONDS", "900"))
+WORKER_MAX_ATTEMPTS = int(os.environ.get("WORKER_MAX_ATTEMPTS", "3"))
+# Batches rendered at the same time; their chunks share the pool (see FairScheduler)
+WORKER_MAX_ACTIVE_BATCHES = int(os.environ.get("WORKER_MAX_ACTIVE_BATCHES", "4"))
+WORKER_SCHEDULING = os.environ.get("WORKER_SCHEDULING", "round-robin").strip().lower()
+
+
+# Pool process: handler's signature caches per cache generation, most recently used last
+_POOL_CACHES: "OrderedDict[int, Tuple[Dict, Dict, Dict]]" = OrderedDict()
+POOL_CACHE_GENERATIONS = 2   # the current generation plus the one batches started under before a reload
+
+
+def _pool_process_init(pids) -> None:
+    pids.put(os.getpid())   # FairScheduler samples the pool processes' memory by pid
+
+
+def _use_cache_generation(generation: int) -> None:
+    caches = _POOL_CACHES.get(generation)
+    if caches is None:
+        caches = _POOL_CACHES[generation] = ({}, {}, {})
+        while len(_POOL_CACHES) > POOL_CACHE_GENERATIONS:
+            _POOL_CACHES.popitem(last=False)
+    else:
+        _POOL_CACHES.move_to_end(generation)
+    handler._SIGNATURE_BYTES_CACHE, handler._SIGNATURE_PNG_CACHE, handler._SIGNATURE_DIGEST_CACHE = caches
+
+
+def render_chunk_in_pool(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pool process entry point: handler.render_chunk on the signature caches of
+    the chunk's cache generation (bumped when the parent reloads its caches,
+    WORKER_CACHE_TTL_SECONDS). Chunks of batches started before and after a
+    reload can interleave on one process without emptying each other's caches.
+    Pool processes live as long as the pool.
+    """
+    _use_cache_generation(chunk.get("cacheGeneration", 0))
+    return handler.render_chunk(chunk)
+
+
+# =============================================================================
+# Queues: receive -> (receipt, body); ack / nack / extend per receipt
+# =============================================================================
+class SqsQueue:
+    """
+    SQS long polling. Failed messages are left to the queue's redrive policy.
+    """
+
+    def __init__(self, queue_url: str):
+        import boto3
+
+        self.queue_url = queue_url
+        self.sqs = boto3.client("sqs")
+
+    def receive(self, wait_seconds: int) -> List[Tuple[str, str]]:
+        resp = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=1,
+            WaitTimeSeconds=wait_seconds,
+            VisibilityTimeout=WORKER_VISIBILITY_TIMEOUT,
+        )
+        return [(m["ReceiptHandle"], m["Body"]) for m in resp.get("Messages", [])]
+
+    def ack(self, receipt: str) -> None:
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    def nack(self, receipt: str, error: str) -> None:
+        # visible again right away; maxReceiveCount on the queue decides the DLQ
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=receipt, VisibilityTimeout=0)
+
+    def extend(self, receipt: str, seconds: int) -> None:
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=receipt, VisibilityTimeout=seconds)
+
+
+class SqliteQueue:
+    """
+    Local queue for tests and single-host runs. A received message is leased
+    until ack/nack or lease expiry; after WORKER_MAX_ATTEMPTS it is marked failed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " body TEXT NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'queued',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_until REAL NOT NULL DEFAULT 0,"
+            " error TEXT)"
+        )
+
+    def enqueue(self, body: str) -> int:
+        with self.lock:
+            cur = self.conn.execute("INSERT INTO messages (body) VALUES (?)", (body,))
+            return cur.lastrowid
+
+    def _claim(self) -> Optional[Tuple[str, str]]:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT id, body FROM messages"
+                    " WHERE state = 'queued' OR (state = 'inflight' AND lease_until < ?)"
+                    " ORDER BY id LIMIT 1",
+                    (time.time(),),
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE messages SET state = 'inflight', attempts = attempts + 1, lease_until = ?"
+                        " WHERE id = ?",
+                        (time.time() + WORKER_VISIBILITY_TIMEOUT, row[0]),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return (str(row[0]), row[1]) if row is not None else None
+
+    def receive(self, wait_seconds: int) -> List[Tuple[str, str]]:
+        deadline = time.time() + wait_seconds
+        while True:
+            claimed = self._claim()
+            if claimed is not None or time.time() >= deadline:
+                return [claimed] if claimed is not None else []
+            time.sleep(0.2)
+
+    def ack(self, receipt: str) -> None:
+        with self.lock:
+            self.conn.execute("UPDATE messages SET state = 'done', error = NULL WHERE id = ?", (int(receipt),))
+
+    def nack(self, receipt: str, error: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "UPDATE messages SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                " lease_until = 0, error = ? WHERE id = ?",
+                (WORKER_MAX_ATTEMPTS, error[:2000], int(receipt)),
+            )
+
+    def extend(self, receipt: str, seconds: int) -> None:
+        with self.lock:
+            self.conn.execute("UPDATE messages SET lease_until = ? WHERE id = ?", (time.time() + seconds, int(receipt)))
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM messages GROUP BY state").fetchall())
+
+
+# =============================================================================
+# Worker
+# =============================================================================
+class Heartbeat:
+    """
+    Keeps a message invisible (SQS visibility / SQLite lease) while its batch runs.
+    """
+
+    def __init__(self, queue, receipt: str):
+        self.queue = queue
+        self.receipt = receipt
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        interval = max(5, WORKER_VISIBILITY_TIMEOUT // 3)
+        while not self.stopped.wait(interval):
+            try:
+                self.queue.extend(self.receipt, WORKER_VISIBILITY_TIMEOUT)
+            except Exception as e:
+                logger.warning("Could not extend message %s: %s", self.receipt[:16], e)
+
+    def __enter__(self) -> "Heartbeat":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+
+SCHEDULING_POLICIES = ("round-robin", "shortest-first")
+
+
+class FairScheduler:
+    """
+    Feeds render chunks from every active batch to one process pool. How many
+    chunks may be in flight comes from a handler.ConcurrencyController (CPUs,
+    memory headroom, backpressure near the limit), so a new batch's chunks are
+    picked up as soon as a slot frees instead of queueing behind a big batch.
+
+      round-robin     one chunk per active batch in turn
+      shortest-first  the batch with the fewest rows left goes first (small
+                      uploads finish first; big ones get every free slot otherwise)
+    """
+
+    def __init__(self, processes: int = 0, policy: str = WORKER_SCHEDULING):
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling policy {policy!r} (expected one of {SCHEDULING_POLICIES})")
+        self.controller = handler.ConcurrencyController(cap=processes or None)
+        self.processes = self.controller.max_workers
+        self.policy = policy
+        self.cond = threading.Condition()
+        self.pending: "OrderedDict[Any, Deque[Tuple[Dict[str, Any], Future]]]" = OrderedDict()
+        self.pending_rows: Dict[Any, int] = {}
+        self.prepare: Dict[Any, Any] = {}   # key -> callable(chunk) run right before the chunk is dispatched
+        self.inflight = 0
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.pool_pids: List[int] = []
+        self._pid_queue: Any = None   # pool processes report their pid here on start
+        self.closed = False
+        self.dispatched = 0
+        self.thread = threading.Thread(target=self._dispatch_loop, name="fair-scheduler", daemon=True)
+        self.thread.start()
+
+    # -- pool ------------------------------------------------------------------
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # spawn: pool processes never inherit this process's threads/locks
+            context = multiprocessing.get_context("spawn")
+            self._pid_queue = context.SimpleQueue()
+            self.pool_pids = []
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=context,
+                initializer=_pool_process_init, initargs=(self._pid_queue,),
+            )
+            logger.info("Render pool started with %d processes (%s)", self.processes, self.policy)
+        return self.pool
+
+    def _pool_pids(self) -> List[int]:
+        # caller holds the lock; pids arrive from _pool_process_init as processes start
+        while self._pid_queue is not None and not self._pid_queue.empty():
+            self.pool_pids.append(self._pid_queue.get())
+        return list(self.pool_pids)
+
+    def _reset_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self.cond:
+            if self.pool is pool:
+                self.pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # -- public ----------------------------------------------------------------
+    def submit(self, key: Any, chunks: List[Dict[str, Any]], prepare: Optional[Any] = None) -> List[Future]:
+        """
+        Queues one batch's chunks; each returned future resolves to render_chunk's result.
+        prepare(chunk), if given, runs when a chunk is dispatched (e.g. BatchPlan.reserve_scratch).
+        """
+        futures = []
+        with self.cond:
+            if prepare is not None:
+                self.prepare[key] = prepare
+            queue = self.pending.setdefault(key, deque())
+            for chunk in chunks:
+                future: Future = Future()
+                queue.append((chunk, future))
+                futures.append(future)
+                self.pending_rows[key] = self.pending_rows.get(key, 0) + len(chunk["tasks"])
+            self.cond.notify_all()
+        return futures
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    # -- dispatch --------------------------------------------------------------
+    def _pick(self) -> Tuple[Dict[str, Any], Future]:
+        if self.policy == "shortest-first":
+            key = min(self.pending, key=lambda k: self.pending_rows.get(k, 0))
+        else:
+            key = next(iter(self.pending))
+            self.pending.move_to_end(key)
+        queue = self.pending[key]
+        chunk, future = queue.popleft()
+        self.pending_rows[key] -= len(chunk["tasks"])
+        prepare = self.prepare.get(key)
+        if not queue:
+            del self.pending[key]
+            del self.pending_rows[key]
+            self.prepare.pop(key, None)
+        if prepare is not None:
+            chunk = prepare(chunk)
+        return chunk, future
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self.cond:
+                while not self.closed and (not self.pending or not self.controller.can_dispatch(self.inflight)):
+                    # re-sample memory while waiting, so a pause can lift without a completion
+                    self.cond.wait(timeout=0.5)
+                    self.controller.update(self._pool_pids())
+                if not self.closed:
+                    self.controller.update(self._pool_pids())
+                    if not self.controller.can_dispatch(self.inflight):
+                        continue
+                if self.closed:
+                    for queue in self.pending.values():
+                        for _, future in queue:
+                            future.cancel()
+                    return
+                chunk, future = self._pick()
+                self.inflight += 1
+                self.dispatched += 1
+                pool = self._ensure_pool()
+
+            if not future.set_running_or_notify_cancel():
+                self._chunk_done(None, future, pool)
+                continue
+            try:
+                pool_future = pool.submit(render_chunk_in_pool, chunk)
+            except Exception as e:  # broken/shut down pool
+                future.set_exception(e)
+                self._chunk_done(None, future, pool)
+                continue
+            pool_future.add_done_callback(lambda f, out=future, p=pool: self._chunk_done(f, out, p))
+
+    def _chunk_done(self, pool_future: Optional[Future], future: Future, pool: ProcessPoolExecutor) -> None:
+        if pool_future is not None:
+            try:
+                future.set_result(pool_future.result())
+            except BrokenProcessPool as e:
+                future.set_exception(e)
+                # a render process died (OOM kill?): the next dispatch starts a fresh pool
+                self._reset_pool(pool)
+            except BaseException as e:
+                future.set_exception(e)
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify_all()
+
+
+class Worker:
+    def __init__(
+        self,
+        queue,
+        processes: int = WORKER_PROCESSES,
+        max_active: int = WORKER_MAX_ACTIVE_BATCHES,
+        policy: str = WORKER_SCHEDULING,
+    ):
+        self.queue = queue
+        self.max_active = max(1, max_active)
+        self.scheduler = FairScheduler(processes, policy)
+        self.processes = self.scheduler.processes
+        self.stopping = False
+        self.warmed_at = 0.0
+        self.cache_generation = 0   # bumped on every reload; pool processes follow it per chunk
+        self.cache_lock = threading.Lock()
+        self.active = 0
+        self.active_cond = threading.Condition()
+        self.batches = 0
+        self.failures = 0
+
+    def run_chunks_fair(self, plan: "handler.BatchPlan", metrics: "handler.BatchMetrics") -> None:
+        """
+        chunk_runner for handler.process_one_batch: the plan's chunks go through
+        the shared FairScheduler; this batch's thread waits for its own results.
+        """
+        chunks = plan.chunks(portable=True)
+        for chunk in chunks:
+            chunk["cacheGeneration"] = self.cache_generation
+        futures = self.scheduler.submit(
+            plan.batch_id, chunks, prepare=lambda chunk: plan.reserve_scratch(chunk, self.processes)
+        )
+        for future in as_completed(futures):
+            plan.record(future.result(), metrics)
+
+    # -- caches ----------------------------------------------------------------
+    def _refresh_caches(self) -> None:
+        with self.cache_lock:
+            if time.time() - self.warmed_at < WORKER_CACHE_TTL_SECONDS:
+                return
+            if self.warmed_at:
+                logger.info("Cache TTL reached; reloading template, configuration and signatures")
+                handler.reset_init_caches()
+                self.cache_generation += 1
+            handler.warm_init()
+            self.warmed_at = time.time()
+
+    # -- messages --------------------------------------------------------------
+    def handle(self, body: str) -> Dict[str, Any]:
+        msg = json.loads(body)
+        kind = msg.get("type")
+        if kind == "validate-only":
+            return handler.validate_only(msg, publish=True)
+        if kind == "warm-up":
+            with self.cache_lock:
+                self.warmed_at = time.time()
+                return handler.warm_up(msg)
+        if kind == "preview":
+            raise ValueError("preview is synchronous; invoke the Lambda directly")
+        self._refresh_caches()
+        return handler.process_one_batch(msg, chunk_runner=self.run_chunks_fair)
+
+    def _final_status_lost(self, body: str) -> Optional[Dict[str, Any]]:
+        """
+        Waits (at most STATUS_FLUSH_SECONDS) for the message's batch status to
+        reach the admin API. Returns the final status (completado / error) if
+        it did not, so the message is not acked over a batch left "procesando".
+        """
+        batch_id = json.loads(body).get("batch_id")
+        if batch_id is None:
+            return None
+        payload = handler.STATUS_UPDATES.wait(handler.batch_status_key(batch_id), handler.STATUS_FLUSH_SECONDS)
+        if payload is not None and payload.get("status") in handler.TERMINAL_STATUSES:
+            return payload
+        return None
+
+    def _process(self, receipt: str, body: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            with Heartbeat(self.queue, receipt):
+                result = self.handle(body)
+                lost = self._final_status_lost(body)
+            if lost is not None:
+                raise handler.StatusUndelivered(f"Final status {lost.get('status')!r} undelivered")
+            self.queue.ack(receipt)
+            self.batches += 1
+            logger.info(
+                "Message done in %.1f s: %s",
+                time.perf_counter() - t0,
+                json.dumps({k: result.get(k) for k in ("batch_id", "type", "status", "totalRecords")}),
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.exception("Message failed: %s", e)
+            self.queue.nack(receipt, f"{type(e).__name__}: {e}")
+        finally:
+            with self.active_cond:
+                self.active -= 1
+                self.active_cond.notify_all()
+
+    def run(self, once: bool = False) -> int:
+        """
+        Polls until stopped (SIGTERM/SIGINT finish the active batches first).
+        Each message runs in its own thread, at most max_active at a time.
+        once=True: exit when the queue is empty and nothing is running.
+        """
+        while not self.stopping:
+            with self.active_cond:
+                while self.active >= self.max_active and not self.stopping:
+                    self.active_cond.wait()
+                busy = self.active > 0
+            if self.stopping:
+                break
+
+            # short polls while batches run, so new small ones join the rotation quickly
+            messages = self.queue.receive(0 if (once or busy) else WORKER_POLL_WAIT_SECONDS)
+            if not messages:
+                if once and not busy:
+                    break
+                if busy:
+                    with self.active_cond:
+                        self.active_cond.wait(timeout=1.0)
+                continue
+
+            for receipt, body in messages:
+                with self.active_cond:
+                    self.active += 1
+                threading.Thread(target=self._process, args=(receipt, body), daemon=True).start()
+
+        with self.active_cond:
+            while self.active:
+                self.active_cond.wait()
+        self.scheduler.close()
+        # every message waited for its own status; this catches non-final ones still queued
+        status_updates = handler.STATUS_UPDATES.flush(handler.STATUS_FLUSH_SECONDS)
+        logger.info("Status updates: %s", json.dumps(status_updates, default=str))
+        logger.info("Concurrency: %s", json.dumps(self.scheduler.controller.summary()))
+        logger.info("Worker stopped after %d message(s), %d failure(s)", self.batches, self.failures)
+        return 1 if self.failures else 0
+
+    def stop(self, *_args) -> None:
+        logger.info("Stop requested; finishing the active messages")
+        self.stopping = True
+        with self.active_cond:
+            self.active_cond.notify_all()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--sqs-url", help="SQS queue URL")
+    src.add_argument("--sqlite", help="path of a local SQLite queue")
+    ap.add_argument("--processes", type=int, default=WORKER_PROCESSES,
+                    help="render processes cap (default 0: sized from CPUs and memory)")
+    ap.add_argument("--max-active", type=int, default=WORKER_MAX_ACTIVE_BATCHES,
+                    help="batches rendered at the same time")
+    ap.add_argument("--scheduling", choices=SCHEDULING_POLICIES, default=WORKER_SCHEDULING)
+    ap.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    sub = ap.add_subparsers(dest="command")
+    enqueue = sub.add_parser("enqueue", help="add message bodies (JSON) to the SQLite queue")
+    enqueue.add_argument("bodies", nargs="+")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+
+    if args.command == "enqueue":
+        if not args.sqlite:
+            ap.error("enqueue needs --sqlite (use the AWS CLI / console for SQS)")
+        queue = SqliteQueue(args.sqlite)
+        for body in args.bodies:
+            json.loads(body)  # reject malformed JSON before it reaches the worker
+            print(queue.enqueue(body))
+        return 0
+
+    queue = SqsQueue(args.sqs_url) if args.sqs_url else SqliteQueue(args.sqlite)
+    worker = Worker(queue, processes=args.processes, max_active=args.max_active, policy=args.scheduling)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.run(once=args.once)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
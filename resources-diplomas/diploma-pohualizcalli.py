@@ -1,6 +1,7 @@
 import json
 import os
 from io import BytesIO
+from typing import Callable, Dict, Optional
 from datetime import datetime
 import unicodedata
 
@@ -33,6 +34,9 @@ from PIL import Image
 # Get the total width of the page
 page_width = letter[0]
 
+# Merge implementation: "pypdf2" (default) or "pikepdf" (native, pip install pikepdf)
+PDF_MERGE_BACKEND = os.environ.get("PDF_MERGE_BACKEND", "pypdf2").strip().lower()
+
 # ------------------------------
 # JSON layout helpers
 # ------------------------------
@@ -143,6 +147,50 @@ def centered_x_in_range(text: str, x_min: float, x_max: float, font_name: str, f
         x = right_bound
     return x
 
+# ------------------------------
+# PDF merge backends (template bytes + overlay bytes -> PDF bytes)
+# ------------------------------
+def merge_overlay_pypdf2(template_pdf_bytes: bytes, overlay_pdf_bytes: bytes) -> bytes:
+    pdf_temp = PdfReader(BytesIO(overlay_pdf_bytes))
+    page = PdfReader(BytesIO(template_pdf_bytes)).pages[0]
+    page.merge_page(pdf_temp.pages[0])
+
+    pdf_writer = PdfWriter()
+    pdf_writer.add_page(page)
+    out = BytesIO()
+    pdf_writer.write(out)
+    return out.getvalue()
+
+
+def merge_overlay_pikepdf(template_pdf_bytes: bytes, overlay_pdf_bytes: bytes) -> bytes:
+    """
+    Same result as merge_page, but done by qpdf. The overlay keeps its own
+    mediabox so nothing is scaled or re-centered.
+    """
+    import pikepdf
+
+    with pikepdf.open(BytesIO(template_pdf_bytes)) as base, pikepdf.open(BytesIO(overlay_pdf_bytes)) as overlay:
+        del base.pages[1:]
+        overlay_page = overlay.pages[0]
+        base.pages[0].add_overlay(overlay_page, pikepdf.Rectangle(*overlay_page.mediabox))
+        out = BytesIO()
+        base.save(out)
+        return out.getvalue()
+
+
+MERGE_BACKENDS: Dict[str, Callable[[bytes, bytes], bytes]] = {
+    "pypdf2": merge_overlay_pypdf2,
+    "pikepdf": merge_overlay_pikepdf,
+}
+
+
+def get_merge_backend(name: Optional[str] = None) -> Callable[[bytes, bytes], bytes]:
+    key = (name or PDF_MERGE_BACKEND).strip().lower()
+    if key not in MERGE_BACKENDS:
+        raise ValueError(f"Unknown PDF merge backend {key!r} (expected one of {sorted(MERGE_BACKENDS)})")
+    return MERGE_BACKENDS[key]
+
+
 from datetime import datetime
 import re
 
@@ -197,7 +245,10 @@ def clean_name(name: str) -> str:
 def agregar_datos_a_certificado(template_pdf: str, csv_file: str, layout: dict):
     datos = pd.read_csv(csv_file)
 
-    pdf_reader = PdfReader(template_pdf)
+    # Read the template once; every merge starts from these same bytes
+    with open(template_pdf, "rb") as f:
+        template_bytes = f.read()
+    merge = get_merge_backend()
 
     for _, row in datos.iterrows():
         # Clean the name for use in filenames
@@ -295,26 +346,13 @@ def agregar_datos_a_certificado(template_pdf: str, csv_file: str, layout: dict):
 
         # Guardar el PDF temporal
         c.save()
-        buffer.seek(0)
-        
-        # Leer el contenido del PDF temporal
-        pdf_temp = PdfReader(buffer)
-
-        # Crear un nuevo PdfWriter para el archivo individual
-        pdf_writer = PdfWriter()
-
-        # Tomar la primera página del PDF base
-        pdf_reader = PdfReader(template_pdf)
-        page = pdf_reader.pages[0]
-
-        # Superponer el contenido del PDF temporal en el PDF base
-        page.merge_page(pdf_temp.pages[0])
-        pdf_writer.add_page(page)
 
+        # Superponer el contenido del PDF temporal en la primera página del PDF base
+        merged = merge(template_bytes, buffer.getvalue())
 
         # Guardar el PDF individual
         with open(output_pdf, "wb") as f:
-            pdf_writer.write(f)
+            f.write(merged)
 
         # finalize overlay PDF
         # c.save()
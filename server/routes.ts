@@ -209,6 +209,7 @@ export async function registerRoutes(httpServer: Server, app: Express): Promise<
       if (typeof body.csvUrl === "string" || body.csvUrl === null) allowed.csvUrl = body.csvUrl;
       if (typeof body.fileName === "string") allowed.fileName = body.fileName;
       if (typeof body.totalRecords === "number") allowed.totalRecords = body.totalRecords;
+      if (typeof body.errorMessage === "string" || body.errorMessage === null) allowed.errorMessage = body.errorMessage;
   
       // Always update timestamp server-side
       allowed.updatedAt = new Date();
@@ -124,6 +124,7 @@ export const diplomaBatches = dbSchema.table("diploma_batches", {
   totalRecords: integer("total_records").notNull(),
   zipUrl: text("zip_url"),
   csvUrl: text("csv_url"),
+  errorMessage: text("error_message"),
   createdBy: varchar("created_by").references(() => users.id),
   createdAt: timestamp("created_at").defaultNow(),
   updatedAt: timestamp("updated_at").defaultNow(),